@@ -0,0 +1,338 @@
+"""
+Per-endpoint latency and payload benchmark for the SASI API
+
+Runs every case below sequentially against a running server (use a database
+loaded with benchmarks/generate_dataset.py) and reports, per case, the
+latency of the first request (cold: response caches empty after a restart)
+and p50/p99 of the following ones, plus the payload size on the wire and
+decoded. Sample ids (queries, municipality, installations) are discovered
+through the API itself.
+
+Every route of the app must be covered by a case or listed in SKIPPED;
+uncovered routes are reported, so new endpoints get benchmarked too.
+
+    python benchmarks/endpoint_bench.py --iterations 50 --output base.json
+    python benchmarks/endpoint_bench.py --iterations 50 --compare base.json
+
+With --compare, cases whose p50/p99 or payload grew more than --threshold
+are listed and the exit status is 1.
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import NamedTuple, Optional
+
+from load_test import percentile, _ms
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Default polygon selection: central Natal (~9 km x 13 km)
+DEFAULT_POLYGON = {
+    "type": "Polygon",
+    "coordinates": [[[-35.26, -5.88], [-35.18, -5.88], [-35.18, -5.76], [-35.26, -5.76], [-35.26, -5.88]]]
+}
+DEFAULT_CENTER = (-35.21, -5.81)  # lon, lat used to pick tiles
+
+COLUMNAR_ACCEPT = "application/vnd.sasi.columnar"
+
+# Routes deliberately not benchmarked
+SKIPPED = {
+    ("POST", "/api/ingest/{target}"): "bulk load, measured by the ingestion report (rows/s)",
+    ("POST", "/api/bulk/bulk-insert-heatmap"): "temporary data fixture",
+    ("POST", "/api/areas/metrics/refresh"): "maintenance operation",
+}
+
+
+class Case(NamedTuple):
+    name: str
+    method: str
+    route: str  # path template, used for coverage
+    path: str
+    params: Optional[dict] = None
+    body: Optional[object] = None
+    headers: Optional[dict] = None
+    write: bool = False
+
+
+def _tile(lon: float, lat: float, z: int) -> tuple:
+    n = 2 ** z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+def request(base_url: str, method: str, path: str, params=None, body=None, headers=None, timeout: float = 60.0) -> tuple:
+    """
+    Send one request, returning (latency_seconds, status, wire_bytes, decoded_bytes, body).
+    """
+    url = base_url + path
+    if params:
+        url += "?" + urllib.parse.urlencode(params)
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers=dict(headers or {}))
+    if data is not None:
+        req.add_header("Content-Type", "application/json")
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            payload = response.read()
+            status = response.status
+            encoding = response.headers.get("Content-Encoding")
+    except urllib.error.HTTPError as exc:
+        payload, status, encoding = exc.read(), exc.code, exc.headers.get("Content-Encoding")
+    except (urllib.error.URLError, TimeoutError, ConnectionError):
+        return time.perf_counter() - start, 0, 0, 0, b""
+    latency = time.perf_counter() - start
+
+    decoded = gzip.decompress(payload) if encoding == "gzip" else payload
+    return latency, status, len(payload), len(decoded) if encoding in (None, "gzip") else None, decoded
+
+
+def _get_json(base_url: str, path: str, params=None, timeout: float = 60.0):
+    _, status, _, _, body = request(base_url, "GET", path, params, timeout=timeout)
+    if status != 200:
+        raise RuntimeError(f"GET {path} returned {status}")
+    return json.loads(body)
+
+
+def discover(base_url: str, polygon: dict, timeout: float) -> dict:
+    """
+    Pick sample queries, municipality and installations through the API.
+    """
+    main_queries = _get_json(base_url, "/api/queries/main", timeout=timeout)
+    auxiliary = _get_json(base_url, "/api/queries/auxiliary", timeout=timeout)
+    municipalities = [m["nome"] for m in _get_json(base_url, "/api/areas/municipalities", timeout=timeout)]
+    if not main_queries or not auxiliary or not municipalities:
+        raise RuntimeError("No queries or municipalities found: load a dataset first")
+
+    query_id = main_queries[0]["id_query"]
+    ranked = _get_json(base_url, f"/api/queries/main/{query_id}/results", {"order_by": "score", "limit": 50}, timeout)
+    installation_ids = [feature["properties"]["id_instalacao"] for feature in ranked["features"]]
+    if not installation_ids:
+        raise RuntimeError(f"Main query {query_id} has no results")
+
+    heatmap = next((q for q in auxiliary if q["tipo_retorno"] == "heatmap"), None)
+    points = next((q for q in auxiliary if q["tipo_retorno"] != "heatmap"), None)
+    return {
+        "main_ids": [q["id_query"] for q in main_queries],
+        "auxiliary_id": (points or heatmap)["id_query"],
+        "heatmap_id": (heatmap or points)["id_query"],
+        "municipio": "Natal" if "Natal" in municipalities else municipalities[0],
+        "installation": installation_ids[0],
+        "installations": installation_ids,
+        "polygon": polygon,
+        "next_after": ranked["metadata"].get("next_after"),
+    }
+
+
+def build_cases(s: dict) -> list:
+    q = s["main_ids"][0]
+    aux = s["auxiliary_id"]
+    heat = s["heatmap_id"]
+    inst = s["installation"]
+    municipio_area = {"area_type": "municipio", "area_value": s["municipio"]}
+    polygon_area = {"area_type": "poligono", "area_value": json.dumps(s["polygon"])}
+    z12 = "/{}/{}/{}.pbf".format(*_tile(*DEFAULT_CENTER, 12))
+    z8 = "/{}/{}/{}.pbf".format(*_tile(*DEFAULT_CENTER, 8))
+    bounds = ",".join(str(v) for v in (-35.26, -5.88, -35.18, -5.76))
+
+    main_results = "/api/queries/main/{query_id}/results"
+    aux_results = "/api/queries/auxiliary/{query_id}/results"
+    return [
+        Case("health", "GET", "/health", "/health"),
+        Case("root", "GET", "/", "/"),
+        Case("pool health", "GET", "/health/pool", "/health/pool"),
+        Case("metrics", "GET", "/metrics", "/metrics"),
+
+        Case("main queries", "GET", "/api/queries/main", "/api/queries/main"),
+        Case("main results", "GET", main_results, f"/api/queries/main/{q}/results"),
+        Case("main results bbox", "GET", main_results, f"/api/queries/main/{q}/results", {"bounds": bounds}),
+        Case("main results clustered z7", "GET", main_results, f"/api/queries/main/{q}/results", {"zoom": 7}),
+        Case("main results fields", "GET", main_results, f"/api/queries/main/{q}/results", {"fields": "id_instalacao,score"}),
+        Case("main results stream", "GET", main_results, f"/api/queries/main/{q}/results", {"stream": "true"}),
+        Case("main results columnar", "GET", main_results, f"/api/queries/main/{q}/results", headers={"Accept": COLUMNAR_ACCEPT}),
+        Case("main results status", "GET", main_results, f"/api/queries/main/{q}/results", {"status": "verificar,sem_status"}),
+        Case("main results ranked", "GET", main_results, f"/api/queries/main/{q}/results", {"order_by": "score", "limit": 50}),
+        Case("main results ranked page 2", "GET", main_results, f"/api/queries/main/{q}/results",
+             {"order_by": "score", "limit": 50, **({"after": s["next_after"]} if s["next_after"] else {})}),
+        Case("main results overlay", "GET", "/api/queries/main/results", "/api/queries/main/results",
+             {"ids": ",".join(str(i) for i in s["main_ids"])}),
+        Case("main tile z12", "GET", "/api/queries/main/{query_id}/tiles/{z}/{x}/{y}.pbf", f"/api/queries/main/{q}/tiles{z12}"),
+        Case("main tile z8", "GET", "/api/queries/main/{query_id}/tiles/{z}/{x}/{y}.pbf", f"/api/queries/main/{q}/tiles{z8}"),
+
+        Case("auxiliary queries", "GET", "/api/queries/auxiliary", "/api/queries/auxiliary"),
+        Case("auxiliary results municipio", "GET", aux_results, f"/api/queries/auxiliary/{aux}/results", municipio_area),
+        Case("auxiliary results polygon", "GET", aux_results, f"/api/queries/auxiliary/{aux}/results", polygon_area),
+        Case("auxiliary results stream", "GET", aux_results, f"/api/queries/auxiliary/{aux}/results", {**municipio_area, "stream": "true"}),
+        Case("heatmap grid", "GET", aux_results, f"/api/queries/auxiliary/{heat}/results", {**municipio_area, "format": "grid", "zoom": 12}),
+        Case("auxiliary tile z12", "GET", "/api/queries/auxiliary/{query_id}/tiles/{z}/{x}/{y}.pbf",
+             f"/api/queries/auxiliary/{aux}/tiles{z12}", municipio_area),
+
+        Case("municipalities", "GET", "/api/areas/municipalities", "/api/areas/municipalities"),
+        Case("municipality outlines z6", "GET", "/api/areas/municipalities/geometry", "/api/areas/municipalities/geometry", {"zoom": 6}),
+        Case("municipality outlines full", "GET", "/api/areas/municipalities/geometry", "/api/areas/municipalities/geometry"),
+        Case("municipality geometry", "GET", "/api/areas/municipalities/{nome}/geometry",
+             f"/api/areas/municipalities/{urllib.parse.quote(s['municipio'])}/geometry"),
+        Case("area metrics municipio", "POST", "/api/areas/metrics", "/api/areas/metrics",
+             body={"tipo": "municipio", "valor": s["municipio"]}),
+        Case("area metrics polygon", "POST", "/api/areas/metrics", "/api/areas/metrics",
+             body={"tipo": "poligono", "valor": s["polygon"]}),
+
+        Case("installation", "GET", "/api/installations/{id_instalacao}", f"/api/installations/{inst}"),
+        Case("installation full", "GET", "/api/installations/{id_instalacao}/full", f"/api/installations/{inst}/full"),
+        Case("installations full x50", "POST", "/api/installations/full", "/api/installations/full",
+             body={"ids": s["installations"]}),
+        Case("consumption", "GET", "/api/installations/{id_instalacao}/consumption", f"/api/installations/{inst}/consumption"),
+        Case("consumption series", "GET", "/api/installations/{id_instalacao}/consumption/series",
+             f"/api/installations/{inst}/consumption/series", {"rolling": 3, "yoy": "true"}),
+        Case("consumption series x50 quarterly", "POST", "/api/installations/consumption/series",
+             "/api/installations/consumption/series", {"freq": "quarter", "yoy": "true"}, body={"ids": s["installations"]}),
+        Case("frauds", "GET", "/api/installations/{id_instalacao}/frauds", f"/api/installations/{inst}/frauds"),
+        Case("service notes", "GET", "/api/installations/{id_instalacao}/service-notes", f"/api/installations/{inst}/service-notes"),
+        Case("status", "GET", "/api/installations/{id_instalacao}/status", f"/api/installations/{inst}/status"),
+        Case("status lookup x50", "POST", "/api/installations/status/lookup", "/api/installations/status/lookup",
+             body={"ids": s["installations"]}),
+        Case("status update", "PUT", "/api/installations/{id_instalacao}/status", f"/api/installations/{inst}/status",
+             body={"status": "verificar", "usuario": "benchmark"}, write=True),
+        Case("status update x50", "PUT", "/api/installations/status", "/api/installations/status",
+             body={"ids": s["installations"], "status": "verificar", "usuario": "benchmark"}, write=True),
+    ]
+
+
+def run_case(base_url: str, case: Case, iterations: int, accept_encoding: str, timeout: float) -> dict:
+    headers = {"Accept-Encoding": accept_encoding, **(case.headers or {})}
+    latencies, statuses = [], {}
+    wire = decoded = None
+    cold = None
+
+    for iteration in range(iterations + 1):
+        latency, status, wire_bytes, decoded_bytes, _ = request(
+            base_url, case.method, case.path, case.params, case.body, headers, timeout
+        )
+        statuses[status] = statuses.get(status, 0) + 1
+        if iteration == 0:
+            cold = latency
+            continue
+        latencies.append(latency)
+        wire, decoded = wire_bytes, decoded_bytes
+
+    return {
+        "name": case.name,
+        "method": case.method,
+        "route": case.route,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "cold_ms": _ms(cold),
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "wire_bytes": wire,
+        "decoded_bytes": decoded,
+    }
+
+
+def uncovered_routes(cases: list) -> list:
+    """
+    (method, path) of app routes without a case, or None if the app cannot be imported.
+    """
+    sys.path.insert(0, SRC_DIR)
+    try:
+        from fastapi.routing import APIRoute
+        from main import app
+    except Exception as exc:
+        print(f"Route coverage not checked ({exc})", file=sys.stderr)
+        return None
+    covered = {(case.method, case.route) for case in cases} | set(SKIPPED)
+    return sorted(
+        (method, route.path)
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in route.methods
+        if (method, route.path) not in covered
+    )
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> list:
+    """
+    Cases whose p50, p99 or wire size grew more than threshold (fraction).
+    """
+    with open(baseline_path) as f:
+        baseline = {item["name"]: item for item in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"])
+        if not before:
+            continue
+        for metric in ("p50_ms", "p99_ms", "wire_bytes"):
+            old, new = before.get(metric), result.get(metric)
+            if old and new and new > old * (1 + threshold):
+                regressions.append(f"{result['name']}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-endpoint latency and payload benchmark for the SASI API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--iterations", type=int, default=30, help="Measured requests per case (after one cold request)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--accept-encoding", default="gzip", help="Accept-Encoding sent with every request ('identity' to disable)")
+    parser.add_argument("--polygon", help="GeoJSON polygon file used for polygon area cases")
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--include-writes", action="store_true", help="Also run cases that write (status updates)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from a previous --output run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Regression threshold for --compare (0.2 = +20%%)")
+    args = parser.parse_args()
+
+    polygon = DEFAULT_POLYGON
+    if args.polygon:
+        with open(args.polygon) as f:
+            polygon = json.load(f)
+
+    samples = discover(args.base_url, polygon, args.timeout)
+    cases = build_cases(samples)
+
+    missing = uncovered_routes(cases)
+    for method, path in missing or ():
+        print(f"Not benchmarked: {method} {path}", file=sys.stderr)
+
+    results = []
+    for case in cases:
+        if case.write and not args.include_writes:
+            continue
+        if args.only and args.only not in case.name:
+            continue
+        result = run_case(args.base_url, case, args.iterations, args.accept_encoding, args.timeout)
+        results.append(result)
+        print(
+            f"{case.name:<36} {case.method:<4} cold {result['cold_ms']} ms, "
+            f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+            f"{result['wire_bytes']} B ({result['decoded_bytes']} B decoded), status {result['statuses']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "base_url": args.base_url,
+                "iterations": args.iterations,
+                "accept_encoding": args.accept_encoding,
+                "samples": {k: v for k, v in samples.items() if k != "polygon"},
+                "uncovered_routes": missing,
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Synthetic Rio Grande do Norte dataset for benchmarks
+
+Creates N synthetic installations inside the real `municipios` geometries
+(load the municipality outlines first) plus matching query results, frauds,
+consumption history and service notes, with realistic skew:
+
+- installations per municipality follow a Zipf distribution (a few cities
+  hold most of them) and, inside each municipality, most points fall in an
+  urban core around the municipality's central point;
+- tariff classes are mostly Residencial;
+- main query results cover a few percent of the installations with scores
+  concentrated at the low end; auxiliary heatmap queries cover more;
+- frauds and service notes are rare with long tails (some installations
+  have many notes), and installations with frauds show a consumption drop.
+
+Everything is generated by PostgreSQL (ST_GeneratePoints, generate_series)
+from a fixed seed, so the same size and seed give the same dataset. Rows are
+identified by the id prefix (default SYN) and replaced on every run.
+
+Run from backend/:
+
+    python benchmarks/generate_dataset.py --size 100k
+    python benchmarks/generate_dataset.py --size 1m --months 36 --seed 7
+    python benchmarks/generate_dataset.py --drop
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from database import engine  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Share of each municipality's installations inside its urban core
+URBAN_SHARE = 0.75
+# Urban core radius in degrees (~3 km)
+URBAN_RADIUS = 0.03
+# Zipf exponent of installations per municipality
+ZIPF_EXPONENT = 1.1
+# Largest cities first (the rest are ordered by area)
+MAJOR_CITIES = ("Natal", "Mossoró", "Parnamirim", "São Gonçalo do Amarante", "Macaíba", "Ceará-Mirim", "Caicó", "Açu", "Currais Novos")
+
+# (classe_tarifaria, cumulative probability, median monthly kWh, has demand)
+TARIFF_CLASSES = (
+    ("Residencial", 0.80, 150, False),
+    ("Comercial", 0.92, 600, True),
+    ("Rural", 0.97, 300, False),
+    ("Industrial", 0.995, 4000, True),
+    ("Poder Público", 1.0, 1200, True),
+)
+
+# Fraction of installations in the results of each main query (queries are
+# generated when none exist)
+MAIN_QUERY_COVERAGE = (0.05, 0.02, 0.005)
+MAIN_QUERY_COLORS = ("#2563EB", "#16A34A", "#EA580C", "#DC2626")
+AUXILIARY_HEATMAP_COVERAGE = 0.20
+AUXILIARY_INSTALLATION_COVERAGE = 0.03
+FRAUD_RATE = 0.015
+SERVICE_NOTES_MEAN = 0.8
+
+
+def _zipf_counts(names: list, total: int, seed: int) -> dict:
+    """
+    Split total installations among municipalities (Zipf by rank).
+    """
+    weights = 1.0 / np.arange(1, len(names) + 1) ** ZIPF_EXPONENT
+    counts = np.random.default_rng(seed).multinomial(total, weights / weights.sum())
+    return {name: int(count) for name, count in zip(names, counts) if count}
+
+
+def _ordered_municipalities(conn) -> list:
+    rows = conn.execute(text("SELECT nome FROM municipios ORDER BY ST_Area(geom) DESC, nome")).scalars().all()
+    major = [name for name in MAJOR_CITIES if name in rows]
+    return major + [name for name in rows if name not in major]
+
+
+def drop_dataset(conn, prefix: str):
+    """
+    Remove the synthetic installations (dependent rows cascade).
+    """
+    deleted = conn.execute(
+        text("DELETE FROM instalacoes WHERE id_instalacao LIKE :pattern"),
+        {"pattern": prefix + "%"}
+    ).rowcount
+    logger.info(f"Removed {deleted} synthetic installations")
+
+
+def _ensure_queries(conn):
+    if not conn.execute(text("SELECT 1 FROM queries_principais WHERE ativa LIMIT 1")).first():
+        for index, _ in enumerate(MAIN_QUERY_COVERAGE, start=1):
+            conn.execute(
+                text("INSERT INTO queries_principais (nome, descricao, cor, ativa) VALUES (:nome, :descricao, :cor, true)"),
+                {"nome": f"Benchmark {index}", "descricao": "Query sintética (benchmarks)", "cor": MAIN_QUERY_COLORS[index - 1]}
+            )
+    if not conn.execute(text("SELECT 1 FROM queries_auxiliares WHERE ativa LIMIT 1")).first():
+        conn.execute(text(
+            "INSERT INTO queries_auxiliares (nome, descricao, tipo_retorno, ativa) "
+            "VALUES ('Benchmark heatmap', 'Query sintética (benchmarks)', 'heatmap', true)"
+        ))
+
+
+def _insert_installations(conn, prefix: str, counts: dict, seed: int):
+    tariff = " ".join(
+        f"WHEN p.u < {cumulative} THEN '{name}'" for name, cumulative, _, _ in TARIFF_CLASSES
+    )
+    offset = 0
+    for index, (nome, count) in enumerate(counts.items()):
+        urban = int(round(count * URBAN_SHARE))
+        conn.execute(text(f"""
+            WITH m AS (
+                SELECT geom, ST_Intersection(geom, ST_Buffer(ST_PointOnSurface(geom), :radius)) as core
+                FROM municipios WHERE nome = :nome
+            ),
+            pontos AS (
+                SELECT (d).path[1] as n, (d).geom as geom
+                FROM (SELECT ST_Dump(ST_GeneratePoints(core, :urban, :seed)) as d FROM m WHERE :urban > 0) u
+                UNION ALL
+                SELECT :urban + (d).path[1], (d).geom
+                FROM (SELECT ST_Dump(ST_GeneratePoints(geom, :rural, :seed + 1)) as d FROM m WHERE :rural > 0) r
+            )
+            INSERT INTO instalacoes (id_instalacao, latitude, longitude, geom, municipio, classe_tarifaria, endereco)
+            SELECT
+                :prefix || lpad((:offset + p.n)::text, 7, '0'),
+                round(ST_Y(p.geom)::numeric, 8),
+                round(ST_X(p.geom)::numeric, 8),
+                p.geom,
+                :nome,
+                CASE {tariff} END,
+                'Rua Sintética ' || (1 + p.n % 400) || ', ' || (1 + p.n % 2000)
+            FROM (SELECT n, geom, random() as u FROM pontos) p
+        """), {
+            "nome": nome,
+            "radius": URBAN_RADIUS,
+            "urban": urban,
+            "rural": count - urban,
+            "seed": seed + index * 2,
+            "prefix": prefix,
+            "offset": offset,
+        })
+        offset += count
+    return offset
+
+
+def _insert_results(conn, prefix: str):
+    pattern = {"pattern": prefix + "%"}
+    main_ids = conn.execute(text("SELECT id_query FROM queries_principais WHERE ativa ORDER BY id_query")).scalars().all()
+    for index, id_query in enumerate(main_ids):
+        coverage = MAIN_QUERY_COVERAGE[min(index, len(MAIN_QUERY_COVERAGE) - 1)]
+        # power(random(), 3): most scores are low, few installations score high
+        conn.execute(text("""
+            INSERT INTO resultado_queries_principais (id_query, id_instalacao, tipo_alvo, score)
+            SELECT :id_query, s.id_instalacao, CASE WHEN s.score >= 80 THEN 'forte' ELSE 'regular' END, s.score
+            FROM (
+                SELECT id_instalacao, round((100 * power(random(), 3))::numeric, 2) as score
+                FROM instalacoes
+                WHERE id_instalacao LIKE :pattern AND random() < :coverage
+            ) s
+            ON CONFLICT (id_query, id_instalacao) DO NOTHING
+        """), {**pattern, "id_query": id_query, "coverage": coverage})
+
+    auxiliary = conn.execute(text("SELECT id_query, tipo_retorno FROM queries_auxiliares WHERE ativa ORDER BY id_query")).all()
+    for id_query, tipo_retorno in auxiliary:
+        coverage = AUXILIARY_HEATMAP_COVERAGE if tipo_retorno == "heatmap" else AUXILIARY_INSTALLATION_COVERAGE
+        conn.execute(text("""
+            INSERT INTO resultado_queries_auxiliares (id_query, id_instalacao, intensidade)
+            SELECT :id_query, id_instalacao, round(power(random(), 2)::numeric, 4)
+            FROM instalacoes
+            WHERE id_instalacao LIKE :pattern AND random() < :coverage
+            ON CONFLICT (id_query, id_instalacao) DO NOTHING
+        """), {**pattern, "id_query": id_query, "coverage": coverage})
+
+
+def _insert_frauds(conn, prefix: str):
+    # Urban installations of the larger cities are over-represented
+    conn.execute(text("""
+        INSERT INTO fraudes (id_instalacao, data_fraude, tipo_fraude, valor_recuperado, observacoes)
+        SELECT
+            i.id_instalacao,
+            CURRENT_DATE - (random() * 1800)::int,
+            (ARRAY['Ligação Clandestina', 'Manipulação de Medidor', 'By-pass', 'Desvio de Ramal'])[1 + floor(random() * 4)::int],
+            round((500 + 20000 * power(random(), 4))::numeric, 2),
+            'Registro sintético'
+        FROM instalacoes i
+        WHERE i.id_instalacao LIKE :pattern
+          AND random() < :rate * CASE WHEN i.classe_tarifaria = 'Residencial' THEN 0.8 ELSE 2.0 END
+    """), {"pattern": prefix + "%", "rate": FRAUD_RATE})
+
+
+def _insert_consumption(conn, prefix: str, months: int):
+    medians = " ".join(f"WHEN '{name}' THEN {median}" for name, _, median, _ in TARIFF_CLASSES)
+    with_demand = ", ".join(f"'{name}'" for name, _, _, demand in TARIFF_CLASSES if demand)
+    # Log-normal level per installation, seasonal factor per month, and a 60%
+    # drop after the first fraud of the installation
+    conn.execute(text(f"""
+        INSERT INTO historico_consumo (id_instalacao, data_referencia, consumo, demanda)
+        SELECT
+            b.id_instalacao,
+            m.mes,
+            round((b.nivel * (1 + 0.15 * sin(2 * pi() * extract(month FROM m.mes) / 12)) * (0.9 + 0.2 * random())
+                   * CASE WHEN b.primeira_fraude IS NOT NULL AND m.mes >= b.primeira_fraude THEN 0.4 ELSE 1 END)::numeric, 2),
+            CASE WHEN b.classe_tarifaria IN ({with_demand}) THEN round((b.nivel / 200 * (0.8 + 0.4 * random()))::numeric, 2) END
+        FROM (
+            SELECT
+                i.id_instalacao,
+                i.classe_tarifaria,
+                (CASE i.classe_tarifaria {medians} ELSE 150 END)
+                    * exp(0.6 * sqrt(-2 * ln(1 - random())) * cos(2 * pi() * random())) as nivel,
+                (SELECT min(f.data_fraude) FROM fraudes f WHERE f.id_instalacao = i.id_instalacao) as primeira_fraude
+            FROM instalacoes i
+            WHERE i.id_instalacao LIKE :pattern
+        ) b
+        CROSS JOIN generate_series(
+            date_trunc('month', CURRENT_DATE) - make_interval(months => :months - 1),
+            date_trunc('month', CURRENT_DATE),
+            interval '1 month'
+        ) as m(mes)
+    """), {"pattern": prefix + "%", "months": months})
+
+
+def _insert_service_notes(conn, prefix: str):
+    # Exponential number of notes per installation: most have none, a few many
+    conn.execute(text("""
+        INSERT INTO notas_servico (id_instalacao, numero_nota, data_nota, tipo_servico, descricao, status)
+        SELECT
+            i.id_instalacao,
+            'NS-' || i.id_instalacao || '-' || k,
+            CURRENT_DATE - (random() * 1800)::int,
+            (ARRAY['Leitura', 'Inspeção', 'Troca de Medidor', 'Religação', 'Inspeção de Fraude'])[1 + floor(random() * 5)::int],
+            'Nota sintética',
+            (ARRAY['Concluída', 'Concluída', 'Concluída', 'Pendente'])[1 + floor(random() * 4)::int]
+        FROM (
+            SELECT id_instalacao, floor(-ln(1 - random()) * :mean)::int as notas
+            FROM instalacoes
+            WHERE id_instalacao LIKE :pattern
+        ) i
+        CROSS JOIN LATERAL generate_series(1, i.notas) as k
+    """), {"pattern": prefix + "%", "mean": SERVICE_NOTES_MEAN})
+
+
+def generate(size: int, prefix: str = "SYN", seed: int = 42, months: int = 24) -> dict:
+    """
+    Replace the synthetic dataset with `size` installations. Returns row counts.
+    """
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        conn.execute(text("SELECT setseed(:seed)"), {"seed": (seed % 1000) / 1000})
+
+        names = _ordered_municipalities(conn)
+        if not names:
+            raise RuntimeError("Table municipios is empty: load the municipality geometries first")
+
+        drop_dataset(conn, prefix)
+        _ensure_queries(conn)
+
+        steps = (
+            ("instalacoes", lambda: _insert_installations(conn, prefix, _zipf_counts(names, size, seed), seed)),
+            ("resultados", lambda: _insert_results(conn, prefix)),
+            ("fraudes", lambda: _insert_frauds(conn, prefix)),
+            ("historico_consumo", lambda: _insert_consumption(conn, prefix, months)),
+            ("notas_servico", lambda: _insert_service_notes(conn, prefix)),
+        )
+        for name, step in steps:
+            step_start = time.perf_counter()
+            step()
+            logger.info(f"{name}: {time.perf_counter() - step_start:.1f} s")
+
+        pattern = {"pattern": prefix + "%"}
+        counts = {
+            table: conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE id_instalacao LIKE :pattern"), pattern).scalar()
+            for table in ("instalacoes", "resultado_queries_principais", "resultado_queries_auxiliares",
+                          "fraudes", "historico_consumo", "notas_servico")
+        }
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("ANALYZE"))
+
+    counts["duration_s"] = round(time.perf_counter() - start, 1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic RN dataset for benchmarks")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k")
+    parser.add_argument("--installations", type=int, help="Exact number of installations (overrides --size)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--months", type=int, default=24, help="Months of consumption history per installation")
+    parser.add_argument("--prefix", default="SYN", help="id_instalacao prefix of the synthetic rows")
+    parser.add_argument("--drop", action="store_true", help="Only remove the synthetic rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.drop:
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            drop_dataset(conn, args.prefix)
+        return
+
+    counts = generate(args.installations or SIZES[args.size], args.prefix, args.seed, args.months)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print("Refresh derived data with: python src/maintenance.py refresh-metrics")
+
+
+if __name__ == "__main__":
+    main()
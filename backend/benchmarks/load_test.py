@@ -0,0 +1,140 @@
+"""
+Concurrent load benchmark for the SASI API
+
+Measures throughput and latency percentiles of one or more endpoints under
+N concurrent clients. With --slow-url, a background load is kept on a slow
+endpoint (e.g. a large polygon query) while the target endpoints are
+measured, which shows whether one slow query stalls everybody else (the
+symptom of handlers blocking the event loop).
+
+Run against a server started before and after a change, e.g.:
+
+    python benchmarks/load_test.py --base-url http://localhost:8000 \
+        --concurrency 32 --duration 20 \
+        /api/queries/main /api/queries/main/1/results \
+        --slow-url "/api/queries/auxiliary/1/results?area_type=poligono&area_value=..."
+
+Uses only the standard library.
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def fetch(url, timeout):
+    """
+    GET url, returning (latency_seconds, status, response_bytes).
+    """
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        body = b""
+        status = exc.code
+    except (urllib.error.URLError, TimeoutError, ConnectionError):
+        body = b""
+        status = 0
+    return time.perf_counter() - start, status, len(body)
+
+
+def run_load(url, concurrency, duration, timeout, stop_event=None):
+    """
+    Hammer url with `concurrency` closed-loop clients for `duration` seconds.
+    """
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    latencies, errors, total_bytes = [], 0, 0
+
+    def client():
+        nonlocal errors, total_bytes
+        while time.perf_counter() < deadline and not (stop_event and stop_event.is_set()):
+            latency, status, size = fetch(url, timeout)
+            with lock:
+                if 200 <= status < 400:
+                    latencies.append(latency)
+                    total_bytes += size
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "mean_ms": _ms(statistics.fmean(latencies)) if latencies else None,
+        "avg_bytes": round(total_bytes / len(latencies)) if latencies else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load benchmark for the SASI API")
+    parser.add_argument("paths", nargs="+", help="Endpoint paths to measure (relative to --base-url)")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per endpoint")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--slow-url", help="Path kept under background load while measuring")
+    parser.add_argument("--slow-concurrency", type=int, default=4)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+    background = None
+    if args.slow_url:
+        background = threading.Thread(
+            target=run_load,
+            args=(args.base_url + args.slow_url, args.slow_concurrency, 1e9, args.timeout, stop_event),
+            daemon=True,
+        )
+        background.start()
+        time.sleep(1.0)  # let the slow requests pile up
+
+    results = []
+    try:
+        for path in args.paths:
+            result = run_load(args.base_url + path, args.concurrency, args.duration, args.timeout)
+            results.append(result)
+            print(
+                f"{path}: {result['throughput_rps']} req/s, "
+                f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, "
+                f"{result['errors']} errors"
+            )
+    finally:
+        stop_event.set()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"slow_url": args.slow_url, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Area selection shared by query and metrics endpoints
+
+Resolves an area selection (municipality name or user-drawn GeoJSON polygon)
+into a SQL filter on instalacoes (alias i). Polygons are parsed, validated,
+repaired and optionally simplified once with Shapely, then cached by content
+hash, so repeated requests for the same drawn area skip all of that work.
+The filter always carries an explicit && envelope prefilter so the GiST
+index on instalacoes.geom is used before the exact ST_Contains test.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import NamedTuple, Union
+
+import shapely
+from shapely.geometry import shape
+
+# Simplify polygons with more vertices than this (0 disables simplification)
+AREA_SIMPLIFY_MIN_VERTICES = int(os.getenv("AREA_SIMPLIFY_MIN_VERTICES", 500))
+# Simplification tolerance in degrees (1e-5 ~ 1 m)
+AREA_SIMPLIFY_TOLERANCE = float(os.getenv("AREA_SIMPLIFY_TOLERANCE", 1e-5))
+# Prepared polygons kept in memory
+AREA_CACHE_SIZE = int(os.getenv("AREA_CACHE_SIZE", 512))
+
+POLYGONAL_TYPES = ("Polygon", "MultiPolygon")
+
+
+class AreaError(ValueError):
+    """Invalid area selection (bad type, unparsable or empty polygon)."""
+
+
+class PreparedPolygon(NamedTuple):
+    digest: str
+    wkb: bytes
+    bbox: tuple  # (xmin, ymin, xmax, ymax)
+    vertices: int
+    repaired: bool
+    simplified: bool
+
+
+class ResolvedArea(NamedTuple):
+    area_type: str
+    filter_sql: str  # condition on instalacoes i (no leading AND/WHERE)
+    geometry_sql: str  # expression evaluating to the area geometry
+    params: dict
+    cache_key: str  # stable identifier of the area (for response caches)
+
+
+def _extract_geometry(geojson: dict) -> dict:
+    if geojson.get("type") == "Feature":
+        return geojson.get("geometry") or {}
+    if geojson.get("type") == "FeatureCollection":
+        features = geojson.get("features") or []
+        if len(features) != 1:
+            raise AreaError("FeatureCollection must contain exactly one polygon")
+        return features[0].get("geometry") or {}
+    return geojson
+
+
+@lru_cache(maxsize=AREA_CACHE_SIZE)
+def _prepare_polygon(canonical: str) -> PreparedPolygon:
+    geometry = _extract_geometry(json.loads(canonical))
+    if geometry.get("type") not in POLYGONAL_TYPES:
+        raise AreaError("Area must be a Polygon or MultiPolygon")
+
+    try:
+        geom = shape(geometry)
+    except (ValueError, TypeError, AttributeError, IndexError) as exc:
+        raise AreaError(f"Invalid polygon GeoJSON: {exc}")
+
+    repaired = False
+    if not geom.is_valid:
+        # Self-intersections, duplicate rings, etc.: keep only polygonal parts
+        parts = [
+            part for part in shapely.get_parts(shapely.make_valid(geom))
+            if part.geom_type in POLYGONAL_TYPES
+        ]
+        geom = shapely.unary_union(parts) if parts else shapely.Polygon()
+        repaired = True
+
+    if geom.is_empty or geom.area == 0:
+        raise AreaError("Polygon is empty")
+
+    xmin, ymin, xmax, ymax = geom.bounds
+    if xmin < -180 or xmax > 180 or ymin < -90 or ymax > 90:
+        raise AreaError("Polygon coordinates must be longitude/latitude (EPSG:4326)")
+
+    simplified = False
+    vertices = shapely.get_num_coordinates(geom)
+    if AREA_SIMPLIFY_MIN_VERTICES and vertices > AREA_SIMPLIFY_MIN_VERTICES and AREA_SIMPLIFY_TOLERANCE > 0:
+        candidate = geom.simplify(AREA_SIMPLIFY_TOLERANCE, preserve_topology=True)
+        if candidate.is_valid and not candidate.is_empty:
+            geom = candidate
+            vertices = shapely.get_num_coordinates(geom)
+            simplified = True
+
+    return PreparedPolygon(
+        digest=hashlib.sha1(canonical.encode("utf-8")).hexdigest(),
+        wkb=shapely.to_wkb(geom),
+        bbox=geom.bounds,
+        vertices=vertices,
+        repaired=repaired,
+        simplified=simplified
+    )
+
+
+def prepare_polygon(value: Union[str, dict]) -> PreparedPolygon:
+    """
+    Validate, repair and simplify a GeoJSON polygon (cached by content).
+    """
+    try:
+        geojson = json.loads(value) if isinstance(value, str) else value
+    except ValueError:
+        raise AreaError("Invalid polygon GeoJSON")
+    if not isinstance(geojson, dict):
+        raise AreaError("Invalid polygon GeoJSON")
+    canonical = json.dumps(geojson, sort_keys=True, separators=(",", ":"))
+    return _prepare_polygon(canonical)
+
+
+def resolve_area(area_type: str, area_value: Union[str, dict]) -> ResolvedArea:
+    """
+    Turn an area selection into a SQL filter on instalacoes i.
+    """
+    if area_type == "municipio":
+        if not isinstance(area_value, str) or not area_value:
+            raise AreaError("Invalid municipality name")
+        return ResolvedArea(
+            area_type=area_type,
+            filter_sql="i.municipio = :area_municipio",
+            geometry_sql="(SELECT geom FROM municipios WHERE nome = :area_municipio)",
+            params={"area_municipio": area_value},
+            cache_key=f"municipio:{area_value}"
+        )
+
+    if area_type == "poligono":
+        polygon = prepare_polygon(area_value)
+        xmin, ymin, xmax, ymax = polygon.bbox
+        return ResolvedArea(
+            area_type=area_type,
+            filter_sql=(
+                "i.geom && ST_MakeEnvelope(:area_xmin, :area_ymin, :area_xmax, :area_ymax, 4326) "
+                "AND ST_Contains(ST_GeomFromWKB(:area_wkb, 4326), i.geom)"
+            ),
+            geometry_sql="ST_GeomFromWKB(:area_wkb, 4326)",
+            params={
+                "area_wkb": polygon.wkb,
+                "area_xmin": xmin,
+                "area_ymin": ymin,
+                "area_xmax": xmax,
+                "area_ymax": ymax
+            },
+            cache_key=f"poligono:{polygon.digest}"
+        )
+
+    raise AreaError("Invalid area_type")
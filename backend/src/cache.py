@@ -0,0 +1,236 @@
+"""
+Response cache for query results
+
+Entries are keyed by (query_id, result version, variant) where the variant
+describes the request shape (bounds, zoom, tile, format). The result version
+is bumped by a trigger whenever the results of a query are rewritten, so
+stale entries simply stop being addressed and age out of the LRU.
+
+The default backend is an in-process LRU. Set CACHE_URL=redis://... to share
+entries between workers (requires the optional `redis` package). Backends
+are awaited (the Redis one does network I/O on the event loop) and entries
+are stored in Redis as data only: a JSON header followed by the raw body,
+never pickled objects.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional, Union
+
+from fastapi import Request
+
+try:
+    import redis
+    import redis.asyncio
+except ImportError:  # optional shared backend
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    etag: str
+    last_modified: Optional[datetime] = None
+
+
+class LRUCacheBackend:
+    """
+    Thread-safe in-process LRU bounded by entry count and total body size.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    async def set(self, key: str, value: CachedResponse):
+        size = len(value.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[key] = value
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    async def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+# Redis entry: uint32 header length, JSON header, body bytes
+_ENTRY_HEADER = struct.Struct("<I")
+
+
+def encode_entry(value: CachedResponse) -> bytes:
+    header = json.dumps({
+        "media_type": value.media_type,
+        "etag": value.etag,
+        "last_modified": value.last_modified.isoformat() if value.last_modified else None,
+    }).encode("utf-8")
+    return _ENTRY_HEADER.pack(len(header)) + header + value.body
+
+
+def decode_entry(data: bytes) -> CachedResponse:
+    """
+    Inverse of encode_entry. Raises ValueError on malformed data.
+    """
+    if len(data) < _ENTRY_HEADER.size:
+        raise ValueError("truncated cache entry")
+    (length,) = _ENTRY_HEADER.unpack_from(data)
+    start = _ENTRY_HEADER.size
+    if start + length > len(data):
+        raise ValueError("truncated cache entry")
+    header = json.loads(data[start:start + length])
+    if not isinstance(header, dict) or not isinstance(header.get("media_type"), str) or not isinstance(header.get("etag"), str):
+        raise ValueError("invalid cache entry header")
+    last_modified = header.get("last_modified")
+    return CachedResponse(
+        body=data[start + length:],
+        media_type=header["media_type"],
+        etag=header["etag"],
+        last_modified=datetime.fromisoformat(last_modified) if last_modified else None
+    )
+
+
+class RedisCacheBackend:
+    """
+    Shared backend storing entries in Redis with a TTL (async client).
+    """
+
+    def __init__(self, url: str, ttl: int = 24 * 3600, prefix: str = "sasi:cache:"):
+        if redis is None:
+            raise RuntimeError("CACHE_URL requires the 'redis' package")
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            data = await self.client.get(self.prefix + key)
+        except redis.RedisError as exc:
+            logger.warning(f"Cache backend unavailable: {exc}")
+            return None
+        if not data:
+            return None
+        try:
+            return decode_entry(data)
+        except ValueError as exc:  # includes JSON errors
+            logger.warning(f"Ignoring malformed cache entry {key}: {exc}")
+            return None
+
+    async def set(self, key: str, value: CachedResponse):
+        try:
+            await self.client.set(self.prefix + key, encode_entry(value), ex=self.ttl)
+        except redis.RedisError as exc:
+            logger.warning(f"Cache backend unavailable: {exc}")
+
+    async def clear(self):
+        async for key in self.client.scan_iter(self.prefix + "*"):
+            await self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Versioned response cache with HTTP validator helpers.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def make_key(query_id: Union[int, str], version: int, variant: str) -> str:
+        digest = hashlib.sha1(variant.encode("utf-8")).hexdigest()[:16]
+        return f"{query_id}:{version}:{digest}"
+
+    @staticmethod
+    def make_etag(key: str) -> str:
+        return weak_etag(key.replace(":", "-"))
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: CachedResponse):
+        await self.backend.set(key, value)
+
+    async def clear(self):
+        await self.backend.clear()
+
+
+def weak_etag(value: str) -> str:
+    """
+    Weak validator: the same cached entry is served as identity, gzip, br or
+    zstd bytes, which are equivalent but not byte-identical representations.
+    """
+    return f'W/"{value}"'
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluate If-None-Match (weak comparison) / If-Modified-Since
+    (If-None-Match takes precedence).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag.removeprefix("W/") in candidates or "*" in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime], cache_control: str = "no-cache") -> dict:
+    """
+    ETag / Last-Modified headers. By default clients must revalidate before reuse.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _create_backend():
+    url = os.getenv("CACHE_URL")
+    if url:
+        return RedisCacheBackend(url, ttl=int(os.getenv("CACHE_TTL", 24 * 3600)))
+    return LRUCacheBackend(
+        max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 256)),
+        max_bytes=int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    )
+
+
+result_cache = ResponseCache(_create_backend())
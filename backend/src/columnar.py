@@ -0,0 +1,142 @@
+"""
+Columnar binary encodings for main query results
+
+Instead of one GeoJSON feature per installation (repeating keys and query
+metadata on every row), results are sent as parallel arrays that the map
+can hand to the GPU without parsing. Two encodings, chosen by Accept:
+
+application/vnd.sasi.columnar (always available), little-endian, every
+section starts on a 4-byte boundary so it can be viewed with typed arrays:
+
+    offset  type                 content
+    0       4 bytes              magic "SASC"
+    4       uint8                layout version (1)
+    5       3 bytes              padding
+    8       uint32               N (number of rows)
+    12      uint32               M (metadata JSON length in bytes)
+    16      uint32               L (id_instalacao UTF-8 bytes length)
+    20      M bytes (+pad)       metadata JSON (query info, tipo_alvo enum)
+    ...     float32[N]           lon
+    ...     float32[N]           lat
+    ...     float32[N]           score (NaN = no score)
+    ...     uint8[N] (+pad)      tipo_alvo code (index into metadata.tipo_alvo_enum, 255 = unknown)
+    ...     uint32[N + 1]        id_instalacao offsets into the string bytes
+    ...     L bytes              id_instalacao UTF-8 bytes
+
+application/vnd.apache.arrow.stream: Arrow IPC stream with the same columns
+(tipo_alvo dictionary encoded, metadata in the schema). Requires the
+optional `pyarrow` package.
+"""
+import json
+import struct
+from typing import Optional
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.sasi.columnar"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+COLUMNAR_MAGIC = b"SASC"
+COLUMNAR_VERSION = 1
+TIPO_ALVO_ENUM = ("regular", "forte")
+TIPO_ALVO_UNKNOWN = 255
+
+_HEADER = struct.Struct("<4sB3xIII")
+
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """
+    Binary media type requested by an Accept header, or None for JSON.
+    """
+    if not accept:
+        return None
+    for item in accept.split(","):
+        media_type = item.split(";")[0].strip().lower()
+        if media_type in (COLUMNAR_MEDIA_TYPE, ARROW_MEDIA_TYPE):
+            return media_type
+    return None
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def _columns(rows) -> tuple:
+    n = len(rows)
+    lon = np.fromiter((row.lon for row in rows), dtype="<f4", count=n)
+    lat = np.fromiter((row.lat for row in rows), dtype="<f4", count=n)
+    score = np.fromiter((np.nan if row.score is None else row.score for row in rows), dtype="<f4", count=n)
+    codes = {tipo: index for index, tipo in enumerate(TIPO_ALVO_ENUM)}
+    tipo_alvo = np.fromiter((codes.get(row.tipo_alvo, TIPO_ALVO_UNKNOWN) for row in rows), dtype=np.uint8, count=n)
+    ids = [row.id_instalacao for row in rows]
+    return lon, lat, score, tipo_alvo, ids
+
+
+def encode_columnar(rows, metadata: dict) -> bytes:
+    """
+    Encode (id_instalacao, lon, lat, score, tipo_alvo) rows in the
+    typed-array layout described in the module docstring.
+    """
+    lon, lat, score, tipo_alvo, ids = _columns(rows)
+
+    encoded_ids = [value.encode("utf-8") for value in ids]
+    offsets = np.zeros(len(encoded_ids) + 1, dtype="<u4")
+    np.cumsum([len(value) for value in encoded_ids], out=offsets[1:])
+    id_bytes = b"".join(encoded_ids)
+
+    meta = json.dumps({**metadata, "tipo_alvo_enum": list(TIPO_ALVO_ENUM)}).encode("utf-8")
+
+    return b"".join((
+        _HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(lon), len(meta), len(id_bytes)),
+        _pad(meta),
+        lon.tobytes(),
+        lat.tobytes(),
+        score.tobytes(),
+        _pad(tipo_alvo.tobytes()),
+        offsets.tobytes(),
+        id_bytes,
+    ))
+
+
+def encode_arrow(rows, metadata: dict) -> bytes:
+    """
+    Encode the same columns as an Arrow IPC stream.
+    """
+    if pa is None:
+        raise RuntimeError("Arrow output requires the 'pyarrow' package")
+
+    lon, lat, score, tipo_alvo, ids = _columns(rows)
+    unknown = tipo_alvo == TIPO_ALVO_UNKNOWN
+    table = pa.table(
+        {
+            "id_instalacao": pa.array(ids, type=pa.string()),
+            "lon": pa.array(lon),
+            "lat": pa.array(lat),
+            "score": pa.array(score, mask=np.isnan(score)),
+            "tipo_alvo": pa.DictionaryArray.from_arrays(
+                pa.array(np.where(unknown, 0, tipo_alvo).astype(np.int8), mask=unknown),
+                pa.array(TIPO_ALVO_ENUM)
+            ),
+        },
+        metadata={"metadata": json.dumps(metadata)}
+    )
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {
+    COLUMNAR_MEDIA_TYPE: encode_columnar,
+    ARROW_MEDIA_TYPE: encode_arrow,
+}
+
+
+def arrow_available() -> bool:
+    return pa is not None
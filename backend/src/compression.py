@@ -0,0 +1,272 @@
+"""
+HTTP response compression
+
+CompressionMiddleware negotiates zstd, brotli or gzip from Accept-Encoding
+and compresses responses above COMPRESSION_MIN_SIZE on the fly (streamed
+responses chunk by chunk). zstd and brotli require the optional `zstandard`
+and `brotli` packages; gzip is always available.
+
+Cacheable responses (query results, municipality geometries) should go
+through precompressed_response: each encoding is produced once, at a higher
+level than on-the-fly compression, and stored next to the identity entry
+under "<key>|<encoding>", so repeated requests send the stored bytes as-is.
+Those high levels cost seconds of CPU on multi-MB bodies, so the first
+compression runs in a worker thread instead of on the event loop.
+Responses that already carry Content-Encoding are left untouched by the
+middleware.
+"""
+import asyncio
+import gzip
+import os
+import zlib
+from typing import Callable, NamedTuple, Optional
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from cache import CachedResponse
+
+try:
+    import brotli
+except ImportError:  # br encoding is optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd encoding is optional
+    zstandard = None
+
+# Smaller bodies are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+# Encodings offered, in server preference order (unavailable ones are skipped)
+COMPRESSION_ENCODINGS = [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/geo+json",
+    "application/x-ndjson",
+    "application/vnd.mapbox-vector-tile",
+    "application/vnd.sasi.columnar",
+    "application/vnd.apache.arrow.stream",
+    "text/",
+)
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes, bool], bytes]  # (body, precompressed) -> bytes
+    stream: Callable[[], object]  # -> object with compress(chunk) / flush() / finish()
+
+
+class _ZlibStream:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# On-the-fly levels favour speed; stored (precompressed) entries favour size
+CODECS = {
+    "gzip": Codec(
+        compress=lambda body, stored: gzip.compress(body, compresslevel=9 if stored else 6),
+        stream=_ZlibStream
+    ),
+}
+if brotli is not None:
+    CODECS["br"] = Codec(
+        compress=lambda body, stored: brotli.compress(body, quality=11 if stored else 4),
+        stream=_BrotliStream
+    )
+if zstandard is not None:
+    CODECS["zstd"] = Codec(
+        compress=lambda body, stored: zstandard.ZstdCompressor(level=19 if stored else 3).compress(body),
+        stream=_ZstdStream
+    )
+
+AVAILABLE_ENCODINGS = [encoding for encoding in COMPRESSION_ENCODINGS if encoding in CODECS]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Best available encoding allowed by an Accept-Encoding header (highest
+    q-value, ties broken by server preference), or None for identity.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best = None
+    for encoding in AVAILABLE_ENCODINGS:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    return bool(media_type) and media_type.split(";")[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(headers: MutableHeaders, field: str = "Accept-Encoding"):
+    """
+    Add field to the Vary header, keeping the fields already listed.
+    """
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = field
+    elif field.lower() not in (item.strip().lower() for item in vary.split(",")):
+        headers["Vary"] = f"{vary}, {field}"
+
+
+async def precompressed_response(request: Request, cache, key: str, cached: CachedResponse, headers: dict) -> Response:
+    """
+    Response for a cached entry in the encoding negotiated with the client.
+    The compressed body is computed on first use and stored in the same
+    cache under "<key>|<encoding>".
+    """
+    response = Response(content=cached.body, media_type=cached.media_type, headers=headers)
+    if not is_compressible(cached.media_type):
+        return response
+    add_vary(response.headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is None or len(cached.body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    encoded_key = f"{key}|{encoding}"
+    encoded = await cache.get(encoded_key)
+    if encoded is None:
+        body = await asyncio.to_thread(CODECS[encoding].compress, cached.body, True)
+        encoded = cached._replace(body=body)
+        await cache.set(encoded_key, encoded)
+
+    response.body = encoded.body
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(encoded.body))
+    return response
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the negotiated encoding.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.active = None  # decided on the first body message
+        self.stream = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    async def send_with_compression(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.active is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            compressible = (
+                "content-encoding" not in headers
+                and self.start_message["status"] not in (204, 304)
+                and is_compressible(headers.get("content-type"))
+            )
+            if compressible:
+                add_vary(headers)
+            self.active = compressible and (more_body or len(body) >= self.minimum_size)
+
+            if self.active:
+                headers["Content-Encoding"] = self.encoding
+                if more_body:
+                    del headers["Content-Length"]
+                    self.stream = CODECS[self.encoding].stream()
+                else:
+                    body = CODECS[self.encoding].compress(body, False)
+                    headers["Content-Length"] = str(len(body))
+            await self.send(self.start_message)
+            if not self.stream:
+                await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+        if not self.stream:
+            await self.send(message)
+            return
+
+        # Flush every chunk so streamed results keep rendering progressively
+        if more_body:
+            chunk = self.stream.compress(body) + self.stream.flush()
+        else:
+            chunk = self.stream.compress(body) + self.stream.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
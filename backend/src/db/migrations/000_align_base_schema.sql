@@ -0,0 +1,99 @@
+-- ============================================
+-- SASI - Align the schema_v2.sql tables with models.py
+-- schema_v2.sql still creates the history tables with their old column
+-- names (mes_referencia, consumo_kwh, data_ocorrencia, ...), while the API
+-- and every later migration use the names in models.py. Renames are
+-- conditional, so databases created from schema.sql or by the ORM are left
+-- as they are.
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION renomear_coluna_legada(tabela TEXT, antiga TEXT, nova TEXT)
+RETURNS VOID AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = tabela AND column_name = antiga
+    ) AND NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = tabela AND column_name = nova
+    ) THEN
+        EXECUTE format('ALTER TABLE %I RENAME COLUMN %I TO %I', tabela, antiga, nova);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Views over the old names are recreated below
+DROP VIEW IF EXISTS v_status_atual_instalacao;
+DROP VIEW IF EXISTS v_instalacoes_com_fraudes;
+
+-- historico_consumo
+SELECT renomear_coluna_legada('historico_consumo', 'mes_referencia', 'data_referencia');
+SELECT renomear_coluna_legada('historico_consumo', 'consumo_kwh', 'consumo');
+ALTER TABLE historico_consumo ADD COLUMN IF NOT EXISTS demanda DECIMAL(10, 2);
+
+-- fraudes
+SELECT renomear_coluna_legada('fraudes', 'data_ocorrencia', 'data_fraude');
+SELECT renomear_coluna_legada('fraudes', 'valor_estimado', 'valor_recuperado');
+SELECT renomear_coluna_legada('fraudes', 'descricao', 'observacoes');
+
+-- status_instalacao: column name and the masculine status values used by the API
+SELECT renomear_coluna_legada('status_instalacao', 'data_alteracao', 'data_atualizacao');
+ALTER TABLE status_instalacao DROP CONSTRAINT IF EXISTS status_instalacao_status_check;
+ALTER TABLE status_instalacao DROP CONSTRAINT IF EXISTS check_status;
+UPDATE status_instalacao SET status = 'selecionado' WHERE status = 'selecionada';
+UPDATE status_instalacao SET status = 'nao_selecionado' WHERE status = 'nao_selecionada';
+ALTER TABLE status_instalacao ADD CONSTRAINT check_status
+    CHECK (status IN ('selecionado', 'nao_selecionado', 'verificar'));
+
+-- notas_servico
+SELECT renomear_coluna_legada('notas_servico', 'data_servico', 'data_nota');
+ALTER TABLE notas_servico ADD COLUMN IF NOT EXISTS numero_nota VARCHAR(50);
+UPDATE notas_servico SET numero_nota = 'NS-' || id WHERE numero_nota IS NULL;
+ALTER TABLE notas_servico ALTER COLUMN numero_nota SET NOT NULL;
+ALTER TABLE notas_servico ADD COLUMN IF NOT EXISTS status VARCHAR(50);
+
+DROP FUNCTION renomear_coluna_legada(TEXT, TEXT, TEXT);
+
+-- id_instalacao is VARCHAR(50) in models.py (and in the ingestion staging table).
+-- Widening a varchar does not rewrite the table.
+DO $$
+DECLARE
+    coluna RECORD;
+BEGIN
+    FOR coluna IN
+        SELECT c.table_name
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = current_schema()
+          AND t.table_type = 'BASE TABLE'
+          AND c.column_name = 'id_instalacao'
+          AND c.data_type = 'character varying'
+          AND c.character_maximum_length < 50
+    LOOP
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN id_instalacao TYPE VARCHAR(50)', coluna.table_name);
+    END LOOP;
+END;
+$$;
+
+CREATE VIEW v_status_atual_instalacao AS
+SELECT DISTINCT ON (id_instalacao)
+    id_instalacao,
+    status,
+    usuario,
+    observacoes,
+    data_atualizacao
+FROM status_instalacao
+ORDER BY id_instalacao, data_atualizacao DESC, id DESC;
+
+CREATE VIEW v_instalacoes_com_fraudes AS
+SELECT
+    i.id_instalacao,
+    i.municipio,
+    i.classe_tarifaria,
+    COUNT(f.id) as total_fraudes,
+    SUM(f.valor_recuperado) as valor_total_fraudes
+FROM instalacoes i
+LEFT JOIN fraudes f ON i.id_instalacao = f.id_instalacao
+GROUP BY i.id_instalacao, i.municipio, i.classe_tarifaria;
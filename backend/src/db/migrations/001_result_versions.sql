@@ -0,0 +1,76 @@
+-- ============================================
+-- SASI - Result version stamps for main queries
+-- Used by the API response cache (ETag / Last-Modified)
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- ============================================
+
+-- Table: versao_resultados_principais (one version per main query)
+CREATE TABLE IF NOT EXISTS versao_resultados_principais (
+    id_query INTEGER PRIMARY KEY REFERENCES queries_principais(id_query) ON DELETE CASCADE,
+    versao INTEGER NOT NULL DEFAULT 1,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc')
+);
+
+-- Seed versions for results loaded before the trigger existed
+INSERT INTO versao_resultados_principais (id_query, versao, atualizado_em)
+SELECT id_query, 1, NOW() AT TIME ZONE 'utc'
+FROM resultado_queries_principais
+GROUP BY id_query
+ON CONFLICT (id_query) DO NOTHING;
+
+-- Bump the version of every query touched by a statement (one row per query,
+-- not per result row, thanks to transition tables)
+CREATE OR REPLACE FUNCTION bump_versao_resultados_principais()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE versao_resultados_principais
+        SET versao = versao + 1, atualizado_em = NOW() AT TIME ZONE 'utc';
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO versao_resultados_principais (id_query, versao, atualizado_em)
+        SELECT DISTINCT id_query, 1, NOW() AT TIME ZONE 'utc' FROM antigos
+        ON CONFLICT (id_query) DO UPDATE
+        SET versao = versao_resultados_principais.versao + 1,
+            atualizado_em = EXCLUDED.atualizado_em;
+    ELSE
+        INSERT INTO versao_resultados_principais (id_query, versao, atualizado_em)
+        SELECT DISTINCT id_query, 1, NOW() AT TIME ZONE 'utc' FROM novos
+        ON CONFLICT (id_query) DO UPDATE
+        SET versao = versao_resultados_principais.versao + 1,
+            atualizado_em = EXCLUDED.atualizado_em;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_insert ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_insert
+AFTER INSERT ON resultado_queries_principais
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_update ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_update
+AFTER UPDATE ON resultado_queries_principais
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_delete ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_delete
+AFTER DELETE ON resultado_queries_principais
+REFERENCING OLD TABLE AS antigos
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_truncate ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_truncate
+AFTER TRUNCATE ON resultado_queries_principais
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+COMMENT ON TABLE versao_resultados_principais IS 'Result version per main query, bumped on every reload (API cache invalidation)';
@@ -0,0 +1,53 @@
+-- ============================================
+-- SASI - Precomputed per-municipality area metrics
+-- Served by POST /api/areas/metrics for tipo = 'municipio'
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- Refresh after data loads:
+--   python maintenance.py refresh-metrics
+--   (or POST /api/areas/metrics/refresh)
+-- ============================================
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_metricas_municipio AS
+WITH instalacoes_municipio AS (
+    SELECT municipio, COUNT(*) as total
+    FROM instalacoes
+    GROUP BY municipio
+),
+fraudes_municipio AS (
+    -- Rolling 5-year window, evaluated at refresh time
+    SELECT i.municipio, COUNT(DISTINCT f.id_instalacao) as total
+    FROM fraudes f
+    JOIN instalacoes i ON f.id_instalacao = i.id_instalacao
+    WHERE f.data_fraude >= CURRENT_DATE - 5 * 365
+    GROUP BY i.municipio
+),
+tarifas_municipio AS (
+    SELECT
+        municipio,
+        json_agg(json_build_object('classe_tarifaria', classe_tarifaria, 'count', count) ORDER BY count DESC) as distribuicao
+    FROM (
+        SELECT
+            municipio,
+            COALESCE(classe_tarifaria, 'Não Classificado') as classe_tarifaria,
+            COUNT(*) as count
+        FROM instalacoes
+        GROUP BY municipio, classe_tarifaria
+    ) t
+    GROUP BY municipio
+)
+SELECT
+    m.nome,
+    ST_Perimeter(m.geom::geography) / 1000 as perimetro_km,
+    COALESCE(im.total, 0) as total_instalacoes,
+    COALESCE(fm.total, 0) as total_fraudes,
+    COALESCE(tm.distribuicao, '[]'::json) as distribuicao_tarifa,
+    NOW() AT TIME ZONE 'utc' as atualizado_em
+FROM municipios m
+LEFT JOIN instalacoes_municipio im ON im.municipio = m.nome
+LEFT JOIN fraudes_municipio fm ON fm.municipio = m.nome
+LEFT JOIN tarifas_municipio tm ON tm.municipio = m.nome;
+
+-- Unique index: constant-time lookup and REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_metricas_municipio_nome ON mv_metricas_municipio (nome);
+
+COMMENT ON MATERIALIZED VIEW mv_metricas_municipio IS 'Per-municipality area metrics, refreshed after data loads';
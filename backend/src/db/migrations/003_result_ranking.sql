@@ -0,0 +1,14 @@
+-- ============================================
+-- SASI - Score ranking index for inspection queues
+-- Backs GET /api/queries/main/{id}/results?order_by=score&limit=&after=
+-- (keyset pagination: each page is one index range scan)
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- migration: no-transaction
+-- ============================================
+
+-- Same direction on both sort keys so "(score, id_instalacao) < (:score, :id)"
+-- continues the scan exactly where the previous page stopped
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resultado_qp_ranking
+    ON resultado_queries_principais (id_query, score DESC NULLS LAST, id_instalacao DESC);
+
+ANALYZE resultado_queries_principais;
@@ -0,0 +1,87 @@
+-- ============================================
+-- SASI - Current status per installation
+-- Projection of status_instalacao kept up to date by triggers.
+-- Used by GET/PUT /api/installations/.../status and by the status filter
+-- of the query result endpoints.
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- ============================================
+
+-- Table: status_atual_instalacao (latest status_instalacao row per installation)
+CREATE TABLE IF NOT EXISTS status_atual_instalacao (
+    id_instalacao VARCHAR(50) PRIMARY KEY REFERENCES instalacoes(id_instalacao) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL,
+    usuario VARCHAR(100) NOT NULL,
+    observacoes TEXT,
+    data_atualizacao TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_status_atual_status ON status_atual_instalacao (status);
+
+-- Seed from the existing history
+INSERT INTO status_atual_instalacao (id_instalacao, status, usuario, observacoes, data_atualizacao)
+SELECT DISTINCT ON (id_instalacao)
+    id_instalacao, status, usuario, observacoes, data_atualizacao
+FROM status_instalacao
+ORDER BY id_instalacao, data_atualizacao DESC, id DESC
+ON CONFLICT (id_instalacao) DO NOTHING;
+
+-- New history rows: one upsert per statement (bulk updates insert hundreds
+-- of rows at once); an older row never overwrites a newer status
+CREATE OR REPLACE FUNCTION atualizar_status_atual_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO status_atual_instalacao (id_instalacao, status, usuario, observacoes, data_atualizacao)
+    SELECT DISTINCT ON (id_instalacao)
+        id_instalacao, status, usuario, observacoes, data_atualizacao
+    FROM novos
+    ORDER BY id_instalacao, data_atualizacao DESC, id DESC
+    ON CONFLICT (id_instalacao) DO UPDATE
+    SET status = EXCLUDED.status,
+        usuario = EXCLUDED.usuario,
+        observacoes = EXCLUDED.observacoes,
+        data_atualizacao = EXCLUDED.data_atualizacao
+    WHERE EXCLUDED.data_atualizacao >= status_atual_instalacao.data_atualizacao;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- History edited or deleted: recompute the affected installations
+CREATE OR REPLACE FUNCTION atualizar_status_atual_recalcular()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM status_atual_instalacao
+    WHERE id_instalacao IN (SELECT id_instalacao FROM antigos);
+
+    INSERT INTO status_atual_instalacao (id_instalacao, status, usuario, observacoes, data_atualizacao)
+    SELECT DISTINCT ON (s.id_instalacao)
+        s.id_instalacao, s.status, s.usuario, s.observacoes, s.data_atualizacao
+    FROM status_instalacao s
+    WHERE s.id_instalacao IN (SELECT id_instalacao FROM antigos)
+    ORDER BY s.id_instalacao, s.data_atualizacao DESC, s.id DESC
+    ON CONFLICT (id_instalacao) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_status_atual_insert ON status_instalacao;
+CREATE TRIGGER trg_status_atual_insert
+AFTER INSERT ON status_instalacao
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION atualizar_status_atual_insert();
+
+DROP TRIGGER IF EXISTS trg_status_atual_update ON status_instalacao;
+CREATE TRIGGER trg_status_atual_update
+AFTER UPDATE ON status_instalacao
+REFERENCING OLD TABLE AS antigos
+FOR EACH STATEMENT
+EXECUTE FUNCTION atualizar_status_atual_recalcular();
+
+DROP TRIGGER IF EXISTS trg_status_atual_delete ON status_instalacao;
+CREATE TRIGGER trg_status_atual_delete
+AFTER DELETE ON status_instalacao
+REFERENCING OLD TABLE AS antigos
+FOR EACH STATEMENT
+EXECUTE FUNCTION atualizar_status_atual_recalcular();
+
+COMMENT ON TABLE status_atual_instalacao IS 'Current status per installation (latest status_instalacao row, kept by triggers)';
@@ -0,0 +1,20 @@
+-- ============================================
+-- SASI - Consumption history index for time series
+-- Backs GET /api/installations/{id}/consumption/series and
+-- POST /api/installations/consumption/series (multi-year charts for a batch
+-- of installations): one index range scan per installation, and INCLUDE lets
+-- the resampling query run as an index-only scan.
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- migration: no-transaction
+-- ============================================
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_historico_instalacao_data_cov
+    ON historico_consumo (id_instalacao, data_referencia) INCLUDE (consumo, demanda);
+
+-- The plain (id_instalacao, data_referencia) and (id_instalacao) indexes are
+-- prefixes of the covering one
+DROP INDEX CONCURRENTLY IF EXISTS idx_historico_instalacao_data;
+DROP INDEX CONCURRENTLY IF EXISTS idx_historico_instalacao;
+
+-- Keeps the visibility map current so index-only scans skip the heap
+VACUUM (ANALYZE) historico_consumo;
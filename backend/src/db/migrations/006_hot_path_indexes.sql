@@ -0,0 +1,59 @@
+-- ============================================
+-- SASI - Indexes for the hot query predicates
+-- Each index below backs a predicate the API runs on every request; indexes
+-- they make redundant (plain prefixes, boolean ativa) are dropped.
+-- index_advisor.REQUIRED_INDEXES lists them for `python maintenance.py check-indexes`.
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- migration: no-transaction
+-- ============================================
+
+-- Main results: r.id_query = :query_id joined to instalacoes by id_instalacao,
+-- reading tipo_alvo/score from the index only
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resultado_qp_query_cov
+    ON resultado_queries_principais (id_query, id_instalacao) INCLUDE (tipo_alvo, score);
+DROP INDEX CONCURRENTLY IF EXISTS idx_resultado_qp_query;
+
+-- Auxiliary results: r.id_query = :query_id, intensidade from the index
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resultado_qa_query_cov
+    ON resultado_queries_auxiliares (id_query, id_instalacao) INCLUDE (intensidade);
+DROP INDEX CONCURRENTLY IF EXISTS idx_resultado_qa_query;
+
+-- Query lists: WHERE ativa (a boolean index is never selective enough)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_queries_principais_ativas
+    ON queries_principais (id_query) WHERE ativa;
+DROP INDEX CONCURRENTLY IF EXISTS idx_queries_principais_ativa;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_queries_auxiliares_ativas
+    ON queries_auxiliares (id_query) WHERE ativa;
+DROP INDEX CONCURRENTLY IF EXISTS idx_queries_auxiliares_ativa;
+
+-- Area filter i.municipio = :area_municipio (area metrics read classe_tarifaria)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_instalacoes_municipio_cov
+    ON instalacoes (municipio) INCLUDE (classe_tarifaria);
+DROP INDEX CONCURRENTLY IF EXISTS idx_instalacoes_municipio;
+
+-- Popup LATERAL subqueries: newest rows of one installation
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fraudes_instalacao_data
+    ON fraudes (id_instalacao, data_fraude DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_fraudes_instalacao;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notas_instalacao_data
+    ON notas_servico (id_instalacao, data_nota DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_notas_instalacao;
+
+-- status_atual_instalacao triggers recompute the latest row per installation
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_status_instalacao_data
+    ON status_instalacao (id_instalacao, data_atualizacao DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_status_instalacao;
+
+-- Spatial filters (bbox &&, ST_Contains, tiles) on installations and outlines
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_instalacoes_geom ON instalacoes USING GIST (geom);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_municipios_geom ON municipios USING GIST (geom);
+
+-- The physical (spatial) order of instalacoes is maintained outside
+-- migrations, in a maintenance window: python maintenance.py reorder-installations
+
+ANALYZE instalacoes;
+ANALYZE resultado_queries_principais;
+ANALYZE resultado_queries_auxiliares;
+ANALYZE fraudes;
+ANALYZE notas_servico;
+ANALYZE status_instalacao;
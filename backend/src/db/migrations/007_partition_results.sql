@@ -0,0 +1,115 @@
+-- ============================================
+-- SASI - Result tables list-partitioned by id_query
+-- One partition per query (<tabela>_q<id_query>) plus a default partition
+-- (<tabela>_padrao) for queries loaded by plain INSERTs. Reads of one query
+-- touch one partition, and a "replace" ingestion swaps the partition
+-- (layout.replace_partitions) instead of deleting and reinserting rows.
+-- Move default-partition rows into their own partitions with:
+--   python maintenance.py partition-results
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- Rewrites both tables under an ACCESS EXCLUSIVE lock: run in a maintenance window.
+-- ============================================
+
+-- Rebuild one result table as a partitioned table with the same columns,
+-- defaults and CHECK constraints, one partition per id_query present
+CREATE OR REPLACE FUNCTION particionar_resultados(tabela TEXT, tabela_queries TEXT)
+RETURNS VOID AS $$
+DECLARE
+    antiga TEXT := tabela || '_antiga';
+    indice REGCLASS;
+    restricao TEXT;
+    consulta INTEGER;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = tabela::regclass) THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tabela, antiga);
+
+    -- Free the index / constraint names for the new table (the old one is dropped below)
+    FOR restricao IN
+        SELECT conname FROM pg_constraint WHERE conrelid = antiga::regclass AND contype IN ('p', 'u', 'f')
+    LOOP
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', antiga, restricao);
+    END LOOP;
+    FOR indice IN SELECT indexrelid::regclass FROM pg_index WHERE indrelid = antiga::regclass LOOP
+        EXECUTE format('DROP INDEX %s', indice);
+    END LOOP;
+
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY LIST (id_query)',
+        tabela, antiga
+    );
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', tabela || '_padrao', tabela);
+    FOR consulta IN EXECUTE format('SELECT DISTINCT id_query FROM %I ORDER BY 1', antiga) LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES IN (%s)', tabela || '_q' || consulta, tabela, consulta);
+    END LOOP;
+
+    -- Load before creating keys and indexes (one sort per index instead of row-by-row maintenance)
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I ORDER BY id_query, id_instalacao', tabela, antiga);
+    EXECUTE format('DROP TABLE %I', antiga);
+
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id_query, id_instalacao)', tabela);
+    EXECUTE format(
+        'ALTER TABLE %I ADD FOREIGN KEY (id_query) REFERENCES %I (id_query) ON DELETE CASCADE',
+        tabela, tabela_queries
+    );
+    EXECUTE format(
+        'ALTER TABLE %I ADD FOREIGN KEY (id_instalacao) REFERENCES instalacoes (id_instalacao) ON DELETE CASCADE',
+        tabela
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+SET LOCAL maintenance_work_mem = '512MB';
+
+SELECT particionar_resultados('resultado_queries_principais', 'queries_principais');
+SELECT particionar_resultados('resultado_queries_auxiliares', 'queries_auxiliares');
+
+DROP FUNCTION particionar_resultados(TEXT, TEXT);
+
+-- Indexes on the partitioned parents (created on every current and future partition)
+CREATE INDEX IF NOT EXISTS idx_resultado_qp_query_cov
+    ON resultado_queries_principais (id_query, id_instalacao) INCLUDE (tipo_alvo, score);
+CREATE INDEX IF NOT EXISTS idx_resultado_qp_ranking
+    ON resultado_queries_principais (id_query, score DESC NULLS LAST, id_instalacao DESC);
+CREATE INDEX IF NOT EXISTS idx_resultado_qp_instalacao
+    ON resultado_queries_principais (id_instalacao);
+CREATE INDEX IF NOT EXISTS idx_resultado_qa_query_cov
+    ON resultado_queries_auxiliares (id_query, id_instalacao) INCLUDE (intensidade);
+CREATE INDEX IF NOT EXISTS idx_resultado_qa_instalacao
+    ON resultado_queries_auxiliares (id_instalacao);
+
+-- Result version triggers (001_result_versions) were dropped with the old table.
+-- Statement-level triggers on the parent see the rows of every partition;
+-- partition swaps (DETACH / ATTACH) fire no triggers and bump the version
+-- explicitly.
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_insert ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_insert
+AFTER INSERT ON resultado_queries_principais
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_update ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_update
+AFTER UPDATE ON resultado_queries_principais
+REFERENCING NEW TABLE AS novos
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_delete ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_delete
+AFTER DELETE ON resultado_queries_principais
+REFERENCING OLD TABLE AS antigos
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+DROP TRIGGER IF EXISTS trg_resultado_qp_versao_truncate ON resultado_queries_principais;
+CREATE TRIGGER trg_resultado_qp_versao_truncate
+AFTER TRUNCATE ON resultado_queries_principais
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_versao_resultados_principais();
+
+ANALYZE resultado_queries_principais;
+ANALYZE resultado_queries_auxiliares;
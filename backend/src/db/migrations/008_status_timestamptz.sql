@@ -0,0 +1,34 @@
+-- ============================================
+-- SASI - Status timestamps on the database clock
+-- status_instalacao.data_atualizacao was filled by three clocks: the ORM
+-- (datetime.utcnow on the API host) for single updates, NOW() AT TIME ZONE
+-- 'utc' for bulk updates and CURRENT_TIMESTAMP (session time zone) for
+-- direct inserts. The columns become TIMESTAMPTZ with DEFAULT NOW() and every
+-- write path leaves the value to the default, so the current status is
+-- picked by one clock. Existing values were written in UTC.
+-- Applied by: python maintenance.py migrate (after schema_v2.sql)
+-- Rewrites status_instalacao and status_atual_instalacao.
+-- ============================================
+
+-- The view reads the column being converted
+DROP VIEW IF EXISTS v_status_atual_instalacao;
+
+ALTER TABLE status_instalacao
+    ALTER COLUMN data_atualizacao TYPE TIMESTAMPTZ USING data_atualizacao AT TIME ZONE 'UTC',
+    ALTER COLUMN data_atualizacao SET DEFAULT NOW();
+
+ALTER TABLE status_atual_instalacao
+    ALTER COLUMN data_atualizacao TYPE TIMESTAMPTZ USING data_atualizacao AT TIME ZONE 'UTC';
+
+CREATE VIEW v_status_atual_instalacao AS
+SELECT DISTINCT ON (id_instalacao)
+    id_instalacao,
+    status,
+    usuario,
+    observacoes,
+    data_atualizacao
+FROM status_instalacao
+ORDER BY id_instalacao, data_atualizacao DESC, id DESC;
+
+ANALYZE status_instalacao;
+ANALYZE status_atual_instalacao;
@@ -0,0 +1,84 @@
+"""
+Weighted density rasters for heatmap queries
+
+PostGIS aggregates point weights into grid cells; this module turns those
+cell sums into a smoothed density raster (Gaussian kernel) and encodes it
+compactly, so transfer size and client work depend on the grid size rather
+than on the number of points.
+"""
+import base64
+import math
+
+import numpy as np
+
+
+def _gaussian_matrix(size: int, sigma: float) -> np.ndarray:
+    """
+    size x size matrix applying a 1D Gaussian blur along one axis.
+    """
+    index = np.arange(size)
+    distance = index[:, None] - index[None, :]
+    return np.exp(-0.5 * (distance / sigma) ** 2)
+
+
+def density_raster(cols, rows, weights, width: int, height: int, sigma: float) -> np.ndarray:
+    """
+    Accumulate weights into a height x width raster and blur it with a
+    separable Gaussian kernel (sigma in cells). Row 0 is the southern edge.
+    """
+    raster = np.zeros((height, width), dtype=np.float64)
+    np.add.at(raster, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), np.asarray(weights, dtype=np.float64))
+    if sigma > 0:
+        raster = _gaussian_matrix(height, sigma) @ raster @ _gaussian_matrix(width, sigma)
+    return raster
+
+
+def build_density_grid(cells, xmin: float, ymin: float, cell_size: float, sigma: float) -> dict:
+    """
+    Build the density grid payload from (col, row, weight) cell sums.
+
+    The grid is padded by 3 sigma on every side so the kernel is not
+    clipped, flipped north-up and quantized to uint8 (0 = no density,
+    255 = max_value), then base64 encoded row by row.
+    """
+    if not cells:
+        return {
+            "type": "DensityGrid",
+            "bbox": None,
+            "width": 0,
+            "height": 0,
+            "cell_size": cell_size,
+            "encoding": "uint8-base64",
+            "max_value": 0.0,
+            "data": ""
+        }
+
+    cols, rows, weights = zip(*cells)
+    pad = int(math.ceil(3 * sigma))
+    width = max(cols) + 1 + 2 * pad
+    height = max(rows) + 1 + 2 * pad
+
+    raster = density_raster(
+        [c + pad for c in cols],
+        [r + pad for r in rows],
+        weights,
+        width,
+        height,
+        sigma
+    )
+    max_value = float(raster.max())
+    scaled = raster / max_value * 255 if max_value > 0 else raster
+    data = np.flipud(np.rint(scaled)).astype(np.uint8)
+
+    origin_x = xmin - pad * cell_size
+    origin_y = ymin - pad * cell_size
+    return {
+        "type": "DensityGrid",
+        "bbox": [origin_x, origin_y, origin_x + width * cell_size, origin_y + height * cell_size],
+        "width": width,
+        "height": height,
+        "cell_size": cell_size,
+        "encoding": "uint8-base64",
+        "max_value": max_value,
+        "data": base64.b64encode(data.tobytes()).decode("ascii")
+    }
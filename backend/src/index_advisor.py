@@ -0,0 +1,149 @@
+"""
+Index advisor
+
+Compares the live database with the indexes the API depends on
+(REQUIRED_INDEXES, created by schema_v2.sql and db/migrations) and reads
+pg_stat_user_indexes / pg_stat_user_tables to report indexes that are
+missing, invalid (a failed CREATE INDEX CONCURRENTLY), never scanned, and
+tables read mostly by sequential scans.
+
+Run with: python maintenance.py check-indexes
+A short version runs at API startup (DB_STARTUP_CHECK).
+"""
+import logging
+import os
+
+from sqlalchemy import text
+
+from database import engine
+from migrations import pending_migrations
+
+logger = logging.getLogger(__name__)
+
+# Tables with fewer rows than this are not reported as seq-scan heavy
+SEQ_SCAN_MIN_ROWS = int(os.getenv("INDEX_ADVISOR_SEQ_SCAN_MIN_ROWS", 10000))
+
+# (table, index, predicate it backs)
+REQUIRED_INDEXES = (
+    ("instalacoes", "idx_instalacoes_geom", "bbox / tile / ST_Contains filters"),
+    ("instalacoes", "idx_instalacoes_municipio_cov", "area filter i.municipio = :area_municipio"),
+    ("municipios", "idx_municipios_geom", "municipality outline lookups"),
+    ("queries_principais", "idx_queries_principais_ativas", "active main query list (WHERE ativa)"),
+    ("queries_auxiliares", "idx_queries_auxiliares_ativas", "active auxiliary query list (WHERE ativa)"),
+    ("resultado_queries_principais", "idx_resultado_qp_query_cov", "r.id_query = :query_id join to instalacoes"),
+    ("resultado_queries_principais", "idx_resultado_qp_ranking", "score-ordered ranking per query"),
+    ("resultado_queries_principais", "idx_resultado_qp_instalacao", "popup lookups by installation"),
+    ("resultado_queries_auxiliares", "idx_resultado_qa_query_cov", "aux r.id_query = :query_id join to instalacoes"),
+    ("historico_consumo", "idx_historico_instalacao_data_cov", "consumption history / series by installation"),
+    ("fraudes", "idx_fraudes_instalacao_data", "latest frauds per installation"),
+    ("notas_servico", "idx_notas_instalacao_data", "latest service notes per installation"),
+    ("status_instalacao", "idx_status_instalacao_data", "current status recomputation"),
+    ("status_atual_instalacao", "idx_status_atual_status", "status filter"),
+)
+
+EXISTING_INDEXES_SQL = """
+    SELECT c.relname AS index_name, t.relname AS table_name, x.indisvalid
+    FROM pg_index x
+    JOIN pg_class c ON c.oid = x.indexrelid
+    JOIN pg_class t ON t.oid = x.indrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+"""
+
+UNUSED_INDEXES_SQL = """
+    SELECT
+        s.relname AS table_name,
+        s.indexrelname AS index_name,
+        pg_relation_size(s.indexrelid) AS size_bytes
+    FROM pg_stat_user_indexes s
+    JOIN pg_index x ON x.indexrelid = s.indexrelid
+    WHERE s.schemaname = current_schema()
+      AND s.idx_scan = 0
+      AND NOT x.indisunique
+      AND NOT x.indisprimary
+      AND NOT x.indisclustered  -- kept as the CLUSTER sort order
+    ORDER BY pg_relation_size(s.indexrelid) DESC
+"""
+
+SEQ_SCAN_TABLES_SQL = """
+    SELECT relname AS table_name, seq_scan, seq_tup_read, COALESCE(idx_scan, 0) AS idx_scan, n_live_tup
+    FROM pg_stat_user_tables
+    WHERE schemaname = current_schema()
+      AND n_live_tup >= :min_rows
+      AND seq_scan > COALESCE(idx_scan, 0)
+    ORDER BY seq_tup_read DESC
+"""
+
+STATS_RESET_SQL = "SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()"
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def check_indexes(conn, include_usage: bool = True) -> dict:
+    """
+    Index report: missing, invalid, unused and seq-scan-heavy tables.
+    """
+    existing = {row.index_name: row for row in conn.execute(text(EXISTING_INDEXES_SQL))}
+    report = {
+        "missing": [
+            {"table": table, "index": index, "used_by": used_by}
+            for table, index, used_by in REQUIRED_INDEXES
+            if index not in existing
+        ],
+        "invalid": [
+            {"table": row.table_name, "index": row.index_name}
+            for row in sorted(existing.values(), key=lambda row: row.index_name)
+            if not row.indisvalid
+        ],
+    }
+    if include_usage:
+        report["stats_reset"] = conn.execute(text(STATS_RESET_SQL)).scalar()
+        report["unused"] = [
+            {"table": row.table_name, "index": row.index_name, "size_bytes": row.size_bytes}
+            for row in conn.execute(text(UNUSED_INDEXES_SQL))
+        ]
+        report["seq_scan_tables"] = [
+            dict(row._mapping)
+            for row in conn.execute(text(SEQ_SCAN_TABLES_SQL), {"min_rows": SEQ_SCAN_MIN_ROWS})
+        ]
+    return report
+
+
+def log_report(report: dict):
+    for item in report["missing"]:
+        logger.warning(f"Missing index {item['index']} on {item['table']} ({item['used_by']})")
+    for item in report["invalid"]:
+        logger.warning(f"Invalid index {item['index']} on {item['table']} (failed concurrent build; drop it and re-run migrate)")
+    if "unused" in report:
+        since = report["stats_reset"] or "statistics reset"
+        for item in report["unused"]:
+            logger.info(f"Unused index {item['index']} on {item['table']} ({_format_size(item['size_bytes'])}, no scans since {since})")
+        for item in report["seq_scan_tables"]:
+            logger.info(
+                f"Table {item['table_name']} ({item['n_live_tup']} rows) mostly read by sequential scans: "
+                f"{item['seq_scan']} seq / {item['idx_scan']} index scans, {item['seq_tup_read']} rows read"
+            )
+    if not report["missing"] and not report["invalid"]:
+        logger.info("All required indexes are present and valid")
+
+
+def startup_check():
+    """
+    Log pending migrations and missing/invalid indexes. Never raises: the
+    API must start even when the database is unreachable or behind.
+    """
+    try:
+        pending = pending_migrations()
+        if pending:
+            names = ", ".join(f"{m.version}_{m.name}" for m in pending)
+            logger.warning(f"Pending database migrations: {names} (run python maintenance.py migrate)")
+        with engine.connect() as conn:
+            report = check_indexes(conn, include_usage=False)
+        log_report(report)
+    except Exception as exc:
+        logger.warning(f"Database startup check skipped: {exc}")
@@ -0,0 +1,373 @@
+"""
+Bulk ingestion of query results via COPY
+
+Streams CSV, NDJSON or Parquet rows into resultado_queries_principais or
+resultado_queries_auxiliares:
+
+1. rows are validated in Python and rejected rows are counted (with samples);
+2. valid rows are streamed in batches with COPY into a temporary staging table;
+3. in the same transaction, the results of every id_query with at least one
+   valid row are replaced (mode "replace") or merged (mode "upsert"). On partitioned
+   result tables a replace builds a new partition per id_query and swaps it
+   in (layout.replace_partitions). Readers keep seeing the previous results
+   until the transaction commits.
+
+Run with: python ingestion.py principal resultados.csv [--format csv] [--mode replace]
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import time
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import NamedTuple, Callable, Iterator, Optional
+
+from sqlalchemy import text
+
+from database import engine
+from layout import is_partitioned, replace_partitions
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet input is optional
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Valid rows buffered before each COPY round trip
+COPY_BATCH_SIZE = int(os.getenv("COPY_BATCH_SIZE", 50000))
+# Rejected rows reported individually
+MAX_REJECTED_SAMPLES = 20
+
+FORMATS = ("csv", "ndjson", "parquet")
+MODES = ("replace", "upsert")
+TIPOS_ALVO = ("regular", "forte")
+
+
+def _required_str(record: dict, field: str, max_length: int = 50) -> str:
+    value = record.get(field)
+    value = str(value).strip() if value is not None else ""
+    if not value or len(value) > max_length or "\x00" in value:
+        raise ValueError(f"invalid {field}")
+    return value
+
+
+def _required_int(record: dict, field: str) -> int:
+    try:
+        return int(str(record[field]).strip())
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"invalid {field}")
+
+
+def _optional_decimal(record: dict, field: str, limit: Decimal, scale: Decimal) -> Optional[Decimal]:
+    """
+    Decimal rounded to the column scale (as PostgreSQL does on COPY), with
+    the range checked after rounding: 999.995 rounds to 1000.00 and would
+    overflow a NUMERIC(5, 2).
+    """
+    value = record.get(field)
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid {field}")
+    # Checked before quantize too: huge values exceed the decimal precision
+    if not number.is_finite() or abs(number) >= limit:
+        raise ValueError(f"{field} out of range")
+    number = number.quantize(scale, rounding=ROUND_HALF_UP)
+    if abs(number) >= limit:
+        raise ValueError(f"{field} out of range")
+    return number
+
+
+def _parse_principal(record: dict) -> tuple:
+    tipo_alvo = str(record.get("tipo_alvo") or "").strip().lower()
+    if tipo_alvo not in TIPOS_ALVO:
+        raise ValueError("invalid tipo_alvo")
+    return (
+        _required_int(record, "id_query"),
+        _required_str(record, "id_instalacao"),
+        tipo_alvo,
+        _optional_decimal(record, "score", Decimal("1000"), Decimal("0.01")),  # NUMERIC(5, 2)
+    )
+
+
+def _parse_auxiliar(record: dict) -> tuple:
+    field = "intensidade" if "intensidade" in record else "score"
+    return (
+        _required_int(record, "id_query"),
+        _required_str(record, "id_instalacao"),
+        _optional_decimal(record, field, Decimal("10"), Decimal("0.0001")),  # NUMERIC(5, 4)
+    )
+
+
+class IngestTarget(NamedTuple):
+    table: str
+    query_table: str
+    columns: tuple
+    staging_types: tuple
+    parse: Callable[[dict], tuple]
+
+
+TARGETS = {
+    "principal": IngestTarget(
+        table="resultado_queries_principais",
+        query_table="queries_principais",
+        columns=("id_query", "id_instalacao", "tipo_alvo", "score"),
+        staging_types=("INTEGER", "VARCHAR(50)", "VARCHAR(20)", "NUMERIC(5, 2)"),
+        parse=_parse_principal,
+    ),
+    "auxiliar": IngestTarget(
+        table="resultado_queries_auxiliares",
+        query_table="queries_auxiliares",
+        columns=("id_query", "id_instalacao", "intensidade"),
+        staging_types=("INTEGER", "VARCHAR(50)", "NUMERIC(5, 4)"),
+        parse=_parse_auxiliar,
+    ),
+}
+
+
+# ============================================
+# Readers: yield (line_number, record dict | error)
+# ============================================
+
+# Text readers keep undecodable bytes as lone surrogates, so a bad byte
+# rejects its own row instead of aborting the whole file
+def _text(stream, newline: Optional[str] = None):
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", errors="surrogateescape", newline=newline)
+
+
+def _is_utf8(value) -> bool:
+    if not isinstance(value, str):
+        return True
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _read_csv(stream) -> Iterator[tuple]:
+    reader = csv.DictReader(_text(stream, newline=""))
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            # DictReader.line_num is only updated after a successful row
+            yield reader.reader.line_num, ValueError(f"invalid CSV: {exc}")
+            continue
+        if all(_is_utf8(value) for value in record.values()):
+            yield reader.line_num, record
+        else:
+            yield reader.line_num, ValueError("invalid UTF-8")
+
+
+def _read_ndjson(stream) -> Iterator[tuple]:
+    for line_number, line in enumerate(_text(stream), start=1):
+        if not line.strip():
+            continue
+        if not _is_utf8(line):
+            yield line_number, ValueError("invalid UTF-8")
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, ValueError("invalid JSON")
+            continue
+        yield line_number, record if isinstance(record, dict) else ValueError("not a JSON object")
+
+
+def _read_parquet(stream) -> Iterator[tuple]:
+    if pq is None:
+        raise RuntimeError("Parquet input requires the 'pyarrow' package")
+    line_number = 0
+    for batch in pq.ParquetFile(stream).iter_batches(batch_size=COPY_BATCH_SIZE):
+        for record in batch.to_pylist():
+            line_number += 1
+            yield line_number, record
+
+
+READERS = {
+    "csv": _read_csv,
+    "ndjson": _read_ndjson,
+    "parquet": _read_parquet,
+}
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """
+    Guess the input format from a file name.
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if name.endswith(".parquet"):
+        return "parquet"
+    return None
+
+
+# ============================================
+# Loader
+# ============================================
+
+def _copy_batch(cursor, target: IngestTarget, buffer: io.StringIO):
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY stg_resultados (linha, {', '.join(target.columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def ingest(stream, target_name: str, fmt: str, mode: str = "replace", batch_size: int = COPY_BATCH_SIZE) -> dict:
+    """
+    Load a results file into the target table. Returns the ingestion report.
+    The whole load runs in one transaction (atomic per file and per id_query).
+    """
+    target = TARGETS[target_name]
+    read = READERS[fmt]
+    columns = ", ".join(target.columns)
+    start = time.perf_counter()
+
+    rows_read = 0
+    rejected = 0
+    samples = []
+
+    with engine.begin() as conn:
+        # Large loads legitimately exceed the API statement timeout
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        staging_columns = ", ".join(f"{c} {t}" for c, t in zip(target.columns, target.staging_types))
+        conn.execute(text(f"CREATE TEMP TABLE stg_resultados (linha BIGINT, {staging_columns}) ON COMMIT DROP"))
+
+        cursor = conn.connection.cursor()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        pending = 0
+
+        for line_number, record in read(stream):
+            rows_read += 1
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                values = target.parse(record)
+            except ValueError as exc:
+                rejected += 1
+                if len(samples) < MAX_REJECTED_SAMPLES:
+                    samples.append({"linha": line_number, "motivo": str(exc)})
+                continue
+
+            writer.writerow((line_number, *values))
+            pending += 1
+            if pending >= batch_size:
+                _copy_batch(cursor, target, buffer)
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+
+        if pending:
+            _copy_batch(cursor, target, buffer)
+
+        # Rows referencing unknown queries or installations are rejected
+        refs = conn.execute(text(f"""
+            SELECT
+                COUNT(*) AS staged,
+                COUNT(*) FILTER (WHERE q.id_query IS NULL) AS unknown_query,
+                COUNT(*) FILTER (WHERE q.id_query IS NOT NULL AND i.id_instalacao IS NULL) AS unknown_installation
+            FROM stg_resultados s
+            LEFT JOIN {target.query_table} q ON q.id_query = s.id_query
+            LEFT JOIN instalacoes i ON i.id_instalacao = s.id_instalacao
+        """)).fetchone()
+
+        # Last occurrence wins for duplicated (id_query, id_instalacao)
+        valid_rows = f"""
+            SELECT DISTINCT ON (s.id_query, s.id_instalacao) {', '.join('s.' + c for c in target.columns)}
+            FROM stg_resultados s
+            JOIN {target.query_table} q ON q.id_query = s.id_query
+            JOIN instalacoes i ON i.id_instalacao = s.id_instalacao
+            ORDER BY s.id_query, s.id_instalacao, s.linha DESC
+        """
+
+        # Only queries with at least one valid row are replaced: a file whose
+        # rows for a query were all rejected leaves its results untouched
+        staged_queries = conn.execute(text(f"""
+            SELECT s.id_query, bool_or(i.id_instalacao IS NOT NULL) AS has_valid_rows
+            FROM stg_resultados s
+            JOIN {target.query_table} q ON q.id_query = s.id_query
+            LEFT JOIN instalacoes i ON i.id_instalacao = s.id_instalacao
+            GROUP BY s.id_query
+            ORDER BY s.id_query
+        """)).fetchall()
+        query_ids = [row.id_query for row in staged_queries if row.has_valid_rows]
+        skipped_ids = [row.id_query for row in staged_queries if not row.has_valid_rows]
+
+        if mode == "replace" and is_partitioned(conn, target.table):
+            # Deduplicate once, then one partition swap per id_query
+            conn.execute(text(f"CREATE TEMP TABLE stg_validos ON COMMIT DROP AS {valid_rows}"))
+            loaded = replace_partitions(
+                conn, target.table, query_ids,
+                f"SELECT {columns} FROM stg_validos WHERE id_query = :query_id",
+                columns=target.columns
+            )
+        elif mode == "replace":
+            conn.execute(
+                text(f"DELETE FROM {target.table} WHERE id_query = ANY(:query_ids)"),
+                {"query_ids": query_ids}
+            )
+            loaded = conn.execute(text(f"INSERT INTO {target.table} ({columns}) {valid_rows}")).rowcount
+        else:
+            updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in target.columns[2:])
+            loaded = conn.execute(text(f"""
+                INSERT INTO {target.table} ({columns}) {valid_rows}
+                ON CONFLICT (id_query, id_instalacao) DO UPDATE SET {updates}
+            """)).rowcount
+
+    duration = time.perf_counter() - start
+    duplicates = refs.staged - refs.unknown_query - refs.unknown_installation - loaded
+
+    return {
+        "target": target.table,
+        "format": fmt,
+        "mode": mode,
+        "queries": query_ids,
+        "queries_without_valid_rows": skipped_ids,
+        "rows_read": rows_read,
+        "rows_loaded": loaded,
+        "rows_rejected": rejected + refs.unknown_query + refs.unknown_installation,
+        "rejected_invalid": rejected,
+        "rejected_unknown_query": refs.unknown_query,
+        "rejected_unknown_installation": refs.unknown_installation,
+        "duplicates_merged": duplicates,
+        "rejected_samples": samples,
+        "duration_s": round(duration, 3),
+        "rows_per_sec": round(rows_read / duration, 1) if duration else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load query results via COPY")
+    parser.add_argument("target", choices=sorted(TARGETS))
+    parser.add_argument("path", help="Input file (.csv, .ndjson/.jsonl, .parquet)")
+    parser.add_argument("--format", choices=FORMATS, help="Input format (default: from file extension)")
+    parser.add_argument("--mode", choices=MODES, default="replace",
+                        help="replace: swap all results of each id_query in the file; upsert: merge")
+    parser.add_argument("--batch-size", type=int, default=COPY_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("cannot infer format from file name, use --format")
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.path, "rb") as stream:
+        report = ingest(stream, args.target, fmt, args.mode, args.batch_size)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
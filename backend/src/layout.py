@@ -0,0 +1,222 @@
+"""
+Physical layout of the large tables
+
+Result tables are list-partitioned by id_query (db/migrations/
+007_partition_results.sql): <tabela>_q<id_query> per query plus the default
+partition <tabela>_padrao. replace_partitions() loads new results into a
+standalone table (with its indexes, keys and statistics already built) and
+swaps it in with DETACH / ATTACH, so the parent lock is only held for the
+catalog changes. Partition swaps fire no DML triggers: the result version of
+main queries is bumped explicitly so cached responses are invalidated.
+
+instalacoes is reordered along a geohash (Z-order) curve over geom so that
+installations close on the map sit on the same heap pages, and bbox /
+polygon queries read contiguous pages.
+
+Run with: python maintenance.py partition-results | reorder-installations
+"""
+import logging
+import re
+import time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# Geohash characters used as sort key (12 ~ 4 cm cells)
+GEOHASH_PRECISION = 12
+GEOHASH_INDEX = "idx_instalacoes_geohash"
+
+
+class PartitionedTable(NamedTuple):
+    table: str
+    query_table: str
+    version_table: Optional[str]
+
+
+PARTITIONED_TABLES = {
+    "resultado_queries_principais": PartitionedTable(
+        table="resultado_queries_principais",
+        query_table="queries_principais",
+        version_table="versao_resultados_principais",
+    ),
+    "resultado_queries_auxiliares": PartitionedTable(
+        table="resultado_queries_auxiliares",
+        query_table="queries_auxiliares",
+        version_table=None,
+    ),
+}
+
+BUMP_VERSIONS_SQL = """
+    INSERT INTO {version_table} (id_query, versao, atualizado_em)
+    SELECT id_query, 1, NOW() AT TIME ZONE 'utc' FROM unnest(CAST(:query_ids AS INTEGER[])) AS id_query
+    ON CONFLICT (id_query) DO UPDATE
+    SET versao = {version_table}.versao + 1,
+        atualizado_em = EXCLUDED.atualizado_em
+"""
+
+
+def partition_name(table: str, query_id: int) -> str:
+    return f"{table}_q{int(query_id)}"
+
+
+def default_partition(table: str) -> str:
+    return f"{table}_padrao"
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": table}
+    ).scalar()
+
+
+def query_partitions(conn, table: str) -> dict:
+    """
+    id_query -> partition name of the per-query partitions of table.
+    """
+    pattern = re.compile(rf"^{re.escape(table)}_q(\d+)$")
+    names = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits h
+        JOIN pg_class c ON c.oid = h.inhrelid
+        WHERE h.inhparent = CAST(:table AS regclass)
+    """), {"table": table}).scalars()
+    partitions = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions[int(match.group(1))] = name
+    return partitions
+
+
+# ============================================
+# Partition swap
+# ============================================
+
+def _build_partition(conn, spec: PartitionedTable, query_id: int, rows_sql: str, columns: Optional[tuple]) -> tuple:
+    """
+    Create and fill the standalone table that will become the partition of
+    query_id. Keys, indexes and the partition CHECK are in place before the
+    swap, so ATTACH neither builds indexes nor scans the rows.
+    """
+    name = f"{partition_name(spec.table, query_id)}_novo"
+    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {spec.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)"))
+    column_list = f" ({', '.join(columns)})" if columns else ""
+    rows = conn.execute(text(f"INSERT INTO {name}{column_list} {rows_sql}"), {"query_id": query_id}).rowcount
+    conn.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT particao_id_query CHECK (id_query = {int(query_id)})"))
+    conn.execute(text(f"""
+        ALTER TABLE {name}
+            ADD FOREIGN KEY (id_query) REFERENCES {spec.query_table} (id_query) ON DELETE CASCADE,
+            ADD FOREIGN KEY (id_instalacao) REFERENCES instalacoes (id_instalacao) ON DELETE CASCADE
+    """))
+    conn.execute(text(f"ANALYZE {name}"))
+    return name, rows
+
+
+def bump_result_versions(conn, table: str, query_ids: list):
+    spec = PARTITIONED_TABLES[table]
+    if spec.version_table and query_ids:
+        conn.execute(text(BUMP_VERSIONS_SQL.format(version_table=spec.version_table)), {"query_ids": list(query_ids)})
+
+
+def replace_partitions(conn, table: str, query_ids: list, rows_sql: str, columns: Optional[tuple] = None, bump_versions: bool = True) -> int:
+    """
+    Replace the rows of each id_query with rows_sql (run with :query_id) by
+    swapping in a new partition. Must run inside a transaction; readers keep
+    the old rows until it commits. Returns the number of rows loaded.
+    """
+    spec = PARTITIONED_TABLES[table]
+    built = [(query_id, *_build_partition(conn, spec, query_id, rows_sql, columns)) for query_id in query_ids]
+
+    # From here on the parent is locked (DETACH takes ACCESS EXCLUSIVE) until
+    # commit: only catalog changes remain. lock_timeout is left in place so a
+    # swap blocked by a long read fails instead of queueing every reader.
+    existing = query_partitions(conn, table)
+    for query_id, name, _ in built:
+        partition = partition_name(table, query_id)
+        if query_id in existing:
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {existing[query_id]}"))
+            conn.execute(text(f"DROP TABLE {existing[query_id]}"))
+        else:
+            # Rows loaded by plain INSERTs live in the default partition
+            conn.execute(
+                text(f"DELETE FROM {default_partition(table)} WHERE id_query = :query_id"),
+                {"query_id": query_id}
+            )
+        conn.execute(text(f"ALTER TABLE {name} RENAME TO {partition}"))
+        conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN ({int(query_id)})"))
+        conn.execute(text(f"ALTER TABLE {partition} DROP CONSTRAINT particao_id_query"))
+
+    if bump_versions:
+        bump_result_versions(conn, table, query_ids)
+    return sum(rows for _, _, rows in built)
+
+
+def split_default_partition(table: str) -> dict:
+    """
+    Move the rows of every id_query found in the default partition into a
+    partition of its own and drop the partitions of deleted queries. One
+    transaction per query; the content does not change, so result versions
+    are left alone.
+    """
+    spec = PARTITIONED_TABLES[table]
+    default = default_partition(table)
+    with engine.connect() as conn:
+        if not is_partitioned(conn, table):
+            raise RuntimeError(f"{table} is not partitioned (run python maintenance.py migrate)")
+        query_ids = conn.execute(text(f"SELECT DISTINCT id_query FROM {default} ORDER BY id_query")).scalars().all()
+
+    moved = 0
+    for query_id in query_ids:
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            moved += replace_partitions(
+                conn, table, [query_id],
+                f"SELECT * FROM {default} WHERE id_query = :query_id",
+                bump_versions=False
+            )
+
+    dropped = []
+    with engine.begin() as conn:
+        query_table_ids = set(conn.execute(text(f"SELECT id_query FROM {spec.query_table}")).scalars())
+        for query_id, partition in sorted(query_partitions(conn, table).items()):
+            if query_id not in query_table_ids:
+                conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                conn.execute(text(f"DROP TABLE {partition}"))
+                dropped.append(partition)
+
+    return {"table": table, "partitions_created": len(query_ids), "rows_moved": moved, "partitions_dropped": dropped}
+
+
+# ============================================
+# Spatial ordering of instalacoes
+# ============================================
+
+def reorder_installations() -> float:
+    """
+    Rewrite instalacoes in geohash order (CLUSTER on a geohash expression
+    index). CLUSTER holds an ACCESS EXCLUSIVE lock on instalacoes while it
+    runs; the order decays with inserts, so re-run after large loads.
+    Returns the duration in seconds.
+    """
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text("SET statement_timeout = 0"))
+        # CONCURRENTLY waits for older transactions: no lock_timeout while building
+        conn.execute(text("SET lock_timeout = 0"))
+        conn.execute(text(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {GEOHASH_INDEX}
+            ON instalacoes (ST_GeoHash(geom, {GEOHASH_PRECISION}))
+        """))
+        # ... but CLUSTER must not queue readers behind it
+        conn.execute(text("RESET lock_timeout"))
+        conn.execute(text(f"CLUSTER instalacoes USING {GEOHASH_INDEX}"))
+        conn.execute(text("ANALYZE instalacoes"))
+        conn.execute(text("RESET statement_timeout"))
+    return time.perf_counter() - start
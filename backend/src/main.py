@@ -2,14 +2,21 @@
 SASI - Energy Fraud Inspection Map System
 FastAPI Backend Server
 """
+import asyncio
 import os
 import logging
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
+from sqlalchemy import exc as sa_exc
 
-from routes import queries, areas
+from database import get_pool_status
+from index_advisor import startup_check
+from compression import CompressionMiddleware
+from metrics import InstrumentedRoute, MetricsMiddleware, metrics_response
+from routes import queries, areas, installations, ingestion
 from routes.temp_bulk_insert import router as bulk_router
 
 # Configure logging
@@ -18,10 +25,22 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Log pending migrations and missing indexes when the API starts
+DB_STARTUP_CHECK = os.getenv("DB_STARTUP_CHECK", "True") == "True"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_STARTUP_CHECK:
+        await asyncio.to_thread(startup_check)
+    yield
+
+
 app = FastAPI(
     title="SASI - Sistema de Apoio à Seleção de Inspeções",
     description="API para mapa de inspeções de fraude de energia",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS Configuration
@@ -35,6 +54,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / br / zstd negotiated from Accept-Encoding (cached results and
+# geometries are served precompressed and pass through untouched)
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency / DB / serialization / size histograms (GET /metrics);
+# added last so it wraps everything, including compression
+app.add_middleware(MetricsMiddleware)
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -44,13 +71,50 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": str(exc)}
     )
 
+# Postgres SQLSTATEs raised by statement_timeout / lock_timeout
+TIMEOUT_SQLSTATES = {"57014", "55P03"}
+
+
+def _sqlstate(exc: sa_exc.DBAPIError):
+    orig = exc.orig
+    return (
+        getattr(orig, "pgcode", None)
+        or getattr(orig, "sqlstate", None)
+        or getattr(orig.__cause__, "sqlstate", None)
+    )
+
+
+@app.exception_handler(sa_exc.TimeoutError)
+async def pool_timeout_handler(request: Request, exc: sa_exc.TimeoutError):
+    logger.error(f"Connection pool exhausted: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, try again later"}
+    )
+
+
+@app.exception_handler(sa_exc.DBAPIError)
+async def database_exception_handler(request: Request, exc: sa_exc.DBAPIError):
+    if _sqlstate(exc) in TIMEOUT_SQLSTATES:
+        logger.warning(f"Query timed out on {request.url.path}: {exc.orig}")
+        return JSONResponse(
+            status_code=504,
+            content={"detail": "Query exceeded the database time limit"}
+        )
+    return await global_exception_handler(request, exc)
+
 # Mount routers
 app.include_router(queries.router, prefix="/api/queries", tags=["Queries"])
 app.include_router(areas.router, prefix="/api/areas", tags=["Areas"])
+app.include_router(installations.router, prefix="/api/installations", tags=["Installations"])
 app.include_router(bulk_router, prefix="/api/bulk", tags=["Bulk Insert"])
+app.include_router(ingestion.router, prefix="/api/ingest", tags=["Ingestion"])
+
+# App-level routes (/health, /metrics), labelled in metrics like the API routes
+system_router = APIRouter(route_class=InstrumentedRoute)
 
 
-@app.get("/")
+@system_router.get("/")
 async def root():
     return {
         "message": "SASI API - Energy Fraud Inspection Map System",
@@ -59,11 +123,30 @@ async def root():
     }
 
 
-@app.get("/health")
+@system_router.get("/health")
 async def health():
     return {"status": "healthy"}
 
 
+@system_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Per-route request histograms in Prometheus text format (this worker).
+    """
+    return metrics_response()
+
+
+@system_router.get("/health/pool")
+async def pool_health():
+    """
+    Connection pool usage and checkout-wait metrics.
+    """
+    return {"pools": get_pool_status()}
+
+
+app.include_router(system_router)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("API_PORT", 8000))
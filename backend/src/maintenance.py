@@ -0,0 +1,101 @@
+"""
+Database maintenance commands
+Run with: python maintenance.py <command>
+
+Commands:
+    migrate                Apply pending migrations (db/migrations)
+    migration-status       List migrations and whether they are applied
+    check-indexes          Report missing, invalid and unused indexes
+    refresh-metrics        Refresh the precomputed municipality metrics
+    partition-results      Move default-partition results into per-query partitions
+    reorder-installations  Rewrite instalacoes in geohash order (locks the table)
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import text
+
+from database import engine
+from index_advisor import check_indexes, log_report
+from layout import PARTITIONED_TABLES, reorder_installations, split_default_partition
+from migrations import migration_status, upgrade
+from routes.areas import REFRESH_MUNICIPALITY_METRICS_SQL
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def refresh_metrics():
+    """
+    Refresh mv_metricas_municipio without blocking readers.
+    """
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        conn.execute(text(REFRESH_MUNICIPALITY_METRICS_SQL))
+    logger.info(f"Municipality metrics refreshed in {time.perf_counter() - start:.1f}s")
+
+
+def migrate():
+    """
+    Apply every pending migration in version order.
+    """
+    applied = upgrade()
+    if applied:
+        logger.info(f"Applied {len(applied)} migration(s)")
+
+
+def show_migration_status():
+    for migration, state in migration_status():
+        if state == "changed":
+            logger.warning(f"{migration.version}_{migration.name}: changed since it was applied")
+        else:
+            logger.info(f"{migration.version}_{migration.name}: {state}")
+
+
+def show_index_report():
+    """
+    Report index problems and pg_stat_user_indexes usage.
+    """
+    with engine.connect() as conn:
+        log_report(check_indexes(conn))
+
+
+def partition_results():
+    """
+    Give every query in the default partitions its own partition.
+    """
+    for table in PARTITIONED_TABLES:
+        start = time.perf_counter()
+        report = split_default_partition(table)
+        logger.info(
+            f"{table}: {report['partitions_created']} partition(s) created, {report['rows_moved']} rows moved, "
+            f"{len(report['partitions_dropped'])} orphan partition(s) dropped in {time.perf_counter() - start:.1f}s"
+        )
+
+
+def reorder_installations_command():
+    duration = reorder_installations()
+    logger.info(f"instalacoes rewritten in geohash order in {duration:.1f}s")
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "migration-status": show_migration_status,
+    "check-indexes": show_index_report,
+    "refresh-metrics": refresh_metrics,
+    "partition-results": partition_results,
+    "reorder-installations": reorder_installations_command,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SASI database maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Request-level performance metrics
+
+MetricsMiddleware opens a RequestStats for every HTTP request; SQLAlchemy
+cursor events on both engines add the time, count and rows of each
+statement to it, and InstrumentedRoute records the route template and
+when the handler's last statement finished, so the time spent
+validating/encoding the response can be told apart from the database. At the end of the request the stats are folded into per-route
+histograms, exposed in Prometheus text format by GET /metrics (per worker
+process).
+
+Requests slower than SLOW_REQUEST_MS are logged with their SQL and the
+EXPLAIN plan of their slowest SELECT statements. The plans are fetched by a
+background task after the response has been sent, at most once every
+SLOW_REQUEST_EXPLAIN_INTERVAL seconds per worker, so a burst of slow
+requests does not add EXPLAIN round trips to an already busy pool.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Any, NamedTuple
+
+from fastapi import Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from database import engine, async_engine
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their SQL (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+# Slowest SELECT statements of a slow request whose EXPLAIN plan is logged
+SLOW_REQUEST_EXPLAIN = int(os.getenv("SLOW_REQUEST_EXPLAIN", 3))
+# Minimum seconds between two EXPLAIN runs of the slow request log (per worker)
+SLOW_REQUEST_EXPLAIN_INTERVAL = float(os.getenv("SLOW_REQUEST_EXPLAIN_INTERVAL", 60))
+# Statements kept per request for the slow request log
+MAX_RECORDED_STATEMENTS = 50
+# Characters of SQL / parameters written to the slow request log
+LOG_SQL_CHARS = 2000
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class Statement(NamedTuple):
+    sql: str
+    parameters: Any
+    duration: float
+    rows: int
+    is_async: bool
+
+
+class RequestStats:
+    """
+    Work done while handling one request (filled by the engine events).
+    """
+
+    def __init__(self):
+        self.route = None  # path template, set by InstrumentedRoute
+        self.db_time = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.db_end = None  # when the last statement finished
+        self.serialization_start = None  # set by InstrumentedRoute
+        self.statements = []
+
+    def record(self, statement: Statement):
+        self.db_time += statement.duration
+        self.queries += 1
+        self.rows += statement.rows
+        self.db_end = time.perf_counter()
+        if SLOW_REQUEST_MS and len(self.statements) < MAX_RECORDED_STATEMENTS:
+            self.statements.append(statement)
+
+
+_current = contextvars.ContextVar("sasi_request_stats", default=None)
+
+
+# ============================================
+# Histograms (Prometheus text exposition)
+# ============================================
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """
+    Cumulative histogram per label set (thread-safe).
+    """
+
+    def __init__(self, name: str, documentation: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(counts), total, observed)) for labels, (counts, total, observed) in self._series.items())
+        for label_values, (counts, total, observed) in series:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {observed}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {observed}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "sasi_request_duration_seconds", "Total request latency.",
+    ("method", "route", "status"), SECONDS_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    "sasi_request_db_seconds", "Time spent executing SQL statements per request.",
+    ("method", "route"), SECONDS_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    "sasi_request_db_queries", "SQL statements executed per request.",
+    ("method", "route"), COUNT_BUCKETS
+)
+REQUEST_DB_ROWS = Histogram(
+    "sasi_request_db_rows", "Rows returned or affected by SQL statements per request.",
+    ("method", "route"), ROWS_BUCKETS
+)
+REQUEST_SERIALIZATION = Histogram(
+    "sasi_request_serialization_seconds", "Time from the handler's last SQL statement to response start (validation and encoding).",
+    ("method", "route"), SECONDS_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    "sasi_response_size_bytes", "Response body size as sent (after compression).",
+    ("method", "route"), BYTES_BUCKETS
+)
+
+HISTOGRAMS = (REQUEST_DURATION, REQUEST_DB_TIME, REQUEST_DB_QUERIES, REQUEST_DB_ROWS, REQUEST_SERIALIZATION, RESPONSE_SIZE)
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_response() -> Response:
+    return Response(content=render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+
+# ============================================
+# SQLAlchemy cursor events
+# ============================================
+
+def _cursor_rows(cursor) -> int:
+    # DBAPI rowcount (psycopg2 and asyncpg both report SELECT sizes). It is -1
+    # for server-side cursors: streamed rows are added with record_rows().
+    rowcount = cursor.rowcount
+    return rowcount if rowcount is not None and rowcount >= 0 else 0
+
+
+def record_rows(count: int):
+    """
+    Add rows read from a server-side cursor to the current request.
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.rows += count
+
+
+def _instrument_engine(sync_engine, is_async: bool):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and _current.get() is not None:
+            context.sasi_query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        start = getattr(context, "sasi_query_start", None)
+        if stats is None or start is None:
+            return
+        stats.record(Statement(
+            sql=statement,
+            parameters=None if executemany else parameters,
+            duration=time.perf_counter() - start,
+            rows=_cursor_rows(cursor),
+            is_async=is_async
+        ))
+
+
+_instrument_engine(engine, is_async=False)
+_instrument_engine(async_engine.sync_engine, is_async=True)
+
+
+# ============================================
+# Route class and middleware
+# ============================================
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute recording its path template and where response serialization
+    starts: the end of the last SQL statement run by the handler (or the
+    handler start when it ran none).
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        template = self.path_format
+
+        async def instrumented_handler(request):
+            stats = _current.get()
+            if stats is None:
+                return await handler(request)
+            stats.route = template
+            start = time.perf_counter()
+            response = await handler(request)
+            # Statements run while streaming the body come after this point
+            stats.serialization_start = max(start, stats.db_end or start)
+            return response
+
+        return instrumented_handler
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route histograms and slow requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        response = {"status": 500, "started": None, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["started"] = time.perf_counter()
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+            self._observe(scope["method"], stats, response, duration)
+
+        if SLOW_REQUEST_MS and duration * 1000 >= SLOW_REQUEST_MS:
+            _log_slow_request(scope, stats, response["status"], duration)
+
+    @staticmethod
+    def _observe(method: str, stats: RequestStats, response: dict, duration: float):
+        route = stats.route or "unmatched"
+        REQUEST_DURATION.observe(duration, method, route, str(response["status"]))
+        REQUEST_DB_TIME.observe(stats.db_time, method, route)
+        REQUEST_DB_QUERIES.observe(stats.queries, method, route)
+        REQUEST_DB_ROWS.observe(stats.rows, method, route)
+        RESPONSE_SIZE.observe(response["bytes"], method, route)
+        if stats.serialization_start is not None and response["started"] is not None:
+            REQUEST_SERIALIZATION.observe(max(response["started"] - stats.serialization_start, 0.0), method, route)
+
+
+# ============================================
+# Slow request log
+# ============================================
+
+def _is_select(sql: str) -> bool:
+    words = sql.lstrip().lstrip("(").split(None, 1)
+    return bool(words) and words[0].upper() in ("SELECT", "WITH")
+
+
+async def _explain(statement: Statement) -> str:
+    sql = "EXPLAIN " + statement.sql
+    parameters = statement.parameters or None
+    if statement.is_async:
+        async with async_engine.connect() as conn:
+            rows = (await conn.exec_driver_sql(sql, parameters)).fetchall()
+    else:
+        def run():
+            with engine.connect() as conn:
+                return conn.exec_driver_sql(sql, parameters).fetchall()
+        rows = await asyncio.to_thread(run)
+    return "\n".join(str(row[0]) for row in rows)
+
+
+def _truncate(value: Any) -> str:
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= LOG_SQL_CHARS else text[:LOG_SQL_CHARS] + "..."
+
+
+# Last EXPLAIN run and the task running it (background tasks are only
+# weakly referenced by the event loop)
+_explain_state = {"last": None, "task": None}
+
+
+def _explain_due() -> bool:
+    now = time.monotonic()
+    last, task = _explain_state["last"], _explain_state["task"]
+    if task is not None and not task.done():
+        return False
+    if last is not None and now - last < SLOW_REQUEST_EXPLAIN_INTERVAL:
+        return False
+    _explain_state["last"] = now
+    return True
+
+
+async def _log_plans(header: str, statements: list):
+    lines = [f"EXPLAIN of {header}"]
+    for statement in statements:
+        try:
+            plan = await _explain(statement)
+        except Exception as exc:  # logging must never fail
+            plan = f"EXPLAIN failed: {exc}"
+        lines.append(f"EXPLAIN ({statement.duration * 1000:.1f} ms) {_truncate(statement.sql.strip()[:200])}\n{plan}")
+    logger.warning("\n".join(lines))
+
+
+def _log_slow_request(scope, stats: RequestStats, status: int, duration: float):
+    path = scope["path"] + ("?" + scope["query_string"].decode("latin-1") if scope.get("query_string") else "")
+    header = f"slow request {scope['method']} {path} ({stats.route or 'unmatched'})"
+    lines = [
+        f"Slow request {scope['method']} {path} ({stats.route or 'unmatched'}): "
+        f"{duration * 1000:.0f} ms, status {status}, {stats.queries} statements, "
+        f"{stats.db_time * 1000:.0f} ms in database, {stats.rows} rows"
+    ]
+    for index, statement in enumerate(stats.statements, start=1):
+        lines.append(f"[{index}] {statement.duration * 1000:.1f} ms, {statement.rows} rows: {_truncate(statement.sql.strip())}")
+        if statement.parameters:
+            lines.append(f"    parameters: {_truncate(statement.parameters)}")
+    logger.warning("\n".join(lines))
+
+    slowest = sorted(
+        (s for s in stats.statements if s.parameters is not None and _is_select(s.sql)),
+        key=lambda s: s.duration, reverse=True
+    )[:SLOW_REQUEST_EXPLAIN]
+    if slowest and _explain_due():
+        _explain_state["task"] = asyncio.create_task(_log_plans(header, slowest))
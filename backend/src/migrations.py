@@ -0,0 +1,227 @@
+"""
+Versioned SQL migrations
+
+Migrations are the files db/migrations/NNN_name.sql, applied in version
+order after the base schema (db/schema_v2.sql) and recorded in
+schema_migrations with a checksum. Each one runs in its own transaction
+together with its schema_migrations row, unless the file contains the line
+
+    -- migration: no-transaction
+
+(needed for CREATE INDEX CONCURRENTLY, VACUUM, ...). Those files are run
+statement by statement in autocommit mode and must be idempotent
+(IF NOT EXISTS / IF EXISTS), so a failed run can simply be repeated.
+
+Run with: python maintenance.py migrate | migration-status
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import NamedTuple
+
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db", "migrations")
+NO_TRANSACTION_MARKER = "-- migration: no-transaction"
+
+_FILENAME = re.compile(r"^(\d{3})_(\w+)\.sql$")
+
+CREATE_MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(10) PRIMARY KEY,
+        nome VARCHAR(200) NOT NULL,
+        checksum VARCHAR(64) NOT NULL,
+        aplicada_em TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+        duracao_ms INTEGER
+    )
+"""
+
+
+class Migration(NamedTuple):
+    version: str
+    name: str
+    path: str
+    sql: str
+    checksum: str
+    transactional: bool
+
+
+def load_migrations() -> list:
+    """
+    Migration files in version order.
+    """
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        path = os.path.join(MIGRATIONS_DIR, filename)
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append(Migration(
+            version=match.group(1),
+            name=match.group(2),
+            path=path,
+            sql=sql,
+            checksum=hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+            transactional=NO_TRANSACTION_MARKER not in sql
+        ))
+    return migrations
+
+
+def split_statements(sql: str) -> list:
+    """
+    Split a SQL script on top-level semicolons (skipping comments, quoted
+    strings and dollar-quoted bodies).
+    """
+    statements = []
+    current = []
+    index = 0
+    length = len(sql)
+    while index < length:
+        char = sql[index]
+        if sql.startswith("--", index):
+            end = sql.find("\n", index)
+            end = length if end == -1 else end
+            current.append(sql[index:end])
+            index = end
+            continue
+        if sql.startswith("/*", index):
+            end = sql.find("*/", index + 2)
+            end = length if end == -1 else end + 2
+            current.append(sql[index:end])
+            index = end
+            continue
+        if char == "'":
+            end = index + 1
+            while end < length:
+                if sql[end] == "'" and sql.startswith("''", end):
+                    end += 2
+                    continue
+                if sql[end] == "'":
+                    break
+                end += 1
+            current.append(sql[index:end + 1])
+            index = end + 1
+            continue
+        if char == "$":
+            tag = re.match(r"\$(\w*)\$", sql[index:])
+            if tag:
+                end = sql.find(tag.group(0), index + len(tag.group(0)))
+                end = length if end == -1 else end + len(tag.group(0))
+                current.append(sql[index:end])
+                index = end
+                continue
+        if char == ";":
+            statements.append("".join(current))
+            current = []
+            index += 1
+            continue
+        current.append(char)
+        index += 1
+    statements.append("".join(current))
+
+    # Drop fragments that only contain comments / whitespace
+    return [
+        statement.strip() for statement in statements
+        if re.sub(r"--[^\n]*|/\*.*?\*/", "", statement, flags=re.S).strip()
+    ]
+
+
+def applied_migrations(conn) -> dict:
+    """
+    version -> checksum of the migrations recorded in schema_migrations.
+    """
+    exists = conn.execute(text("SELECT to_regclass('schema_migrations') IS NOT NULL")).scalar()
+    if not exists:
+        return {}
+    return dict(conn.execute(text("SELECT version, checksum FROM schema_migrations")).all())
+
+
+def migration_status() -> list:
+    """
+    (migration, state) for every file: applied, pending or changed (file
+    edited after it was applied).
+    """
+    with engine.connect() as conn:
+        applied = applied_migrations(conn)
+    status = []
+    for migration in load_migrations():
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            state = "pending"
+        elif checksum != migration.checksum:
+            state = "changed"
+        else:
+            state = "applied"
+        status.append((migration, state))
+    return status
+
+
+def pending_migrations() -> list:
+    return [migration for migration, state in migration_status() if state == "pending"]
+
+
+def _record(conn, migration: Migration, duration: float):
+    conn.execute(text("""
+        INSERT INTO schema_migrations (version, nome, checksum, duracao_ms)
+        VALUES (:version, :nome, :checksum, :duracao_ms)
+        ON CONFLICT (version) DO UPDATE
+        SET nome = EXCLUDED.nome, checksum = EXCLUDED.checksum,
+            aplicada_em = NOW() AT TIME ZONE 'utc', duracao_ms = EXCLUDED.duracao_ms
+    """), {
+        "version": migration.version,
+        "nome": migration.name,
+        "checksum": migration.checksum,
+        "duracao_ms": int(duration * 1000)
+    })
+
+
+def apply_migration(migration: Migration):
+    start = time.perf_counter()
+    if migration.transactional:
+        with engine.begin() as conn:
+            # Schema changes may run long and wait on locks held by readers
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            conn.execute(text("SET LOCAL lock_timeout = 0"))
+            # Raw cursor: the script is sent as-is (no bind parameter parsing)
+            conn.connection.cursor().execute(migration.sql)
+            _record(conn, migration, time.perf_counter() - start)
+    else:
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT")
+            cursor = conn.connection.cursor()
+            cursor.execute("SET statement_timeout = 0")
+            cursor.execute("SET lock_timeout = 0")
+            try:
+                for statement in split_statements(migration.sql):
+                    cursor.execute(statement)
+            finally:
+                cursor.execute("RESET statement_timeout")
+                cursor.execute("RESET lock_timeout")
+            _record(conn, migration, time.perf_counter() - start)
+    logger.info(f"Applied migration {migration.version}_{migration.name} in {time.perf_counter() - start:.1f}s")
+
+
+def upgrade(target: str = None) -> list:
+    """
+    Apply pending migrations (up to target version, inclusive).
+    """
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_MIGRATIONS_TABLE_SQL))
+
+    applied = []
+    for migration in pending_migrations():
+        if target is not None and migration.version > target:
+            break
+        apply_migration(migration)
+        applied.append(migration)
+    if not applied:
+        logger.info("Database is up to date")
+    return applied
@@ -1,7 +1,7 @@
 """
 SQLAlchemy ORM Models
 """
-from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, Boolean, Text, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Numeric, Date, DateTime, Boolean, Text, ForeignKey, CheckConstraint, func
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from datetime import datetime
@@ -59,6 +59,15 @@ class ResultadoQueryPrincipal(Base):
     query = relationship("QueryPrincipal", back_populates="resultados")
 
 
+class VersaoResultadoPrincipal(Base):
+    __tablename__ = "versao_resultados_principais"
+    
+    # Maintained by trigger: bumped whenever results of a query are rewritten
+    id_query = Column(Integer, ForeignKey('queries_principais.id_query', ondelete='CASCADE'), primary_key=True)
+    versao = Column(Integer, nullable=False, default=1)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+
+
 class QueryAuxiliar(Base):
     __tablename__ = "queries_auxiliares"
     
@@ -125,7 +134,8 @@ class StatusInstalacao(Base):
     id_instalacao = Column(String(50), ForeignKey('instalacoes.id_instalacao', ondelete='CASCADE'), nullable=False)
     status = Column(String(20), nullable=False)
     usuario = Column(String(100), nullable=False)
-    data_atualizacao = Column(DateTime, default=datetime.utcnow)
+    # Set by the database (DEFAULT NOW(), db/migrations/008_status_timestamptz.sql)
+    data_atualizacao = Column(DateTime(timezone=True), server_default=func.now())
     observacoes = Column(Text)
     
     __table_args__ = (
@@ -136,6 +146,17 @@ class StatusInstalacao(Base):
     instalacao = relationship("Instalacao", back_populates="status")
 
 
+class StatusAtualInstalacao(Base):
+    __tablename__ = "status_atual_instalacao"
+    
+    # Maintained by trigger: latest status_instalacao row per installation
+    id_instalacao = Column(String(50), ForeignKey('instalacoes.id_instalacao', ondelete='CASCADE'), primary_key=True)
+    status = Column(String(20), nullable=False)
+    usuario = Column(String(100), nullable=False)
+    observacoes = Column(Text)
+    data_atualizacao = Column(DateTime(timezone=True), nullable=False)
+
+
 class Municipio(Base):
     __tablename__ = "municipios"
     
@@ -0,0 +1,18 @@
+"""
+Custom response classes
+"""
+from fastapi import Response
+
+
+class RawJSONResponse(Response):
+    """
+    JSON response whose body is already serialized (e.g. built by PostGIS
+    with json_build_object/json_agg). The content is sent as-is, skipping
+    Pydantic validation and re-serialization.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, str):
+            return content.encode("utf-8")
+        return content
@@ -1,65 +1,230 @@
 """
 API Routes for Area Analysis
 """
-from fastapi import APIRouter, Depends, Body
-from sqlalchemy.orm import Session
-from sqlalchemy import text, func
-from typing import List
-from database import get_db
+from fastapi import APIRouter, Depends, Body, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
+from typing import List, Optional
+from database import get_async_db
+from area_filter import AreaError, resolve_area
+from cache import CachedResponse, LRUCacheBackend, is_not_modified, validator_headers, weak_etag
+from compression import AVAILABLE_ENCODINGS, precompressed_response
+from metrics import InstrumentedRoute
 from models import Municipio
 from schemas import MunicipioResponse, AreaMetricsRequest, AreaMetricsResponse, TarifaDistribuicao, MunicipioGeoJSONResponse
-import json
+import hashlib
+import os
 from datetime import datetime, timedelta
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 
 @router.get("/municipalities", response_model=List[MunicipioResponse])
-async def get_municipalities(db: Session = Depends(get_db)):
+async def get_municipalities(db: AsyncSession = Depends(get_async_db)):
     """
     Get list of all municipalities in Rio Grande do Norte.
     """
-    municipios = db.query(Municipio).order_by(Municipio.nome).all()
+    result = await db.execute(select(Municipio).order_by(Municipio.nome))
+    municipios = result.scalars().all()
     return municipios
 
 
+# Municipality outlines never change between data loads, so each
+# (municipality, level) GeoJSON is built once by PostGIS and kept in memory.
+# Levels: (max zoom, simplification tolerance in degrees, coordinate decimals)
+GEOMETRY_LEVELS = (
+    (6, 0.01, 3),
+    (9, 0.001, 4),
+    (12, 0.0001, 5),
+    (None, 0.0, 6),  # full resolution
+)
+GEOMETRY_CACHE_CONTROL = f"public, max-age={int(os.getenv('GEOMETRY_MAX_AGE', 7 * 24 * 3600))}"
+
+# Municipalities of Rio Grande do Norte
+MUNICIPALITY_COUNT = 167
+# Every outline plus the combined collection, per level, each stored
+# identity-encoded and once per compressed encoding
+GEOMETRY_CACHE_ENTRIES = (MUNICIPALITY_COUNT + 1) * len(GEOMETRY_LEVELS) * (1 + len(AVAILABLE_ENCODINGS))
+
+geometry_cache = LRUCacheBackend(
+    max_entries=int(os.getenv("GEOMETRY_CACHE_MAX_ENTRIES", GEOMETRY_CACHE_ENTRIES)),
+    max_bytes=int(os.getenv("GEOMETRY_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+)
+
+MUNICIPALITY_FEATURE_SQL = """
+    SELECT 
+        nome,
+        json_build_object(
+            'type', 'Feature',
+            'geometry', ST_AsGeoJSON(
+                CASE WHEN CAST(:tolerance AS float8) > 0 THEN ST_SimplifyPreserveTopology(geom, CAST(:tolerance AS float8)) ELSE geom END,
+                CAST(:digits AS integer)
+            )::json,
+            'properties', json_build_object('id', id, 'nome', nome)
+        )::text as feature
+    FROM municipios
+    {where}
+    ORDER BY nome
+"""
+
+
+def _geometry_level(zoom: Optional[int], tolerance: Optional[float]) -> int:
+    """
+    Pick a geometry level: by zoom, else the coarsest level not exceeding
+    the requested tolerance, else full resolution.
+    """
+    if zoom is not None:
+        for index, (max_zoom, _, _) in enumerate(GEOMETRY_LEVELS):
+            if max_zoom is None or zoom <= max_zoom:
+                return index
+    if tolerance is not None:
+        for index, (_, level_tolerance, _) in enumerate(GEOMETRY_LEVELS):
+            if level_tolerance <= tolerance:
+                return index
+    return len(GEOMETRY_LEVELS) - 1
+
+
+async def _cache_geometry(key: str, body: bytes, media_type: str = "application/json") -> CachedResponse:
+    etag = weak_etag(hashlib.sha1(body).hexdigest()[:16])
+    cached = CachedResponse(body, media_type, etag)
+    await geometry_cache.set(key, cached)
+    return cached
+
+
+async def _geometry_response(request: Request, key: str, cached: CachedResponse) -> Response:
+    headers = validator_headers(cached.etag, None, GEOMETRY_CACHE_CONTROL)
+    # Same Vary on the 200 and the 304 (the body is negotiated from Accept-Encoding)
+    headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request, cached.etag, None):
+        return Response(status_code=304, headers=headers)
+    return await precompressed_response(request, geometry_cache, key, cached, headers)
+
+
+async def _municipality_features(db: AsyncSession, level: int, nome: Optional[str] = None) -> list:
+    _, tolerance, digits = GEOMETRY_LEVELS[level]
+    sql = MUNICIPALITY_FEATURE_SQL.format(where="WHERE nome = :nome" if nome is not None else "")
+    params = {"tolerance": tolerance, "digits": digits}
+    if nome is not None:
+        params["nome"] = nome
+    return (await db.execute(text(sql), params)).fetchall()
+
+
+@router.get("/municipalities/geometry")
+async def get_municipalities_geometry(
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Map zoom level, selects the simplification level"),
+    tolerance: Optional[float] = Query(None, ge=0, description="Maximum simplification tolerance in degrees"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    All municipality outlines as one FeatureCollection.
+    
+    The payload is built once per level and kept in memory, together with
+    its compressed encodings.
+    """
+    level = _geometry_level(zoom, tolerance)
+    key = f"all:{level}"
+    
+    cached = await geometry_cache.get(key)
+    if cached is None:
+        rows = await _municipality_features(db, level)
+        for row in rows:
+            await _cache_geometry(f"{row.nome}:{level}", row.feature.encode("utf-8"))
+        body = '{"type":"FeatureCollection","features":[' + ",".join(row.feature for row in rows) + "]}"
+        cached = await _cache_geometry(key, body.encode("utf-8"))
+    
+    return await _geometry_response(request, key, cached)
+
+
 @router.get("/municipalities/{nome}/geometry", response_model=MunicipioGeoJSONResponse)
-async def get_municipality_geometry(nome: str, db: Session = Depends(get_db)):
+async def get_municipality_geometry(
+    nome: str,
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Map zoom level, selects the simplification level"),
+    tolerance: Optional[float] = Query(None, ge=0, description="Maximum simplification tolerance in degrees"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Get the GeoJSON geometry for a specific municipality.
+    
+    Without zoom/tolerance the full-resolution outline is returned.
+    Responses are cached in memory and served with long-lived
+    Cache-Control and ETag headers.
     """
-    sql = text("""
-        SELECT 
-            id,
-            nome,
-            ST_AsGeoJSON(geom) as geom_json
-        FROM municipios
-        WHERE nome = :nome
-    """)
+    level = _geometry_level(zoom, tolerance)
+    key = f"{nome}:{level}"
     
-    result = db.execute(sql, {"nome": nome}).fetchone()
+    cached = await geometry_cache.get(key)
+    if cached is None:
+        rows = await _municipality_features(db, level, nome)
+        if not rows:
+            return MunicipioGeoJSONResponse(
+                type="Feature",
+                geometry={},
+                properties={"error": "Municipality not found"}
+            )
+        cached = await _cache_geometry(key, rows[0].feature.encode("utf-8"))
     
-    if not result:
-        return MunicipioGeoJSONResponse(
-            type="Feature",
-            geometry={},
-            properties={"error": "Municipality not found"}
-        )
-    
-    return MunicipioGeoJSONResponse(
-        type="Feature",
-        geometry=json.loads(result.geom_json),
-        properties={
-            "id": result.id,
-            "nome": result.nome
-        }
+    return await _geometry_response(request, key, cached)
+
+
+# Precomputed municipality metrics (db/migrations/002_municipio_metrics.sql)
+MUNICIPALITY_METRICS_SQL = """
+    SELECT 
+        perimetro_km,
+        total_instalacoes,
+        total_fraudes,
+        distribuicao_tarifa,
+        atualizado_em
+    FROM mv_metricas_municipio
+    WHERE nome = :nome
+"""
+
+REFRESH_MUNICIPALITY_METRICS_SQL = "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_metricas_municipio"
+
+# All area metrics in one round trip: the area geometry and the set of
+# installations in the area are materialized once and reused by every
+# metric. Polygon installations are selected by joining the area CTE;
+# municipality installations by name, the same rule as mv_metricas_municipio.
+AREA_METRICS_SQL = """
+    WITH area AS MATERIALIZED (
+        {area_sql}
+    ),
+    alvo AS MATERIALIZED (
+        SELECT i.id_instalacao, i.classe_tarifaria
+        FROM instalacoes i
+        {alvo_filter}
+    ),
+    tarifas AS (
+        SELECT 
+            COALESCE(classe_tarifaria, 'Não Classificado') as classe_tarifaria,
+            COUNT(*) as count
+        FROM alvo
+        GROUP BY classe_tarifaria
     )
+    SELECT 
+        (SELECT ST_Perimeter(geom::geography) / 1000 FROM area) as perimetro_km,
+        (SELECT COUNT(*) FROM alvo) as total_instalacoes,
+        (
+            SELECT COUNT(DISTINCT f.id_instalacao)
+            FROM fraudes f
+            JOIN alvo a ON f.id_instalacao = a.id_instalacao
+            WHERE f.data_fraude >= :data_inicio
+        ) as total_fraudes,
+        (
+            SELECT COALESCE(
+                json_agg(json_build_object('classe_tarifaria', classe_tarifaria, 'count', count) ORDER BY count DESC),
+                '[]'::json
+            )
+            FROM tarifas
+        ) as distribuicao_tarifa
+"""
 
 
 @router.post("/metrics", response_model=AreaMetricsResponse)
 async def get_area_metrics(
     area_request: AreaMetricsRequest = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get aggregated metrics for a selected area (municipality or polygon).
@@ -69,120 +234,75 @@ async def get_area_metrics(
     - Total installations in area
     - Total frauds in last 5 years
     - Distribution by tariff class
+    
+    Municipality metrics come from the mv_metricas_municipio summary
+    (atualizado_em tells how fresh they are); polygons and municipalities
+    missing from the summary are computed live by a single CTE query.
     """
+    five_years_ago = datetime.now() - timedelta(days=5*365)
+    params = {"data_inicio": five_years_ago.date()}
     
     if area_request.tipo == "municipio":
-        # Municipality-based metrics
-        municipio_nome = area_request.valor
-        
-        # Get perimeter
-        perimeter_sql = text("""
-            SELECT ST_Perimeter(geom::geography) / 1000 as perimetro_km
-            FROM municipios
-            WHERE nome = :nome
-        """)
-        perimeter_result = db.execute(perimeter_sql, {"nome": municipio_nome}).fetchone()
-        perimetro_km = float(perimeter_result.perimetro_km) if perimeter_result else None
-        
-        # Get total installations
-        total_sql = text("""
-            SELECT COUNT(*) as total
-            FROM instalacoes
-            WHERE municipio = :nome
-        """)
-        total_result = db.execute(total_sql, {"nome": municipio_nome}).fetchone()
-        total_instalacoes = total_result.total if total_result else 0
-        
-        # Get frauds in last 5 years
-        five_years_ago = datetime.now() - timedelta(days=5*365)
-        frauds_sql = text("""
-            SELECT COUNT(DISTINCT f.id_instalacao) as total_fraudes
-            FROM fraudes f
-            JOIN instalacoes i ON f.id_instalacao = i.id_instalacao
-            WHERE i.municipio = :nome
-            AND f.data_fraude >= :data_inicio
-        """)
-        frauds_result = db.execute(frauds_sql, {
-            "nome": municipio_nome,
-            "data_inicio": five_years_ago.date()
-        }).fetchone()
-        total_fraudes = frauds_result.total_fraudes if frauds_result else 0
-        
-        # Get tariff distribution
-        tarifa_sql = text("""
-            SELECT 
-                COALESCE(classe_tarifaria, 'Não Classificado') as classe_tarifaria,
-                COUNT(*) as count
-            FROM instalacoes
-            WHERE municipio = :nome
-            GROUP BY classe_tarifaria
-            ORDER BY count DESC
-        """)
-        tarifa_results = db.execute(tarifa_sql, {"nome": municipio_nome}).fetchall()
-        
-    elif area_request.tipo == "poligono":
-        # Polygon-based metrics
-        polygon_geojson = json.dumps(area_request.valor)
-        
-        # Get perimeter
-        perimeter_sql = text("""
-            SELECT ST_Perimeter(ST_GeomFromGeoJSON(:polygon)::geography) / 1000 as perimetro_km
-        """)
-        perimeter_result = db.execute(perimeter_sql, {"polygon": polygon_geojson}).fetchone()
-        perimetro_km = float(perimeter_result.perimetro_km) if perimeter_result else None
-        
-        # Get total installations
-        total_sql = text("""
-            SELECT COUNT(*) as total
-            FROM instalacoes
-            WHERE ST_Contains(ST_GeomFromGeoJSON(:polygon), geom)
-        """)
-        total_result = db.execute(total_sql, {"polygon": polygon_geojson}).fetchone()
-        total_instalacoes = total_result.total if total_result else 0
-        
-        # Get frauds in last 5 years
-        five_years_ago = datetime.now() - timedelta(days=5*365)
-        frauds_sql = text("""
-            SELECT COUNT(DISTINCT f.id_instalacao) as total_fraudes
-            FROM fraudes f
-            JOIN instalacoes i ON f.id_instalacao = i.id_instalacao
-            WHERE ST_Contains(ST_GeomFromGeoJSON(:polygon), i.geom)
-            AND f.data_fraude >= :data_inicio
-        """)
-        frauds_result = db.execute(frauds_sql, {
-            "polygon": polygon_geojson,
-            "data_inicio": five_years_ago.date()
-        }).fetchone()
-        total_fraudes = frauds_result.total_fraudes if frauds_result else 0
-        
-        # Get tariff distribution
-        tarifa_sql = text("""
-            SELECT 
-                COALESCE(classe_tarifaria, 'Não Classificado') as classe_tarifaria,
-                COUNT(*) as count
-            FROM instalacoes
-            WHERE ST_Contains(ST_GeomFromGeoJSON(:polygon), geom)
-            GROUP BY classe_tarifaria
-            ORDER BY count DESC
-        """)
-        tarifa_results = db.execute(tarifa_sql, {"polygon": polygon_geojson}).fetchall()
-    
-    else:
+        summary = (await db.execute(text(MUNICIPALITY_METRICS_SQL), {"nome": area_request.valor})).fetchone()
+        if summary:
+            return _area_metrics_response(summary, atualizado_em=summary.atualizado_em)
+    elif area_request.tipo != "poligono":
         return AreaMetricsResponse(
             total_instalacoes=0,
             total_fraudes_5anos=0,
             distribuicao_tarifa=[]
         )
     
+    # Municipalities match installations by name (idx_instalacoes_municipio);
+    # polygons are validated/simplified once and joined as the area CTE
+    try:
+        area = resolve_area(area_request.tipo, area_request.valor)
+    except AreaError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    sql = AREA_METRICS_SQL.format(
+        area_sql=f"SELECT {area.geometry_sql} as geom",
+        alvo_filter=(
+            "JOIN area ON i.geom && area.geom AND ST_Contains(area.geom, i.geom)"
+            if area.area_type == "poligono" else f"WHERE {area.filter_sql}"
+        )
+    )
+    params.update(area.params)
+    
+    result = (await db.execute(text(sql), params)).fetchone()
+    
+    return _area_metrics_response(result)
+
+
+def _area_metrics_response(result, atualizado_em=None) -> AreaMetricsResponse:
+    """
+    Build the metrics response from a live or precomputed metrics row.
+    """
     # Format tariff distribution
     distribuicao = [
-        TarifaDistribuicao(classe_tarifaria=row.classe_tarifaria, count=row.count)
-        for row in tarifa_results
+        TarifaDistribuicao(classe_tarifaria=row["classe_tarifaria"], count=row["count"])
+        for row in result.distribuicao_tarifa
     ]
     
     return AreaMetricsResponse(
-        perimetro_km=perimetro_km,
-        total_instalacoes=total_instalacoes,
-        total_fraudes_5anos=total_fraudes,
-        distribuicao_tarifa=distribuicao
+        perimetro_km=float(result.perimetro_km) if result.perimetro_km is not None else None,
+        total_instalacoes=result.total_instalacoes,
+        total_fraudes_5anos=result.total_fraudes,
+        distribuicao_tarifa=distribuicao,
+        atualizado_em=atualizado_em
     )
+
+
+@router.post("/metrics/refresh")
+async def refresh_municipality_metrics(db: AsyncSession = Depends(get_async_db)):
+    """
+    Refresh the precomputed municipality metrics (run after data loads).
+    Readers keep using the previous snapshot while the refresh runs.
+    """
+    # Refresh scans every installation: lift the per-statement API limit
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    await db.execute(text(REFRESH_MUNICIPALITY_METRICS_SQL))
+    atualizado_em = (await db.execute(text("SELECT MAX(atualizado_em) FROM mv_metricas_municipio"))).scalar()
+    await db.commit()
+    
+    return {"refreshed": True, "atualizado_em": atualizado_em}
@@ -0,0 +1,36 @@
+"""
+API Routes for bulk ingestion of query results
+"""
+from fastapi import APIRouter, File, HTTPException, UploadFile, Query as QueryParam
+from typing import Literal, Optional
+from ingestion import detect_format, ingest
+from schemas import IngestionReportResponse
+from metrics import InstrumentedRoute
+
+router = APIRouter(route_class=InstrumentedRoute)
+
+
+@router.post("/{target}", response_model=IngestionReportResponse)
+def ingest_query_results(
+    target: Literal['principal', 'auxiliar'],
+    file: UploadFile = File(..., description="CSV, NDJSON or Parquet file"),
+    format: Optional[Literal['csv', 'ndjson', 'parquet']] = QueryParam(None, description="Input format (default: from file name)"),
+    mode: Literal['replace', 'upsert'] = QueryParam('replace', description="replace: swap all results of each id_query in the file; upsert: merge"),
+):
+    """
+    Bulk load query results via COPY into a staging table.
+    
+    Columns: id_query, id_instalacao and tipo_alvo/score (principal) or
+    intensidade (auxiliar). Each id_query in the file is swapped atomically.
+    Returns rows/sec and rejected row counts.
+    
+    Declared sync: COPY runs on the psycopg2 engine in the threadpool.
+    """
+    fmt = format or detect_format(file.filename)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Cannot infer file format, use the format parameter")
+    
+    try:
+        return ingest(file.file, target, fmt, mode)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
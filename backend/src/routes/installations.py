@@ -1,30 +1,279 @@
 """
 API Routes for Installations
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text, desc
-from typing import List
-from database import get_db
-from models import Instalacao, HistoricoConsumo, Fraude, NotaServico, StatusInstalacao
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, text
+from typing import List, Literal, Optional
+from datetime import date
+from database import get_async_db
+from models import Instalacao, HistoricoConsumo, Fraude, NotaServico, StatusInstalacao, StatusAtualInstalacao
 from schemas import (
     InstalacaoDetailResponse, 
+    InstalacaoFullResponse,
+    InstalacaoBatchRequest,
+    InstalacaoBatchResponse,
     ConsumoHistoricoResponse,
+    ConsumoSeriesResponse,
     FraudeResponse,
     NotaServicoResponse,
     StatusInstalacaoUpdate,
-    StatusInstalacaoResponse
+    StatusInstalacaoResponse,
+    StatusInstalacaoBulkUpdate,
+    StatusInstalacaoBulkResponse,
+    StatusInstalacaoLookup
 )
+from timeseries import FREQUENCIES, build_series
+from metrics import InstrumentedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
+
+# Everything the installation popup shows, for any number of installations,
+# in one round trip: each LATERAL subquery reads only the newest rows of one
+# installation through its (id_instalacao, date) index.
+INSTALLATION_FULL_SQL = """
+    SELECT 
+        i.id_instalacao,
+        i.latitude,
+        i.longitude,
+        i.municipio,
+        i.classe_tarifaria,
+        i.endereco,
+        i.created_at,
+        i.updated_at,
+        c.consumo,
+        f.fraudes,
+        n.notas_servico,
+        s.status
+    FROM instalacoes i
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(
+            json_agg(json_build_object(
+                'data_referencia', h.data_referencia,
+                'consumo', h.consumo,
+                'demanda', h.demanda
+            ) ORDER BY h.data_referencia),
+            '[]'::json
+        ) as consumo
+        FROM (
+            SELECT data_referencia, consumo, demanda
+            FROM historico_consumo
+            WHERE id_instalacao = i.id_instalacao
+            ORDER BY data_referencia DESC
+            LIMIT :consumption_limit
+        ) h
+    ) c ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(
+            json_agg(json_build_object(
+                'data_fraude', fr.data_fraude,
+                'tipo_fraude', fr.tipo_fraude,
+                'valor_recuperado', fr.valor_recuperado,
+                'observacoes', fr.observacoes
+            ) ORDER BY fr.data_fraude DESC),
+            '[]'::json
+        ) as fraudes
+        FROM fraudes fr
+        WHERE fr.id_instalacao = i.id_instalacao
+    ) f ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(
+            json_agg(json_build_object(
+                'numero_nota', ns.numero_nota,
+                'data_nota', ns.data_nota,
+                'tipo_servico', ns.tipo_servico,
+                'descricao', ns.descricao,
+                'status', ns.status
+            ) ORDER BY ns.data_nota DESC),
+            '[]'::json
+        ) as notas_servico
+        FROM (
+            SELECT numero_nota, data_nota, tipo_servico, descricao, status
+            FROM notas_servico
+            WHERE id_instalacao = i.id_instalacao
+            ORDER BY data_nota DESC
+            LIMIT :notes_limit
+        ) ns
+    ) n ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_build_object(
+            'id_instalacao', st.id_instalacao,
+            'status', st.status,
+            'usuario', st.usuario,
+            'data_atualizacao', st.data_atualizacao,
+            'observacoes', st.observacoes
+        ) as status
+        FROM status_atual_instalacao st
+        WHERE st.id_instalacao = i.id_instalacao
+    ) s ON TRUE
+    WHERE i.id_instalacao = ANY(:ids)
+"""
+
+# Consumption resampled per period; the (id_instalacao, data_referencia)
+# index (db/migrations/005_consumption_history.sql) turns each installation into one range scan
+CONSUMPTION_SERIES_SQL = """
+    SELECT
+        h.id_instalacao,
+        date_trunc(CAST(:unit AS text), h.data_referencia::timestamp)::date as periodo,
+        SUM(h.consumo)::float8 as consumo,
+        MAX(h.demanda)::float8 as demanda,
+        COUNT(*) as amostras
+    FROM historico_consumo h
+    WHERE h.id_instalacao = ANY(:ids)
+    {date_filter}
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+
+async def _get_installations_full(db: AsyncSession, ids: List[str], consumption_limit: int, notes_limit: int) -> List[InstalacaoFullResponse]:
+    rows = (await db.execute(text(INSTALLATION_FULL_SQL), {
+        "ids": ids,
+        "consumption_limit": consumption_limit,
+        "notes_limit": notes_limit
+    })).mappings().all()
+    
+    return [InstalacaoFullResponse.model_validate(dict(row)) for row in rows]
+
+
+@router.post("/full", response_model=InstalacaoBatchResponse)
+async def get_installations_full(
+    batch: InstalacaoBatchRequest,
+    consumption_limit: int = Query(12, ge=0, le=240),
+    notes_limit: int = Query(20, ge=0, le=200),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Full details (consumption, frauds, service notes, current status) of
+    many installations in a single query. Results follow the order of ids.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    found = {item.id_instalacao: item for item in await _get_installations_full(db, ids, consumption_limit, notes_limit)}
+    
+    return InstalacaoBatchResponse(
+        instalacoes=[found[i] for i in ids if i in found],
+        nao_encontradas=[i for i in ids if i not in found]
+    )
+
+
+async def _get_consumption_series(
+    db: AsyncSession,
+    ids: List[str],
+    freq: str,
+    start: Optional[date],
+    end: Optional[date],
+    rolling: int,
+    yoy: bool
+) -> ConsumoSeriesResponse:
+    params = {"ids": ids, "unit": FREQUENCIES[freq][0]}
+    date_filter = ""
+    if start:
+        date_filter += " AND h.data_referencia >= :start"
+        params["start"] = start
+    if end:
+        date_filter += " AND h.data_referencia <= :end"
+        params["end"] = end
+    
+    rows = (await db.execute(text(CONSUMPTION_SERIES_SQL.format(date_filter=date_filter)), params)).all()
+    payload = build_series(rows, ids, freq, rolling, yoy)
+    found = {serie["id_instalacao"] for serie in payload["series"]}
+    
+    return ConsumoSeriesResponse(**payload, nao_encontradas=[i for i in ids if i not in found])
+
+
+@router.post("/consumption/series", response_model=ConsumoSeriesResponse)
+async def get_installations_consumption_series(
+    batch: InstalacaoBatchRequest,
+    freq: Literal['month', 'quarter', 'year'] = Query('month', description="Resampling period"),
+    start: Optional[date] = Query(None, description="First data_referencia included"),
+    end: Optional[date] = Query(None, description="Last data_referencia included"),
+    rolling: int = Query(0, ge=0, le=60, description="Rolling mean/std window in periods (0 = off)"),
+    yoy: bool = Query(False, description="Include year-over-year deltas"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Consumption (sum) and demand (max) per period for many installations,
+    as arrays aligned with a shared list of periods. Installations without
+    consumption in the range are listed in nao_encontradas.
+    """
+    ids = list(dict.fromkeys(batch.ids))
+    return await _get_consumption_series(db, ids, freq, start, end, rolling, yoy)
+
+
+@router.put("/status", response_model=StatusInstalacaoBulkResponse)
+async def update_installations_status(
+    status_update: StatusInstalacaoBulkUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Set the same status on many installations in one transaction.
+    One history row is inserted per existing installation (a single
+    INSERT ... SELECT); unknown ids are reported and skipped.
+    """
+    ids = list(dict.fromkeys(status_update.ids))
+    
+    result = await db.execute(text("""
+        INSERT INTO status_instalacao (id_instalacao, status, usuario, observacoes)
+        SELECT i.id_instalacao, :status, :usuario, :observacoes
+        FROM instalacoes i
+        WHERE i.id_instalacao = ANY(:ids)
+        RETURNING id_instalacao
+    """), {
+        "ids": ids,
+        "status": status_update.status,
+        "usuario": status_update.usuario,
+        "observacoes": status_update.observacoes
+    })
+    updated = {row.id_instalacao for row in result}
+    await db.commit()
+    
+    return StatusInstalacaoBulkResponse(
+        atualizadas=len(updated),
+        nao_encontradas=[i for i in ids if i not in updated]
+    )
+
+
+@router.post("/status/lookup", response_model=List[StatusInstalacaoResponse])
+async def get_installations_current_status(
+    lookup: StatusInstalacaoLookup,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Current status of many installations (e.g. to color map markers).
+    Installations without any status are omitted.
+    """
+    result = await db.execute(
+        select(StatusAtualInstalacao).where(StatusAtualInstalacao.id_instalacao.in_(lookup.ids))
+    )
+    return result.scalars().all()
+
+
+@router.get("/{id_instalacao}/full", response_model=InstalacaoFullResponse)
+async def get_installation_full(
+    id_instalacao: str,
+    consumption_limit: int = Query(12, ge=0, le=240),
+    notes_limit: int = Query(20, ge=0, le=200),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Everything the installation popup needs in one request: details, last
+    consumption_limit months of consumption, frauds, last notes_limit
+    service notes and current status.
+    """
+    result = await _get_installations_full(db, [id_instalacao], consumption_limit, notes_limit)
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="Installation not found")
+    
+    return result[0]
 
 
 @router.get("/{id_instalacao}", response_model=InstalacaoDetailResponse)
-async def get_installation_details(id_instalacao: str, db: Session = Depends(get_db)):
+async def get_installation_details(id_instalacao: str, db: AsyncSession = Depends(get_async_db)):
     """
     Get detailed information about a specific installation.
     """
-    instalacao = db.query(Instalacao).filter(Instalacao.id_instalacao == id_instalacao).first()
+    instalacao = await db.get(Instalacao, id_instalacao)
     
     if not instalacao:
         raise HTTPException(status_code=404, detail="Installation not found")
@@ -36,32 +285,54 @@ async def get_installation_details(id_instalacao: str, db: Session = Depends(get
 async def get_installation_consumption(
     id_instalacao: str, 
     limit: int = 12,  # Default to last 12 months
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get consumption history for an installation.
     Returns most recent records first.
     """
-    consumo = db.query(HistoricoConsumo).filter(
-        HistoricoConsumo.id_instalacao == id_instalacao
-    ).order_by(
-        desc(HistoricoConsumo.data_referencia)
-    ).limit(limit).all()
+    result = await db.execute(
+        select(HistoricoConsumo).where(
+            HistoricoConsumo.id_instalacao == id_instalacao
+        ).order_by(
+            desc(HistoricoConsumo.data_referencia)
+        ).limit(limit)
+    )
+    consumo = result.scalars().all()
     
     # Reverse to show chronologically
     return list(reversed(consumo))
 
 
+@router.get("/{id_instalacao}/consumption/series", response_model=ConsumoSeriesResponse)
+async def get_installation_consumption_series(
+    id_instalacao: str,
+    freq: Literal['month', 'quarter', 'year'] = Query('month', description="Resampling period"),
+    start: Optional[date] = Query(None, description="First data_referencia included"),
+    end: Optional[date] = Query(None, description="Last data_referencia included"),
+    rolling: int = Query(0, ge=0, le=60, description="Rolling mean/std window in periods (0 = off)"),
+    yoy: bool = Query(False, description="Include year-over-year deltas"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Consumption time series of one installation (see POST /consumption/series).
+    """
+    return await _get_consumption_series(db, [id_instalacao], freq, start, end, rolling, yoy)
+
+
 @router.get("/{id_instalacao}/frauds", response_model=List[FraudeResponse])
-async def get_installation_frauds(id_instalacao: str, db: Session = Depends(get_db)):
+async def get_installation_frauds(id_instalacao: str, db: AsyncSession = Depends(get_async_db)):
     """
     Get fraud history for an installation.
     """
-    fraudes = db.query(Fraude).filter(
-        Fraude.id_instalacao == id_instalacao
-    ).order_by(
-        desc(Fraude.data_fraude)
-    ).all()
+    result = await db.execute(
+        select(Fraude).where(
+            Fraude.id_instalacao == id_instalacao
+        ).order_by(
+            desc(Fraude.data_fraude)
+        )
+    )
+    fraudes = result.scalars().all()
     
     return fraudes
 
@@ -70,16 +341,19 @@ async def get_installation_frauds(id_instalacao: str, db: Session = Depends(get_
 async def get_installation_service_notes(
     id_instalacao: str, 
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get service notes for an installation.
     """
-    notas = db.query(NotaServico).filter(
-        NotaServico.id_instalacao == id_instalacao
-    ).order_by(
-        desc(NotaServico.data_nota)
-    ).limit(limit).all()
+    result = await db.execute(
+        select(NotaServico).where(
+            NotaServico.id_instalacao == id_instalacao
+        ).order_by(
+            desc(NotaServico.data_nota)
+        ).limit(limit)
+    )
+    notas = result.scalars().all()
     
     return notas
 
@@ -88,14 +362,14 @@ async def get_installation_service_notes(
 async def update_installation_status(
     id_instalacao: str,
     status_update: StatusInstalacaoUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update the status of an installation.
     Creates a new status record (maintains history).
     """
     # Verify installation exists
-    instalacao = db.query(Instalacao).filter(Instalacao.id_instalacao == id_instalacao).first()
+    instalacao = await db.get(Instalacao, id_instalacao)
     if not instalacao:
         raise HTTPException(status_code=404, detail="Installation not found")
     
@@ -108,22 +382,19 @@ async def update_installation_status(
     )
     
     db.add(new_status)
-    db.commit()
-    db.refresh(new_status)
+    await db.commit()
+    await db.refresh(new_status)
     
     return new_status
 
 
 @router.get("/{id_instalacao}/status", response_model=StatusInstalacaoResponse)
-async def get_installation_current_status(id_instalacao: str, db: Session = Depends(get_db)):
+async def get_installation_current_status(id_instalacao: str, db: AsyncSession = Depends(get_async_db)):
     """
     Get the current (most recent) status of an installation.
+    Primary-key lookup in the status_atual_instalacao projection.
     """
-    status = db.query(StatusInstalacao).filter(
-        StatusInstalacao.id_instalacao == id_instalacao
-    ).order_by(
-        desc(StatusInstalacao.data_atualizacao)
-    ).first()
+    status = await db.get(StatusAtualInstalacao, id_instalacao)
     
     if not status:
         raise HTTPException(status_code=404, detail="No status found for this installation")
@@ -1,16 +1,280 @@
 """
 API Routes for Queries (Main and Auxiliary)
 """
-from fastapi import APIRouter, Depends, Query as QueryParam
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Optional
-from database import get_db
-from models import QueryPrincipal, QueryAuxiliar, ResultadoQueryPrincipal, ResultadoQueryAuxiliar, Instalacao
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query as QueryParam
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
+from typing import AsyncIterator, List, Literal, Optional
+from database import DB_POOL_SIZE, async_engine, get_async_db
+from models import QueryPrincipal, QueryAuxiliar, ResultadoQueryPrincipal, ResultadoQueryAuxiliar, Instalacao, VersaoResultadoPrincipal
 from schemas import QueryPrincipalResponse, QueryAuxiliarResponse, QueryResultResponse
+from responses import RawJSONResponse
+from cache import CachedResponse, result_cache, is_not_modified, validator_headers
+from compression import add_vary, precompressed_response
+from metrics import InstrumentedRoute, record_rows
+from density import build_density_grid
+from area_filter import AreaError, resolve_area
+from columnar import ENCODERS, ARROW_MEDIA_TYPE, arrow_available, negotiate_format
+import asyncio
+import base64
 import json
+import os
+from decimal import Decimal, InvalidOperation
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
+
+# Main query results are clustered at or below this zoom level
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", 12))
+# Approximate on-screen size (pixels) of one cluster grid cell
+CLUSTER_CELL_PX = int(os.getenv("CLUSTER_CELL_PX", 64))
+
+# Mapbox Vector Tile settings
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+TILE_CACHE_CONTROL = f"public, max-age={int(os.getenv('TILE_MAX_AGE', 300))}"
+
+# Rows fetched per round trip from the server-side cursor when streaming
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 2000))
+# Streamed responses hold an async pool connection while the client
+# downloads: at most this many per worker (kept below the pool size so
+# regular requests still get connections)
+STREAM_MAX_CONCURRENT = int(os.getenv("STREAM_MAX_CONCURRENT", max(1, DB_POOL_SIZE - 1)))
+# Seconds a request waits for a stream slot before answering 503
+STREAM_QUEUE_TIMEOUT = float(os.getenv("STREAM_QUEUE_TIMEOUT", 10))
+# Seconds one chunk may take to reach the client before the stream is aborted
+STREAM_SEND_TIMEOUT = float(os.getenv("STREAM_SEND_TIMEOUT", 30))
+
+_stream_slots = asyncio.Semaphore(STREAM_MAX_CONCURRENT)
+
+# Ranked listing (order_by=score): maximum page size
+RANKED_MAX_LIMIT = int(os.getenv("RANKED_MAX_LIMIT", 1000))
+
+# Current installation statuses accepted by the status= filter
+INSTALLATION_STATUSES = ("selecionado", "nao_selecionado", "verificar")
+NO_STATUS = "sem_status"
+
+# Heatmap density grid (format=grid)
+GRID_MAX_CELLS = int(os.getenv("GRID_MAX_CELLS", 256))  # cells along the longest side
+GRID_CELL_PX = int(os.getenv("GRID_CELL_PX", 4))  # on-screen cell size when zoom is given
+GRID_SIGMA_CELLS = float(os.getenv("GRID_SIGMA_CELLS", 2.0))  # kernel bandwidth
+# Weight of a result without intensidade: the default the client-side
+# heatmap (Heatmap.jsx, `intensidade || 0.5`) applies to the same points,
+# so the server grid matches what the map showed before
+GRID_MISSING_WEIGHT = 0.5
+
+
+def _check_tile_coordinates(z: int, x: int, y: int):
+    """
+    Validate z/x/y against the XYZ tiling scheme.
+    """
+    if z < 0 or z > 22 or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+
+
+# Feature properties available to fields= (name -> SQL expression).
+# Query-level values (query_id, query_nome, query_cor, tipo_retorno) are only
+# sent once, in the response metadata.
+MAIN_PROPERTIES = {
+    "id_instalacao": "i.id_instalacao",
+    "municipio": "i.municipio",
+    "classe_tarifaria": "i.classe_tarifaria",
+    "tipo_alvo": "r.tipo_alvo",
+    "score": "r.score::float8",
+}
+
+# Multi-query overlay: one feature per installation (m = aggregated results)
+OVERLAY_PROPERTIES = {
+    "id_instalacao": "i.id_instalacao",
+    "municipio": "i.municipio",
+    "classe_tarifaria": "i.classe_tarifaria",
+    "query_ids": "m.query_ids",
+    "scores": "m.scores",
+    "tipos_alvo": "m.tipos_alvo",
+}
+
+AUXILIARY_PROPERTIES = {
+    "id_instalacao": "i.id_instalacao",
+    "municipio": "i.municipio",
+    "classe_tarifaria": "i.classe_tarifaria",
+    "intensidade": "r.intensidade::float8",
+}
+
+
+def _select_fields(properties: dict, fields: Optional[str]) -> List[str]:
+    """
+    Validate a comma-separated fields= projection (all properties when empty).
+    Raises ValueError on unknown field names.
+    """
+    requested = [name.strip() for name in (fields or "").split(",") if name.strip()]
+    unknown = [name for name in requested if name not in properties]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return [name for name in properties if not requested or name in requested]
+
+
+def _feature_sql(properties: dict, selected: List[str]) -> str:
+    """
+    GeoJSON Feature built by PostGIS for one result row, selecting only
+    the projected property columns.
+    """
+    pairs = ", ".join(f"'{name}', {properties[name]}" for name in selected)
+    return f"""
+    json_build_object(
+        'type', 'Feature',
+        'geometry', ST_AsGeoJSON(i.geom)::json,
+        'properties', json_build_object({pairs})
+    )
+"""
+
+
+async def _feature_collection_response(db: AsyncSession, feature_sql: str, from_sql: str, params: dict, metadata: dict, stream: bool = False):
+    """
+    Return a GeoJSON FeatureCollection whose features are serialized by
+    PostGIS, either aggregated with json_agg in a single row or streamed.
+    Python only splices the metadata around the pre-built JSON text.
+    """
+    if stream:
+        sql = text(f"SELECT {feature_sql}::text AS feature {from_sql}")
+        try:
+            await asyncio.wait_for(_stream_slots.acquire(), STREAM_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Too many streamed responses, try again later")
+        return _stream_feature_collection(sql, params, metadata)
+    
+    sql = text(f"""
+        SELECT 
+            COALESCE(json_agg(f.feature), '[]'::json)::text AS features,
+            COUNT(*) AS total
+        FROM (SELECT {feature_sql} AS feature {from_sql}) f
+    """)
+    row = (await db.execute(sql, params)).fetchone()
+    
+    body = (
+        '{"type": "FeatureCollection", "features": ' + row.features
+        + ', "metadata": ' + json.dumps({**metadata, "total_results": row.total}) + '}'
+    )
+    return RawJSONResponse(content=body)
+
+
+class _SlotStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that releases its stream slot when done and aborts
+    when the client takes longer than STREAM_SEND_TIMEOUT to take a chunk.
+    """
+
+    async def __call__(self, scope, receive, send):
+        async def timed_send(message):
+            await asyncio.wait_for(send(message), STREAM_SEND_TIMEOUT)
+
+        try:
+            await super().__call__(scope, receive, timed_send)
+        finally:
+            # Close the generator now (returns its connection to the pool)
+            await self.body_iterator.aclose()
+            _stream_slots.release()
+
+
+def _stream_feature_collection(sql, params: dict, metadata: dict) -> StreamingResponse:
+    """
+    Stream a GeoJSON FeatureCollection from a server-side cursor.
+    
+    Rows are fetched STREAM_CHUNK_SIZE at a time and written out as they
+    arrive, so peak memory is bounded by the chunk size instead of the number
+    of results. metadata (plus total_results) is written after the features.
+    The generator uses its own connection because the request session is
+    closed before the response body is sent; the caller has acquired one of
+    the STREAM_MAX_CONCURRENT slots, released when the response ends.
+    """
+    async def generate() -> AsyncIterator[bytes]:
+        total = 0
+        yield b'{"type": "FeatureCollection", "features": ['
+        async with async_engine.connect() as conn:
+            result = await conn.stream(
+                sql, params,
+                execution_options={"yield_per": STREAM_CHUNK_SIZE}
+            )
+            async for rows in result.partitions(STREAM_CHUNK_SIZE):
+                chunk = ", ".join(row.feature for row in rows)
+                yield (", " if total else "").encode() + chunk.encode()
+                total += len(rows)
+                record_rows(len(rows))
+        yield b'], "metadata": ' + json.dumps({**metadata, "total_results": total}).encode() + b'}'
+    
+    return _SlotStreamingResponse(generate(), media_type="application/json")
+
+
+async def _cached_main_response(db: AsyncSession, request: Request, query: QueryPrincipal, variant: str, build, cache_control: str = "no-cache", cacheable: bool = True, vary: tuple = ()) -> Response:
+    """
+    Serve a main query response from the result cache.
+    
+    The key combines the query, its current result version (bumped by the
+    resultado_queries_principais trigger on every reload) and the request
+    variant. The same key is exposed as ETag so clients can revalidate with
+    If-None-Match / If-Modified-Since and receive a 304 without a query.
+    build() is only called on a cache miss and must return an awaitable
+    resolving to a Response. With cacheable=False the response is always
+    built (for filters that do not follow the result version). vary lists
+    request headers, besides Accept-Encoding, that select the representation.
+    """
+    return await _cached_queries_response(db, request, [query], variant, build, cache_control, cacheable, vary)
+
+
+async def _cached_queries_response(db: AsyncSession, request: Request, queries: List[QueryPrincipal], variant: str, build, cache_control: str = "no-cache", cacheable: bool = True, vary: tuple = ()) -> Response:
+    """
+    Same as _cached_main_response for a response covering several main
+    queries: the key uses the sum of their result versions (each version
+    only grows, so any reload changes the sum).
+    """
+    if not cacheable:
+        response = await build()
+        for field in vary:
+            add_vary(response.headers, field)
+        return response
+    
+    ids = [query.id_query for query in queries]
+    versions = (await db.execute(
+        select(VersaoResultadoPrincipal).where(VersaoResultadoPrincipal.id_query.in_(ids))
+    )).scalars().all()
+    versao = sum(version.versao for version in versions)
+    last_modified = max((version.atualizado_em for version in versions), default=None)
+    
+    names = "|".join(f"{query.nome}|{query.cor}" for query in queries)
+    key = result_cache.make_key("+".join(str(i) for i in ids), versao, f"{names}|{variant}")
+    etag = result_cache.make_etag(key)
+    headers = validator_headers(etag, last_modified, cache_control)
+    # Same Vary on the 200 and the 304
+    headers["Vary"] = ", ".join(("Accept-Encoding", *vary))
+    
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    
+    cached = await result_cache.get(key)
+    if cached is None:
+        response = await build()
+        cached = CachedResponse(response.body, response.media_type, etag, last_modified)
+        await result_cache.set(key, cached)
+    
+    return await precompressed_response(request, result_cache, key, cached, headers)
+
+
+def _mvt_response(tile) -> Response:
+    """
+    Wrap ST_AsMVT output as a cacheable binary response.
+    """
+    return Response(
+        content=bytes(tile) if tile else b"",
+        media_type=MVT_MEDIA_TYPE,
+        headers={"Cache-Control": TILE_CACHE_CONTROL}
+    )
+
+
+async def _build_tile(db: AsyncSession, sql, params: dict) -> Response:
+    """
+    Execute an ST_AsMVT query and wrap the tile.
+    """
+    return _mvt_response((await db.execute(sql, params)).scalar())
 
 
 # ============================================
@@ -18,107 +282,499 @@ router = APIRouter()
 # ============================================
 
 @router.get("/main", response_model=List[QueryPrincipalResponse])
-async def get_main_queries(db: Session = Depends(get_db)):
+async def get_main_queries(db: AsyncSession = Depends(get_async_db)):
     """
     Get all active main queries.
     Main queries return statewide installation targets.
     """
-    queries = db.query(QueryPrincipal).filter(QueryPrincipal.ativa == True).all()
+    result = await db.execute(select(QueryPrincipal).where(QueryPrincipal.ativa == True))
+    queries = result.scalars().all()
     return queries
 
 
+def _parse_bounds(bounds: Optional[str]) -> Optional[dict]:
+    """
+    Parse a "minLng,minLat,maxLng,maxLat" string into SQL parameters.
+    Invalid bounds are ignored (returns None).
+    """
+    if not bounds:
+        return None
+    try:
+        min_lng, min_lat, max_lng, max_lat = map(float, bounds.split(","))
+    except ValueError:
+        return None
+    return {
+        "min_lng": min_lng,
+        "min_lat": min_lat,
+        "max_lng": max_lng,
+        "max_lat": max_lat
+    }
+
+
+def _status_filter(status: Optional[str]) -> tuple:
+    """
+    SQL condition on the current status of installation i, read from the
+    status_atual_instalacao projection (primary-key semi-join).
+    NO_STATUS matches installations that were never assessed.
+    Raises ValueError on unknown statuses.
+    """
+    requested = [value.strip() for value in (status or "").split(",") if value.strip()]
+    if not requested:
+        return "", {}
+    unknown = [value for value in requested if value not in INSTALLATION_STATUSES + (NO_STATUS,)]
+    if unknown:
+        raise ValueError(f"Unknown status: {', '.join(unknown)}")
+    
+    has_status = "EXISTS (SELECT 1 FROM status_atual_instalacao sa WHERE sa.id_instalacao = i.id_instalacao AND sa.status = ANY(:status_filter))"
+    if NO_STATUS in requested:
+        no_status = "NOT EXISTS (SELECT 1 FROM status_atual_instalacao sa WHERE sa.id_instalacao = i.id_instalacao)"
+        return f"AND ({has_status} OR {no_status})", {"status_filter": requested}
+    return f"AND {has_status}", {"status_filter": requested}
+
+
+def _cluster_cell_size(zoom: int) -> float:
+    """
+    Grid cell size in degrees for a given web map zoom level.
+    One cell covers roughly CLUSTER_CELL_PX screen pixels, so the number of
+    clusters in a viewport stays constant regardless of dataset size.
+    """
+    return 360.0 / (2 ** zoom) * CLUSTER_CELL_PX / 256.0
+
+
+@router.get("/main/results", response_model=QueryResultResponse)
+async def get_main_queries_results(
+    request: Request,
+    ids: str = QueryParam(..., description="Comma-separated main query ids, e.g. 1,2,5"),
+    bounds: Optional[str] = QueryParam(None, description="Bounding box: minLng,minLat,maxLng,maxLat"),
+    stream: bool = QueryParam(False, description="Stream the FeatureCollection incrementally (bounded memory for large results)"),
+    fields: Optional[str] = QueryParam(None, description="Comma-separated feature properties to return (default: all)"),
+    status: Optional[str] = QueryParam(None, description="Comma-separated current statuses to keep: selecionado, nao_selecionado, verificar, sem_status"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the results of several main queries in one call (map overlay).
+    
+    Runs a single query with id_query = ANY(:ids). Installations matched by
+    several queries are returned once, with the matching query_ids and the
+    corresponding scores/tipos_alvo (aligned arrays, ordered by query id).
+    metadata.queries has name, color and result count of each query.
+    """
+    try:
+        query_ids = sorted({int(value) for value in ids.split(",") if value.strip()})
+    except ValueError:
+        return QueryResultResponse(features=[], metadata={"error": "Invalid ids"})
+    if not query_ids:
+        return QueryResultResponse(features=[], metadata={"error": "Invalid ids"})
+    
+    try:
+        selected = _select_fields(OVERLAY_PROPERTIES, fields)
+    except ValueError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    
+    queries = (await db.execute(
+        select(QueryPrincipal).where(QueryPrincipal.id_query.in_(query_ids)).order_by(QueryPrincipal.id_query)
+    )).scalars().all()
+    if not queries:
+        return QueryResultResponse(features=[], metadata={"error": "Query not found"})
+    
+    found_ids = [query.id_query for query in queries]
+    params = {"ids": found_ids}
+    filter_sql = ""
+    
+    bbox_params = _parse_bounds(bounds)
+    if bbox_params:
+        filter_sql = "AND i.geom && ST_MakeEnvelope(:min_lng, :min_lat, :max_lng, :max_lat, 4326)"
+        params.update(bbox_params)
+    
+    try:
+        status_sql, status_params = _status_filter(status)
+    except ValueError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    filter_sql += status_sql
+    params.update(status_params)
+    # Status changes do not bump the result version: filtered responses are not cached
+    cacheable = not status_sql
+    
+    # One row per installation with every matching query
+    from_sql = f"""
+        FROM (
+            SELECT 
+                r.id_instalacao,
+                array_agg(r.id_query ORDER BY r.id_query) as query_ids,
+                array_agg(r.score::float8 ORDER BY r.id_query) as scores,
+                array_agg(r.tipo_alvo ORDER BY r.id_query) as tipos_alvo
+            FROM resultado_queries_principais r
+            WHERE r.id_query = ANY(:ids)
+            GROUP BY r.id_instalacao
+        ) m
+        JOIN instalacoes i ON i.id_instalacao = m.id_instalacao
+        WHERE TRUE
+        {filter_sql}
+    """
+    
+    async def build() -> Response:
+        counts = await db.execute(text(f"""
+            SELECT r.id_query, COUNT(*) as total
+            FROM resultado_queries_principais r
+            JOIN instalacoes i ON i.id_instalacao = r.id_instalacao
+            WHERE r.id_query = ANY(:ids)
+            {filter_sql}
+            GROUP BY r.id_query
+        """), params)
+        totals = {row.id_query: row.total for row in counts}
+        metadata = {
+            "query_ids": found_ids,
+            "missing_ids": [i for i in query_ids if i not in found_ids],
+            "queries": [
+                {
+                    "query_id": query.id_query,
+                    "query_nome": query.nome,
+                    "query_cor": query.cor,
+                    "total_results": totals.get(query.id_query, 0)
+                }
+                for query in queries
+            ],
+            "fields": selected
+        }
+        return await _feature_collection_response(db, _feature_sql(OVERLAY_PROPERTIES, selected), from_sql, params, metadata, stream)
+    
+    if stream:
+        return await build()
+    
+    bbox_variant = ",".join(str(v) for v in bbox_params.values()) if bbox_params else ""
+    return await _cached_queries_response(db, request, queries, f"overlay|{bbox_variant}|{','.join(selected)}", build, cacheable=cacheable)
+
+
 @router.get("/main/{query_id}/results", response_model=QueryResultResponse)
 async def get_main_query_results(
     query_id: int,
+    request: Request,
     bounds: Optional[str] = QueryParam(None, description="Bounding box: minLng,minLat,maxLng,maxLat"),
-    db: Session = Depends(get_db)
+    zoom: Optional[int] = QueryParam(None, ge=0, le=22, description="Map zoom level. At or below CLUSTER_MAX_ZOOM results are aggregated into clusters"),
+    stream: bool = QueryParam(False, description="Stream the FeatureCollection incrementally (bounded memory for large results)"),
+    fields: Optional[str] = QueryParam(None, description="Comma-separated feature properties to return (default: all)"),
+    order_by: Optional[Literal['score']] = QueryParam(None, description="'score' returns a ranked page (highest score first)"),
+    limit: int = QueryParam(100, ge=1, le=RANKED_MAX_LIMIT, description="Page size for order_by=score"),
+    after: Optional[str] = QueryParam(None, description="Cursor from metadata.next_after of the previous page"),
+    status: Optional[str] = QueryParam(None, description="Comma-separated current statuses to keep: selecionado, nao_selecionado, verificar, sem_status"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get installation results for a specific main query.
     Returns GeoJSON FeatureCollection.
     
     Optional bounds parameter for viewport optimization (reduce data transfer).
+    Optional zoom parameter: at low zoom levels installations are aggregated
+    server-side into grid clusters instead of individual points.
+    Optional stream parameter: features are written as they are read from a
+    server-side cursor instead of being materialized in memory.
+    Optional fields parameter: only the listed properties are selected and
+    serialized (e.g. fields=id_instalacao,score). Query name/color are
+    returned once in metadata, not per feature.
+    
+    Non-streamed responses are cached per result version and carry
+    ETag/Last-Modified for conditional requests.
+    
+    Ranked mode (order_by=score): the next `limit` scored targets after the
+    `after` cursor, highest score first, using keyset pagination on
+    idx_resultado_qp_ranking (constant cost per page). metadata.next_after
+    is the cursor of the following page (null on the last page).
+    
+    Columnar output is selected with the Accept header
+    (application/vnd.sasi.columnar or application/vnd.apache.arrow.stream):
+    individual points as parallel typed arrays, never clustered or streamed.
     """
+    binary_format = negotiate_format(request.headers.get("accept"))
+    if binary_format == ARROW_MEDIA_TYPE and not arrow_available():
+        raise HTTPException(status_code=406, detail="Arrow output is not available (pyarrow not installed)")
+    
     # Get query info
-    query = db.query(QueryPrincipal).filter(QueryPrincipal.id_query == query_id).first()
+    query = await db.get(QueryPrincipal, query_id)
     if not query:
         return QueryResultResponse(features=[], metadata={"error": "Query not found"})
     
-    # Build query with spatial filtering - NOW including tipo_alvo from results
-    sql = text("""
+    params = {"query_id": query_id}
+    filter_sql = ""
+    
+    # Add bounding box filter if provided
+    bbox_params = _parse_bounds(bounds)
+    if bbox_params:
+        filter_sql = "AND i.geom && ST_MakeEnvelope(:min_lng, :min_lat, :max_lng, :max_lat, 4326)"
+        params.update(bbox_params)
+    
+    try:
+        status_sql, status_params = _status_filter(status)
+    except ValueError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    filter_sql += status_sql
+    params.update(status_params)
+    # Status changes do not bump the result version: filtered responses are not cached
+    cacheable = not status_sql
+    
+    bbox_variant = ",".join(str(v) for v in bbox_params.values()) if bbox_params else ""
+    
+    if order_by == "score":
+        try:
+            selected = _select_fields(MAIN_PROPERTIES, fields)
+            cursor = _decode_cursor(after) if after else None
+        except ValueError as exc:
+            return QueryResultResponse(features=[], metadata={"error": str(exc)})
+        return await _cached_main_response(
+            db, request, query, f"ranked|{limit}|{after or ''}|{bbox_variant}|{','.join(selected)}",
+            lambda: _get_ranked_page(db, query, selected, filter_sql, params, limit, cursor),
+            cacheable=cacheable
+        )
+    
+    # Below this point the representation depends on the Accept header
+    if binary_format:
+        return await _cached_main_response(
+            db, request, query, f"{binary_format}|{bbox_variant}",
+            lambda: _get_main_query_columns(db, query, binary_format, filter_sql, params),
+            cacheable=cacheable, vary=("Accept",)
+        )
+    
+    if zoom is not None and zoom <= CLUSTER_MAX_ZOOM:
+        return await _cached_main_response(
+            db, request, query, f"clusters|{zoom}|{bbox_variant}",
+            lambda: _get_main_query_clusters(db, query, zoom, filter_sql, params),
+            cacheable=cacheable, vary=("Accept",)
+        )
+    
+    try:
+        selected = _select_fields(MAIN_PROPERTIES, fields)
+    except ValueError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    feature_sql = _feature_sql(MAIN_PROPERTIES, selected)
+    
+    # Spatial filtering - tipo_alvo comes from results
+    from_sql = f"""
+        FROM instalacoes i
+        JOIN resultado_queries_principais r ON i.id_instalacao = r.id_instalacao
+        WHERE r.id_query = :query_id
+        {filter_sql}
+    """
+    
+    metadata = {
+        "query_id": query_id,
+        "query_nome": query.nome,
+        "query_cor": query.cor,
+        "fields": selected
+    }
+    
+    if stream:
+        return await _feature_collection_response(db, feature_sql, from_sql, params, metadata, stream=True)
+    
+    return await _cached_main_response(
+        db, request, query, f"geojson|{bbox_variant}|{','.join(selected)}",
+        lambda: _feature_collection_response(db, feature_sql, from_sql, params, metadata),
+        cacheable=cacheable, vary=("Accept",)
+    )
+
+
+def _encode_cursor(score: str, id_instalacao: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, id_instalacao]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(after: str) -> tuple:
+    """
+    Decode an `after` cursor into (score, id_instalacao).
+    """
+    try:
+        score, id_instalacao = json.loads(base64.urlsafe_b64decode(after.encode("ascii")))
+        return Decimal(str(score)), str(id_instalacao)
+    except (ValueError, TypeError, UnicodeError, InvalidOperation):
+        raise ValueError("Invalid after cursor")
+
+
+async def _get_ranked_page(db: AsyncSession, query: QueryPrincipal, selected: List[str], filter_sql: str, params: dict, limit: int, cursor: Optional[tuple]) -> RawJSONResponse:
+    """
+    One page of scored results, highest score first (ties by id_instalacao).
+    The row comparison matches the idx_resultado_qp_ranking order, so each
+    page is a single index range scan of `limit` entries.
+    """
+    params = {**params, "limit": limit}
+    after_filter = ""
+    if cursor:
+        after_filter = "AND (r.score, r.id_instalacao) < (CAST(:after_score AS numeric), CAST(:after_id AS varchar))"
+        params.update({"after_score": cursor[0], "after_id": cursor[1]})
+    
+    sql = text(f"""
+        SELECT 
+            {_feature_sql(MAIN_PROPERTIES, selected)}::text AS feature,
+            r.score::text AS score,
+            r.id_instalacao
+        FROM resultado_queries_principais r
+        JOIN instalacoes i ON i.id_instalacao = r.id_instalacao
+        WHERE r.id_query = :query_id
+        AND r.score IS NOT NULL
+        {after_filter}
+        {filter_sql}
+        ORDER BY r.score DESC NULLS LAST, r.id_instalacao DESC
+        LIMIT :limit
+    """)
+    rows = (await db.execute(sql, params)).fetchall()
+    
+    next_after = _encode_cursor(rows[-1].score, rows[-1].id_instalacao) if len(rows) == limit else None
+    metadata = {
+        "query_id": query.id_query,
+        "query_nome": query.nome,
+        "query_cor": query.cor,
+        "fields": selected,
+        "order_by": "score",
+        "limit": limit,
+        "total_results": len(rows),
+        "next_after": next_after
+    }
+    body = (
+        '{"type": "FeatureCollection", "features": [' + ", ".join(row.feature for row in rows)
+        + '], "metadata": ' + json.dumps(metadata) + '}'
+    )
+    return RawJSONResponse(content=body)
+
+
+async def _get_main_query_columns(db: AsyncSession, query: QueryPrincipal, media_type: str, filter_sql: str, params: dict) -> Response:
+    """
+    Main query results as parallel columns (see columnar.py for the layouts).
+    """
+    sql = text(f"""
         SELECT 
             i.id_instalacao,
-            i.municipio,
-            i.classe_tarifaria,
-            i.latitude,
-            i.longitude,
-            ST_AsGeoJSON(i.geom) as geom_json,
-            r.tipo_alvo,
-            r.score
+            ST_X(i.geom) as lon,
+            ST_Y(i.geom) as lat,
+            r.score::float8 as score,
+            r.tipo_alvo
         FROM instalacoes i
         JOIN resultado_queries_principais r ON i.id_instalacao = r.id_instalacao
         WHERE r.id_query = :query_id
+        {filter_sql}
     """)
+    rows = (await db.execute(sql, params)).fetchall()
     
-    params = {"query_id": query_id}
+    metadata = {
+        "query_id": query.id_query,
+        "query_nome": query.nome,
+        "query_cor": query.cor,
+        "total_results": len(rows)
+    }
+    return Response(content=ENCODERS[media_type](rows, metadata), media_type=media_type)
+
+
+async def _get_main_query_clusters(db: AsyncSession, query: QueryPrincipal, zoom: int, filter_sql: str, params: dict) -> RawJSONResponse:
+    """
+    Aggregate main query results into a regular lon/lat grid computed in PostGIS.
+    Each cluster is a Point feature at the centroid of its installations with
+    count, max/avg score and the tipo_alvo breakdown.
+    """
+    cell_size = _cluster_cell_size(zoom)
+    
+    sql = text(f"""
+        SELECT 
+            ST_AsGeoJSON(ST_Centroid(ST_Collect(i.geom))) as geom_json,
+            COUNT(*) as total,
+            MAX(r.score) as score_max,
+            AVG(r.score) as score_avg,
+            COUNT(*) FILTER (WHERE r.tipo_alvo = 'forte') as total_forte,
+            COUNT(*) FILTER (WHERE r.tipo_alvo = 'regular') as total_regular
+        FROM instalacoes i
+        JOIN resultado_queries_principais r ON i.id_instalacao = r.id_instalacao
+        WHERE r.id_query = :query_id
+        {filter_sql}
+        GROUP BY floor(ST_X(i.geom) / :cell_size), floor(ST_Y(i.geom) / :cell_size)
+    """)
+    
+    results = (await db.execute(sql, {**params, "cell_size": cell_size})).fetchall()
     
-    # Add bounding box filter if provided
-    if bounds:
-        try:
-            min_lng, min_lat, max_lng, max_lat = map(float, bounds.split(","))
-            sql = text("""
-                SELECT 
-                    i.id_instalacao,
-                    i.municipio,
-                    i.classe_tarifaria,
-                    i.latitude,
-                    i.longitude,
-                    ST_AsGeoJSON(i.geom) as geom_json,
-                    r.tipo_alvo,
-                    r.score
-                FROM instalacoes i
-                JOIN resultado_queries_principais r ON i.id_instalacao = r.id_instalacao
-                WHERE r.id_query = :query_id
-                AND i.geom && ST_MakeEnvelope(:min_lng, :min_lat, :max_lng, :max_lat, 4326)
-            """)
-            params.update({
-                "min_lng": min_lng,
-                "min_lat": min_lat,
-                "max_lng": max_lng,
-                "max_lat": max_lat
-            })
-        except ValueError:
-            pass  # Invalid bounds, ignore
-    
-    results = db.execute(sql, params).fetchall()
-    
-    # Convert to GeoJSON features
     features = []
+    total_results = 0
     for row in results:
+        total_results += row.total
         feature = {
             "type": "Feature",
             "geometry": json.loads(row.geom_json),
             "properties": {
-                "id_instalacao": row.id_instalacao,
-                "municipio": row.municipio,
-                "classe_tarifaria": row.classe_tarifaria,
-                "tipo_alvo": row.tipo_alvo,  # From result, not query
-                "score": float(row.score) if row.score else None,
-                "query_id": query_id,
-                "query_nome": query.nome,
-                "query_cor": query.cor  # NEW: include query color
+                "cluster": True,
+                "point_count": row.total,
+                "score_max": float(row.score_max) if row.score_max is not None else None,
+                "score_avg": round(float(row.score_avg), 2) if row.score_avg is not None else None,
+                "tipo_alvo": {
+                    "forte": row.total_forte,
+                    "regular": row.total_regular
+                }
             }
         }
         features.append(feature)
     
-    return QueryResultResponse(
-        features=features,
-        metadata={
-            "query_id": query_id,
+    return RawJSONResponse(content=json.dumps({
+        "type": "FeatureCollection",
+        "features": features,
+        "metadata": {
+            "query_id": query.id_query,
             "query_nome": query.nome,
             "query_cor": query.cor,
-            "total_results": len(features)
+            "mode": "clusters",
+            "zoom": zoom,
+            "cell_size": cell_size,
+            "total_clusters": len(features),
+            "total_results": total_results
         }
+    }))
+
+
+@router.get("/main/{query_id}/tiles/{z}/{x}/{y}.pbf")
+async def get_main_query_tile(
+    query_id: int,
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get main query results as a Mapbox Vector Tile (layer "instalacoes").
+    Tiles are addressed by z/x/y so browsers and proxies can cache them;
+    they are also cached server-side per result version.
+    """
+    _check_tile_coordinates(z, x, y)
+    
+    query = await db.get(QueryPrincipal, query_id)
+    if not query:
+        raise HTTPException(status_code=404, detail="Query not found")
+    
+    sql = text("""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+        ),
+        mvtgeom AS (
+            SELECT 
+                ST_AsMVTGeom(ST_Transform(i.geom, 3857), bounds.geom, :extent, :buffer, true) AS geom,
+                i.id_instalacao,
+                i.municipio,
+                i.classe_tarifaria,
+                r.tipo_alvo,
+                r.score::float8 AS score
+            FROM instalacoes i
+            JOIN resultado_queries_principais r ON i.id_instalacao = r.id_instalacao
+            CROSS JOIN bounds
+            WHERE r.id_query = :query_id
+            AND i.geom && ST_Transform(bounds.geom, 4326)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'instalacoes', :extent, 'geom') AS tile
+        FROM mvtgeom
+    """)
+    
+    params = {
+        "query_id": query_id,
+        "z": z,
+        "x": x,
+        "y": y,
+        "extent": MVT_EXTENT,
+        "buffer": MVT_BUFFER
+    }
+    
+    return await _cached_main_response(
+        db, request, query, f"mvt|{z}/{x}/{y}",
+        lambda: _build_tile(db, sql, params),
+        cache_control=TILE_CACHE_CONTROL
     )
 
 
@@ -127,12 +783,13 @@ async def get_main_query_results(
 # ============================================
 
 @router.get("/auxiliary", response_model=List[QueryAuxiliarResponse])
-async def get_auxiliary_queries(db: Session = Depends(get_db)):
+async def get_auxiliary_queries(db: AsyncSession = Depends(get_async_db)):
     """
     Get all active auxiliary queries.
     Auxiliary queries can only be applied after area selection.
     """
-    queries = db.query(QueryAuxiliar).filter(QueryAuxiliar.ativa == True).all()
+    result = await db.execute(select(QueryAuxiliar).where(QueryAuxiliar.ativa == True))
+    queries = result.scalars().all()
     return queries
 
 
@@ -141,85 +798,186 @@ async def get_auxiliary_query_results(
     query_id: int,
     area_type: str = QueryParam(..., description="'municipio' or 'poligono'"),
     area_value: str = QueryParam(..., description="Municipality name or GeoJSON polygon"),
-    db: Session = Depends(get_db)
+    stream: bool = QueryParam(False, description="Stream the FeatureCollection incrementally (bounded memory for large results)"),
+    format: Literal['geojson', 'grid'] = QueryParam('geojson', description="'grid' returns a weighted density raster (heatmap queries)"),
+    zoom: Optional[int] = QueryParam(None, ge=0, le=22, description="Map zoom level, sets the grid resolution for format=grid"),
+    fields: Optional[str] = QueryParam(None, description="Comma-separated feature properties to return (default: all)"),
+    status: Optional[str] = QueryParam(None, description="Comma-separated current statuses to keep: selecionado, nao_selecionado, verificar, sem_status"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get results for auxiliary query within a specific area.
     Returns installations or heatmap data depending on query type.
     
+    format=grid computes the heatmap density server-side and returns a
+    compact uint8 raster instead of one feature per installation.
+    fields= limits the feature properties (e.g. fields=intensidade for heatmaps).
+    
     CRITICAL: This endpoint requires area selection (business rule).
     """
     # Get query info
-    query = db.query(QueryAuxiliar).filter(QueryAuxiliar.id_query == query_id).first()
+    query = await db.get(QueryAuxiliar, query_id)
     if not query:
         return QueryResultResponse(features=[], metadata={"error": "Query not found"})
     
-    # Build spatial filter based on area type
-    if area_type == "municipio":
-        sql = text("""
+    # Build spatial filter based on area type (polygons validated and cached)
+    try:
+        area = resolve_area(area_type, area_value)
+    except AreaError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    
+    try:
+        status_sql, status_params = _status_filter(status)
+    except ValueError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    
+    params = {"query_id": query_id, **area.params, **status_params}
+    
+    from_sql = f"""
+        FROM instalacoes i
+        JOIN resultado_queries_auxiliares r ON i.id_instalacao = r.id_instalacao
+        WHERE r.id_query = :query_id
+        AND {area.filter_sql}
+        {status_sql}
+    """
+    
+    metadata = {
+        "query_id": query_id,
+        "query_nome": query.nome,
+        "tipo_retorno": query.tipo_retorno
+    }
+    
+    if format == "grid":
+        return await _get_auxiliary_density_grid(db, from_sql, params, metadata, zoom)
+    
+    try:
+        selected = _select_fields(AUXILIARY_PROPERTIES, fields)
+    except ValueError as exc:
+        return QueryResultResponse(features=[], metadata={"error": str(exc)})
+    metadata["fields"] = selected
+    
+    return await _feature_collection_response(db, _feature_sql(AUXILIARY_PROPERTIES, selected), from_sql, params, metadata, stream)
+
+
+async def _get_auxiliary_density_grid(db: AsyncSession, from_sql: str, params: dict, metadata: dict, zoom: Optional[int]) -> RawJSONResponse:
+    """
+    Weighted heatmap density for the selected area.
+    
+    PostGIS sums intensidade per grid cell (one row per non-empty cell) and
+    NumPy applies the Gaussian kernel. The cell size follows the zoom level
+    when given, otherwise the area extent divided into GRID_MAX_CELLS; it
+    is never finer than the extent / GRID_MAX_CELLS.
+    """
+    cell_size = 360.0 / (2 ** zoom) * GRID_CELL_PX / 256.0 if zoom is not None else 0.0
+    
+    sql = text(f"""
+        WITH pts AS MATERIALIZED (
+            SELECT i.geom, COALESCE(r.intensidade::float8, CAST(:missing_weight AS float8)) AS peso
+            {from_sql}
+        ),
+        ext AS (
+            SELECT ST_XMin(e) AS xmin, ST_YMin(e) AS ymin, ST_XMax(e) AS xmax, ST_YMax(e) AS ymax
+            FROM (SELECT ST_Extent(geom) AS e FROM pts) x
+        ),
+        grade AS (
             SELECT 
-                i.id_instalacao,
-                i.municipio,
-                i.classe_tarifaria,
-                i.latitude,
-                i.longitude,
-                ST_AsGeoJSON(i.geom) as geom_json,
-                r.intensidade
-            FROM instalacoes i
-            JOIN resultado_queries_auxiliares r ON i.id_instalacao = r.id_instalacao
-            WHERE r.id_query = :query_id
-            AND i.municipio = :municipio
-        """)
-        params = {"query_id": query_id, "municipio": area_value}
-    
-    elif area_type == "poligono":
-        # Parse GeoJSON polygon
-        polygon_geojson = json.loads(area_value)
-        sql = text("""
+                ext.*,
+                GREATEST(CAST(:cell_size AS float8), GREATEST(xmax - xmin, ymax - ymin) / :max_cells, 1e-6) AS cell
+            FROM ext
+        )
+        SELECT 
+            g.xmin,
+            g.ymin,
+            g.cell,
+            floor((ST_X(p.geom) - g.xmin) / g.cell)::int AS col,
+            floor((ST_Y(p.geom) - g.ymin) / g.cell)::int AS row,
+            SUM(p.peso) AS peso,
+            COUNT(*) AS total
+        FROM pts p
+        CROSS JOIN grade g
+        GROUP BY g.xmin, g.ymin, g.cell, col, row
+    """)
+    
+    rows = (await db.execute(sql, {**params, "cell_size": cell_size, "max_cells": GRID_MAX_CELLS, "missing_weight": GRID_MISSING_WEIGHT})).fetchall()
+    
+    if rows:
+        grid = build_density_grid(
+            [(row.col, row.row, row.peso) for row in rows],
+            rows[0].xmin,
+            rows[0].ymin,
+            rows[0].cell,
+            GRID_SIGMA_CELLS
+        )
+    else:
+        grid = build_density_grid([], 0.0, 0.0, cell_size, GRID_SIGMA_CELLS)
+    
+    grid["metadata"] = {
+        **metadata,
+        "total_results": sum(row.total for row in rows),
+        "sigma_cells": GRID_SIGMA_CELLS
+    }
+    return RawJSONResponse(content=json.dumps(grid))
+
+
+@router.get("/auxiliary/{query_id}/tiles/{z}/{x}/{y}.pbf")
+async def get_auxiliary_query_tile(
+    query_id: int,
+    z: int,
+    x: int,
+    y: int,
+    area_type: str = QueryParam(..., description="'municipio' or 'poligono'"),
+    area_value: str = QueryParam(..., description="Municipality name or GeoJSON polygon"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get auxiliary query results within an area as a Mapbox Vector Tile
+    (layer "instalacoes", with intensidade as attribute).
+    
+    CRITICAL: This endpoint requires area selection (business rule).
+    """
+    _check_tile_coordinates(z, x, y)
+    
+    query = await db.get(QueryAuxiliar, query_id)
+    if not query:
+        raise HTTPException(status_code=404, detail="Query not found")
+    
+    params = {
+        "query_id": query_id,
+        "z": z,
+        "x": x,
+        "y": y,
+        "extent": MVT_EXTENT,
+        "buffer": MVT_BUFFER
+    }
+    
+    try:
+        area = resolve_area(area_type, area_value)
+    except AreaError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    params.update(area.params)
+    
+    sql = text(f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+        ),
+        mvtgeom AS (
             SELECT 
+                ST_AsMVTGeom(ST_Transform(i.geom, 3857), bounds.geom, :extent, :buffer, true) AS geom,
                 i.id_instalacao,
                 i.municipio,
                 i.classe_tarifaria,
-                i.latitude,
-                i.longitude,
-                ST_AsGeoJSON(i.geom) as geom_json,
-                r.intensidade
+                r.intensidade::float8 AS intensidade
             FROM instalacoes i
             JOIN resultado_queries_auxiliares r ON i.id_instalacao = r.id_instalacao
+            CROSS JOIN bounds
             WHERE r.id_query = :query_id
-            AND ST_Contains(ST_GeomFromGeoJSON(:polygon), i.geom)
-        """)
-        params = {"query_id": query_id, "polygon": json.dumps(polygon_geojson)}
-    
-    else:
-        return QueryResultResponse(features=[], metadata={"error": "Invalid area_type"})
+            AND i.geom && ST_Transform(bounds.geom, 4326)
+            AND {area.filter_sql}
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'instalacoes', :extent, 'geom') AS tile
+        FROM mvtgeom
+    """)
     
-    results = db.execute(sql, params).fetchall()
+    tile = (await db.execute(sql, params)).scalar()
     
-    # Convert to GeoJSON features
-    features = []
-    for row in results:
-        feature = {
-            "type": "Feature",
-            "geometry": json.loads(row.geom_json),
-            "properties": {
-                "id_instalacao": row.id_instalacao,
-                "municipio": row.municipio,
-                "classe_tarifaria": row.classe_tarifaria,
-                "tipo_retorno": query.tipo_retorno,
-                "intensidade": float(row.intensidade) if row.intensidade else None,
-                "query_id": query_id,
-                "query_nome": query.nome
-            }
-        }
-        features.append(feature)
-    
-    return QueryResultResponse(
-        features=features,
-        metadata={
-            "query_id": query_id,
-            "query_nome": query.nome,
-            "tipo_retorno": query.tipo_retorno,
-            "total_results": len(features)
-        }
-    )
+    return _mvt_response(tile)
@@ -6,8 +6,9 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 from database import SessionLocal
 from sqlalchemy import text
+from metrics import InstrumentedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=InstrumentedRoute)
 
 class BulkInsertRequest(BaseModel):
     data: list[tuple[str, float]]
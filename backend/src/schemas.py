@@ -93,6 +93,26 @@ class ConsumoHistoricoResponse(BaseModel):
         from_attributes = True
 
 
+class ConsumoSerieResponse(BaseModel):
+    """Resampled consumption of one installation, aligned with periodos"""
+    id_instalacao: str
+    consumo: List[Optional[float]]
+    demanda: List[Optional[float]]
+    amostras: List[int]  # monthly records aggregated into each period
+    media_movel: Optional[List[Optional[float]]] = None
+    desvio_movel: Optional[List[Optional[float]]] = None
+    delta_anual: Optional[List[Optional[float]]] = None
+    variacao_anual: Optional[List[Optional[float]]] = None
+
+
+class ConsumoSeriesResponse(BaseModel):
+    """Consumption time series of one or many installations (compact arrays)"""
+    freq: str
+    periodos: List[date]
+    series: List[ConsumoSerieResponse]
+    nao_encontradas: List[str] = Field(default_factory=list)
+
+
 # ============================================
 # Fraud Schemas
 # ============================================
@@ -143,6 +163,19 @@ class StatusInstalacaoResponse(BaseModel):
         from_attributes = True
 
 
+class StatusInstalacaoBulkUpdate(StatusInstalacaoUpdate):
+    ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class StatusInstalacaoBulkResponse(BaseModel):
+    atualizadas: int
+    nao_encontradas: List[str] = Field(default_factory=list)
+
+
+class StatusInstalacaoLookup(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=5000)
+
+
 # ============================================
 # Area Metrics Schemas
 # ============================================
@@ -162,6 +195,7 @@ class AreaMetricsResponse(BaseModel):
     total_instalacoes: int
     total_fraudes_5anos: int
     distribuicao_tarifa: List[TarifaDistribuicao]
+    atualizado_em: Optional[datetime] = None  # Set when served from the precomputed summary
 
 
 # ============================================
@@ -180,3 +214,51 @@ class MunicipioGeoJSONResponse(BaseModel):
     type: str = "Feature"
     geometry: dict
     properties: dict
+
+
+# ============================================
+# Installation Full Detail Schemas
+# ============================================
+
+class InstalacaoFullResponse(InstalacaoDetailResponse):
+    """Installation with consumption, frauds, service notes and current status"""
+    consumo: List[ConsumoHistoricoResponse] = Field(default_factory=list)
+    fraudes: List[FraudeResponse] = Field(default_factory=list)
+    notas_servico: List[NotaServicoResponse] = Field(default_factory=list)
+    status: Optional[StatusInstalacaoResponse] = None
+
+
+class InstalacaoBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=500)
+
+
+class InstalacaoBatchResponse(BaseModel):
+    instalacoes: List[InstalacaoFullResponse]
+    nao_encontradas: List[str] = Field(default_factory=list)
+
+
+# ============================================
+# Ingestion Schemas
+# ============================================
+
+class RejectedRow(BaseModel):
+    linha: int
+    motivo: str
+
+
+class IngestionReportResponse(BaseModel):
+    target: str
+    format: str
+    mode: str
+    queries: List[int]
+    queries_without_valid_rows: List[int] = Field(default_factory=list)  # left untouched in replace mode
+    rows_read: int
+    rows_loaded: int
+    rows_rejected: int
+    rejected_invalid: int
+    rejected_unknown_query: int
+    rejected_unknown_installation: int
+    duplicates_merged: int
+    rejected_samples: List[RejectedRow]
+    duration_s: float
+    rows_per_sec: Optional[float] = None
@@ -0,0 +1,119 @@
+"""
+Consumption time series for charts
+
+PostgreSQL resamples historico_consumo into periods (date_trunc + GROUP BY,
+reading only the (id_instalacao, data_referencia) index range of each
+installation); this module aligns the periods of every installation on one
+shared axis and derives rolling statistics and year-over-year deltas with
+NumPy, so the response is a few compact arrays instead of one object per
+month.
+"""
+from datetime import date
+
+import numpy as np
+
+# Months per period and date_trunc unit for each resampling frequency
+FREQUENCIES = {
+    "month": ("month", 1),
+    "quarter": ("quarter", 3),
+    "year": ("year", 12),
+}
+
+
+def _month_index(value: date) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def _month_date(index: int) -> date:
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def period_axis(first: date, last: date, freq: str) -> list:
+    """
+    Every period start between first and last (inclusive), no gaps.
+    """
+    step = FREQUENCIES[freq][1]
+    return [_month_date(i) for i in range(_month_index(first), _month_index(last) + 1, step)]
+
+
+def rolling_stats(values: np.ndarray, window: int) -> tuple:
+    """
+    Rolling mean and standard deviation along the last axis (trailing
+    window). A window containing a gap (NaN) yields NaN.
+    """
+    mean = np.full(values.shape, np.nan)
+    std = np.full(values.shape, np.nan)
+    if window < 1 or values.shape[-1] < window:
+        return mean, std
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=-1)
+    mean[..., window - 1:] = windows.mean(axis=-1)
+    std[..., window - 1:] = windows.std(axis=-1)
+    return mean, std
+
+
+def yoy_deltas(values: np.ndarray, freq: str) -> tuple:
+    """
+    Absolute and relative change against the same period one year earlier.
+    """
+    lag = 12 // FREQUENCIES[freq][1]
+    delta = np.full(values.shape, np.nan)
+    pct = np.full(values.shape, np.nan)
+    if values.shape[-1] <= lag:
+        return delta, pct
+    previous = values[..., :-lag]
+    delta[..., lag:] = values[..., lag:] - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct[..., lag:] = np.where(previous != 0, delta[..., lag:] / previous, np.nan)
+    return delta, pct
+
+
+def _to_list(values: np.ndarray, digits: int) -> list:
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+
+def build_series(rows, ids: list, freq: str, rolling: int = 0, yoy: bool = False) -> dict:
+    """
+    Build the series payload from resampled (id_instalacao, periodo,
+    consumo, demanda, amostras) rows. Periods without data are null.
+    """
+    if not rows:
+        return {"freq": freq, "periodos": [], "series": []}
+
+    periods = period_axis(min(row.periodo for row in rows), max(row.periodo for row in rows), freq)
+    position = {period: index for index, period in enumerate(periods)}
+    present = {row.id_instalacao for row in rows}
+    order = [i for i in ids if i in present]
+    line = {id_instalacao: index for index, id_instalacao in enumerate(order)}
+
+    shape = (len(order), len(periods))
+    consumo = np.full(shape, np.nan)
+    demanda = np.full(shape, np.nan)
+    amostras = np.zeros(shape, dtype=np.int32)
+    rows_idx = np.fromiter((line[row.id_instalacao] for row in rows), dtype=np.intp, count=len(rows))
+    cols_idx = np.fromiter((position[row.periodo] for row in rows), dtype=np.intp, count=len(rows))
+    consumo[rows_idx, cols_idx] = [np.nan if row.consumo is None else row.consumo for row in rows]
+    demanda[rows_idx, cols_idx] = [np.nan if row.demanda is None else row.demanda for row in rows]
+    amostras[rows_idx, cols_idx] = [row.amostras for row in rows]
+
+    if rolling:
+        rolling_mean, rolling_std = rolling_stats(consumo, rolling)
+    if yoy:
+        yoy_delta, yoy_pct = yoy_deltas(consumo, freq)
+
+    series = []
+    for index, id_instalacao in enumerate(order):
+        item = {
+            "id_instalacao": id_instalacao,
+            "consumo": _to_list(consumo[index], 2),
+            "demanda": _to_list(demanda[index], 2),
+            "amostras": amostras[index].tolist(),
+        }
+        if rolling:
+            item["media_movel"] = _to_list(rolling_mean[index], 2)
+            item["desvio_movel"] = _to_list(rolling_std[index], 2)
+        if yoy:
+            item["delta_anual"] = _to_list(yoy_delta[index], 2)
+            item["variacao_anual"] = _to_list(yoy_pct[index], 4)
+        series.append(item)
+
+    return {"freq": freq, "periodos": [period.isoformat() for period in periods], "series": series}
@@ -0,0 +1,10 @@
+"""
+Tests of the pure helpers (no database connection is opened: importing
+modules that use database.py only creates the engines).
+
+Run from backend/: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
@@ -0,0 +1,99 @@
+import asyncio
+import pickle
+from datetime import datetime, timezone
+
+import pytest
+from starlette.requests import Request
+
+from cache import CachedResponse, LRUCacheBackend, decode_entry, encode_entry, is_not_modified, weak_etag
+
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+ETAG = weak_etag("abc123")
+LAST_MODIFIED = datetime(2024, 5, 1, 12, 0, 30, 500000, tzinfo=timezone.utc)
+
+
+def test_weak_etag():
+    assert ETAG == 'W/"abc123"'
+
+
+def test_no_validators():
+    assert not is_not_modified(make_request(), ETAG, LAST_MODIFIED)
+
+
+def test_if_none_match_weak_comparison():
+    assert is_not_modified(make_request(if_none_match='W/"abc123"'), ETAG, None)
+    assert is_not_modified(make_request(if_none_match='"abc123"'), ETAG, None)
+    assert is_not_modified(make_request(if_none_match='"other", W/"abc123"'), ETAG, None)
+    assert is_not_modified(make_request(if_none_match="*"), ETAG, None)
+    assert not is_not_modified(make_request(if_none_match='W/"other"'), ETAG, None)
+
+
+def test_if_none_match_takes_precedence():
+    request = make_request(if_none_match='"other"', if_modified_since="Wed, 01 May 2024 12:00:30 GMT")
+    assert not is_not_modified(request, ETAG, LAST_MODIFIED)
+
+
+def test_if_modified_since():
+    # HTTP dates have second precision: the fraction is ignored
+    assert is_not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:00:30 GMT"), ETAG, LAST_MODIFIED)
+    assert is_not_modified(make_request(if_modified_since="Thu, 02 May 2024 00:00:00 GMT"), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:00:29 GMT"), ETAG, LAST_MODIFIED)
+
+
+def test_if_modified_since_naive_last_modified_is_utc():
+    naive = LAST_MODIFIED.replace(tzinfo=None)
+    assert is_not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:00:30 GMT"), ETAG, naive)
+
+
+def test_invalid_if_modified_since():
+    assert not is_not_modified(make_request(if_modified_since="yesterday"), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:00:30 GMT"), ETAG, None)
+
+
+def test_entry_round_trip():
+    value = CachedResponse(b'{"type": "FeatureCollection"}\x00\xff', "application/json", ETAG, LAST_MODIFIED)
+    assert decode_entry(encode_entry(value)) == value
+
+    naive = value._replace(last_modified=LAST_MODIFIED.replace(tzinfo=None))
+    assert decode_entry(encode_entry(naive)) == naive
+
+    without_date = value._replace(last_modified=None)
+    assert decode_entry(encode_entry(without_date)) == without_date
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"\x10\x00\x00\x00{}",
+    b"\x02\x00\x00\x00[]body",
+    b"\x02\x00\x00\x00{}body",
+    b"\x05\x00\x00\x00notjsbody",
+    pickle.dumps(("body", "application/json", "etag", None)),
+])
+def test_malformed_entries_are_rejected(data):
+    with pytest.raises(ValueError):
+        decode_entry(data)
+
+
+def test_lru_backend_evicts_by_count_and_size():
+    backend = LRUCacheBackend(max_entries=2, max_bytes=10)
+
+    async def scenario():
+        await backend.set("a", CachedResponse(b"1234", "text/plain", "a"))
+        await backend.set("b", CachedResponse(b"1234", "text/plain", "b"))
+        await backend.get("a")  # b is now the least recently used
+        await backend.set("c", CachedResponse(b"12", "text/plain", "c"))
+        assert await backend.get("b") is None
+        assert await backend.get("a") is not None
+        await backend.set("d", CachedResponse(b"12345678", "text/plain", "d"))  # over max_bytes together
+        return [await backend.get(key) is not None for key in "acd"]
+
+    assert asyncio.run(scenario()) == [False, False, True]
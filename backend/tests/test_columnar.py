@@ -0,0 +1,79 @@
+import json
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from columnar import (
+    ARROW_MEDIA_TYPE, COLUMNAR_MAGIC, COLUMNAR_MEDIA_TYPE, COLUMNAR_VERSION, TIPO_ALVO_ENUM, TIPO_ALVO_UNKNOWN,
+    encode_columnar, negotiate_format
+)
+
+Row = namedtuple("Row", "id_instalacao lon lat score tipo_alvo")
+
+
+def decode(body: bytes) -> dict:
+    """
+    Read the layout documented in columnar.py back into Python values.
+    """
+    magic, version, n, meta_len, ids_len = struct.unpack_from("<4sB3xIII", body)
+    offset = 20
+    metadata = json.loads(body[offset:offset + meta_len])
+    offset += meta_len + (-meta_len % 4)
+
+    def take(dtype, count):
+        nonlocal offset
+        values = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    lon, lat, score = take("<f4", n), take("<f4", n), take("<f4", n)
+    tipo_alvo = take(np.uint8, n)
+    offset += -n % 4
+    offsets = take("<u4", n + 1)
+    id_bytes = body[offset:offset + ids_len]
+    assert offset + ids_len == len(body)
+    ids = [id_bytes[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(n)]
+    return {
+        "magic": magic, "version": version, "metadata": metadata,
+        "lon": lon, "lat": lat, "score": score, "tipo_alvo": tipo_alvo, "ids": ids,
+    }
+
+
+def test_negotiate_format():
+    assert negotiate_format(None) is None
+    assert negotiate_format("application/json") is None
+    assert negotiate_format("application/json, application/vnd.sasi.columnar;q=0.9") == COLUMNAR_MEDIA_TYPE
+    assert negotiate_format("Application/Vnd.Apache.Arrow.Stream") == ARROW_MEDIA_TYPE
+
+
+def test_round_trip():
+    rows = [
+        Row("INST001", -35.2, -5.79, 87.5, "forte"),
+        Row("ÁGUA-9", -36.0, -6.1, None, "regular"),
+        Row("X", -37.5, -4.9, 12.25, "desconhecido"),
+    ]
+    decoded = decode(encode_columnar(rows, {"query": {"id": 1}}))
+
+    assert decoded["magic"] == COLUMNAR_MAGIC and decoded["version"] == COLUMNAR_VERSION
+    assert decoded["metadata"] == {"query": {"id": 1}, "tipo_alvo_enum": list(TIPO_ALVO_ENUM)}
+    np.testing.assert_allclose(decoded["lon"], [-35.2, -36.0, -37.5], rtol=1e-6)
+    np.testing.assert_allclose(decoded["lat"], [-5.79, -6.1, -4.9], rtol=1e-6)
+    assert decoded["score"][0] == 87.5 and np.isnan(decoded["score"][1]) and decoded["score"][2] == 12.25
+    assert decoded["tipo_alvo"].tolist() == [TIPO_ALVO_ENUM.index("forte"), TIPO_ALVO_ENUM.index("regular"), TIPO_ALVO_UNKNOWN]
+    assert decoded["ids"] == ["INST001", "ÁGUA-9", "X"]
+
+
+def test_sections_are_aligned():
+    # 5 rows: the uint8 tipo_alvo section needs padding before the offsets
+    rows = [Row(f"I{i}", float(i), float(i), float(i), "forte") for i in range(5)]
+    body = encode_columnar(rows, {"a": "odd"})
+    n, meta_len = struct.unpack_from("<4sB3xIII", body)[2:4]
+    offsets_start = 20 + meta_len + (-meta_len % 4) + 3 * 4 * n + n + (-n % 4)
+    assert offsets_start % 4 == 0
+    assert decode(body)["ids"] == [f"I{i}" for i in range(5)]
+
+
+def test_empty():
+    decoded = decode(encode_columnar([], {}))
+    assert decoded["ids"] == [] and decoded["lon"].size == 0
@@ -0,0 +1,56 @@
+import pytest
+
+import compression
+from compression import add_vary, negotiate_encoding
+from starlette.datastructures import MutableHeaders
+
+
+@pytest.fixture(autouse=True)
+def all_encodings(monkeypatch):
+    # Server preference order, independent of the optional codecs installed
+    monkeypatch.setattr(compression, "AVAILABLE_ENCODINGS", ["zstd", "br", "gzip"])
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("gzip, br, zstd", "zstd"),
+    ("GZIP", "gzip"),
+    ("deflate", None),
+    ("*", "zstd"),
+])
+def test_server_preference(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip;q=1.0, br;q=0.5", "gzip"),
+    ("br;q=0.8, gzip;q=0.9, zstd;q=0.1", "gzip"),
+    ("gzip; q=0.5, br; q=0.5", "br"),
+    ("zstd;q=0, br;q=0, gzip", "gzip"),
+    ("*;q=0.1, gzip;q=0.5", "gzip"),
+    ("gzip;q=abc", None),
+])
+def test_q_values(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_identity_refused():
+    # Without an acceptable encoding the response is sent as identity anyway
+    assert negotiate_encoding("identity;q=0, deflate") is None
+    assert negotiate_encoding("identity;q=0, gzip") == "gzip"
+
+
+def test_wildcard_zero_refuses_unlisted():
+    assert negotiate_encoding("*;q=0") is None
+    assert negotiate_encoding("br, *;q=0") == "br"
+
+
+def test_add_vary_merges():
+    headers = MutableHeaders()
+    add_vary(headers)
+    add_vary(headers, "Accept")
+    add_vary(headers, "accept-encoding")
+    assert headers["vary"] == "Accept-Encoding, Accept"
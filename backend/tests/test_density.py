@@ -0,0 +1,48 @@
+import base64
+import math
+
+import numpy as np
+
+from density import build_density_grid, density_raster
+
+
+def grid_values(grid: dict) -> np.ndarray:
+    data = np.frombuffer(base64.b64decode(grid["data"]), dtype=np.uint8)
+    return data.reshape(grid["height"], grid["width"])
+
+
+def test_empty():
+    grid = build_density_grid([], 0.0, 0.0, 0.5, 2.0)
+    assert grid["width"] == 0 and grid["height"] == 0 and grid["bbox"] is None and grid["data"] == ""
+
+
+def test_raster_without_blur_accumulates_weights():
+    raster = density_raster([0, 0, 2], [1, 1, 0], [1.0, 2.0, 4.0], width=3, height=2, sigma=0)
+    assert raster.tolist() == [[0.0, 0.0, 4.0], [3.0, 0.0, 0.0]]
+
+
+def test_blur_is_symmetric_around_a_point():
+    raster = density_raster([5], [5], [1.0], width=11, height=11, sigma=1.5)
+    assert raster.argmax() == 5 * 11 + 5
+    np.testing.assert_allclose(raster, raster[::-1, :])
+    np.testing.assert_allclose(raster, raster[:, ::-1])
+
+
+def test_padding_and_bbox():
+    sigma = 1.2
+    pad = math.ceil(3 * sigma)
+    grid = build_density_grid([(0, 0, 1.0), (3, 1, 1.0)], 10.0, 20.0, 0.5, sigma)
+
+    assert grid["width"] == 4 + 2 * pad
+    assert grid["height"] == 2 + 2 * pad
+    assert grid["bbox"] == [10.0 - pad * 0.5, 20.0 - pad * 0.5, 10.0 + (4 + pad) * 0.5, 20.0 + (2 + pad) * 0.5]
+    assert len(base64.b64decode(grid["data"])) == grid["width"] * grid["height"]
+
+
+def test_quantized_north_up():
+    # One heavy cell in the southern row, one light cell in the northern row
+    grid = build_density_grid([(0, 0, 10.0), (0, 2, 1.0)], 0.0, 0.0, 1.0, 0)
+    values = grid_values(grid)
+
+    assert grid["max_value"] == 10.0
+    assert values.tolist() == [[26], [0], [255]]
@@ -0,0 +1,106 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from ingestion import (
+    _optional_decimal, _parse_auxiliar, _parse_principal, _read_csv, _read_ndjson, _required_str, detect_format
+)
+
+
+def test_required_str():
+    assert _required_str({"id_instalacao": "  INST001 "}, "id_instalacao") == "INST001"
+    assert _required_str({"id_instalacao": 12345}, "id_instalacao") == "12345"
+    for value in (None, "", "   ", "x" * 51, "A\x00B"):
+        with pytest.raises(ValueError, match="invalid id_instalacao"):
+            _required_str({"id_instalacao": value}, "id_instalacao")
+    with pytest.raises(ValueError):
+        _required_str({}, "id_instalacao")
+
+
+def test_optional_decimal():
+    limit, scale = Decimal("1000"), Decimal("0.01")
+    assert _optional_decimal({"score": " 87.50 "}, "score", limit, scale) == Decimal("87.50")
+    assert _optional_decimal({"score": 3}, "score", limit, scale) == Decimal("3")
+    assert _optional_decimal({"score": ""}, "score", limit, scale) is None
+    assert _optional_decimal({"score": None}, "score", limit, scale) is None
+    assert _optional_decimal({}, "score", limit, scale) is None
+    with pytest.raises(ValueError, match="invalid score"):
+        _optional_decimal({"score": "abc"}, "score", limit, scale)
+    for value in ("1000", "-1000", "NaN", "Infinity"):
+        with pytest.raises(ValueError, match="score out of range"):
+            _optional_decimal({"score": value}, "score", limit, scale)
+
+
+def test_optional_decimal_rounds_to_the_column_scale():
+    limit, scale = Decimal("1000"), Decimal("0.01")
+    assert _optional_decimal({"score": "87.505"}, "score", limit, scale) == Decimal("87.51")
+    assert _optional_decimal({"score": "999.994"}, "score", limit, scale) == Decimal("999.99")
+    # Rounds up to 1000.00, which overflows NUMERIC(5, 2) during COPY
+    for value in ("999.995", "-999.995", "1e30"):
+        with pytest.raises(ValueError, match="score out of range"):
+            _optional_decimal({"score": value}, "score", limit, scale)
+
+
+def test_parse_principal():
+    record = {"id_query": " 3 ", "id_instalacao": "INST001", "tipo_alvo": "Forte", "score": "99.99"}
+    assert _parse_principal(record) == (3, "INST001", "forte", Decimal("99.99"))
+    assert _parse_principal({**record, "score": ""})[3] is None
+
+    with pytest.raises(ValueError, match="invalid tipo_alvo"):
+        _parse_principal({**record, "tipo_alvo": "medio"})
+    with pytest.raises(ValueError, match="invalid id_query"):
+        _parse_principal({**record, "id_query": "3.5"})
+    with pytest.raises(ValueError, match="invalid id_query"):
+        _parse_principal({key: value for key, value in record.items() if key != "id_query"})
+
+
+def test_parse_auxiliar():
+    assert _parse_auxiliar({"id_query": 1, "id_instalacao": "A", "intensidade": "0.75"}) == (1, "A", Decimal("0.75"))
+    # score is accepted as an alias of intensidade
+    assert _parse_auxiliar({"id_query": 1, "id_instalacao": "A", "score": "9.9999"}) == (1, "A", Decimal("9.9999"))
+    with pytest.raises(ValueError, match="intensidade out of range"):
+        _parse_auxiliar({"id_query": 1, "id_instalacao": "A", "intensidade": "10"})
+    with pytest.raises(ValueError, match="intensidade out of range"):
+        _parse_auxiliar({"id_query": 1, "id_instalacao": "A", "intensidade": "9.99995"})
+    assert _parse_auxiliar({"id_query": 1, "id_instalacao": "A", "intensidade": "9.99994"})[2] == Decimal("9.9999")
+
+
+def test_detect_format():
+    assert detect_format("resultados.CSV") == "csv"
+    assert detect_format("dados.jsonl") == "ndjson"
+    assert detect_format("dados.ndjson") == "ndjson"
+    assert detect_format("dados.parquet") == "parquet"
+    assert detect_format("dados.txt") is None
+    assert detect_format(None) is None
+
+
+def read(reader, data: bytes) -> list:
+    return [(line, str(record) if isinstance(record, Exception) else record) for line, record in reader(io.BytesIO(data))]
+
+
+def test_csv_bad_rows_do_not_abort_the_file():
+    data = (
+        b"\xef\xbb\xbfid_query,id_instalacao,tipo_alvo,score\n"
+        b"1,A,forte,1\n"
+        b"1,B\xff,forte,2\n"
+        b'1,"' + b"x" * 200000 + b'",forte,3\n'
+        b"1,C,regular,\n"
+    )
+    rows = read(_read_csv, data)
+
+    assert rows[0] == (2, {"id_query": "1", "id_instalacao": "A", "tipo_alvo": "forte", "score": "1"})
+    assert rows[1] == (3, "invalid UTF-8")
+    assert rows[2][0] == 4 and rows[2][1].startswith("invalid CSV")
+    assert rows[3] == (5, {"id_query": "1", "id_instalacao": "C", "tipo_alvo": "regular", "score": ""})
+
+
+def test_ndjson_bad_lines_are_reported():
+    data = b'{"id_query": 1}\n\n[1, 2]\n{bad\n{"id_instalacao": "\xc3\x28"}\n{"id_query": 2}\n'
+    assert read(_read_ndjson, data) == [
+        (1, {"id_query": 1}),
+        (3, "not a JSON object"),
+        (4, "invalid JSON"),
+        (5, "invalid UTF-8"),
+        (6, {"id_query": 2}),
+    ]
@@ -0,0 +1,209 @@
+from contextlib import contextmanager
+
+import layout
+from layout import default_partition, partition_name, query_partitions, replace_partitions, split_default_partition
+
+PRINCIPAIS = "resultado_queries_principais"
+AUXILIARES = "resultado_queries_auxiliares"
+
+
+class FakeScalars(list):
+    def all(self):
+        return list(self)
+
+
+class FakeResult:
+    def __init__(self, values=(), rowcount=0):
+        self.values = values
+        self.rowcount = rowcount
+
+    def scalars(self):
+        return FakeScalars(self.values)
+
+    def scalar(self):
+        return self.values[0]
+
+
+class FakeConnection:
+    """
+    Records every statement (whitespace collapsed) and answers the catalog
+    lookups made by layout.py.
+    """
+
+    def __init__(self, names=(), default_ids=(), query_ids=(), rows=3):
+        self.names = list(names)
+        self.default_ids = list(default_ids)
+        self.query_ids = list(query_ids)
+        self.rows = rows
+        self.params = None
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        sql = " ".join(str(statement).split())
+        self.params = params
+        self.statements.append(sql)
+        if "pg_inherits" in sql:
+            return FakeResult(self.names)
+        if "pg_partitioned_table" in sql:
+            return FakeResult([True])
+        if sql.startswith("SELECT DISTINCT id_query FROM"):
+            return FakeResult(self.default_ids)
+        if sql.startswith("SELECT id_query FROM"):
+            return FakeResult(self.query_ids)
+        if sql.startswith("INSERT INTO") and "_novo" in sql:
+            return FakeResult(rowcount=self.rows)
+        return FakeResult()
+
+
+def assert_statements(conn: FakeConnection, expected: list):
+    """
+    Statements in order; each must start with the expected prefix.
+    """
+    assert len(conn.statements) == len(expected), conn.statements
+    for sql, prefix in zip(conn.statements, expected):
+        assert sql.startswith(prefix), (sql, prefix)
+
+
+def build_statements(table: str, query_table: str, query_id: int, source: str) -> list:
+    new = f"{table}_q{query_id}_novo"
+    return [
+        f"DROP TABLE IF EXISTS {new}",
+        f"CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES)",
+        f"INSERT INTO {new} {source}",
+        f"ALTER TABLE {new} ADD CONSTRAINT particao_id_query CHECK (id_query = {query_id})",
+        f"ALTER TABLE {new} ADD FOREIGN KEY (id_query) REFERENCES {query_table} (id_query) ON DELETE CASCADE, "
+        f"ADD FOREIGN KEY (id_instalacao) REFERENCES instalacoes (id_instalacao) ON DELETE CASCADE",
+        f"ANALYZE {new}",
+    ]
+
+
+def swap_statements(table: str, query_id: int, existing: bool) -> list:
+    partition = f"{table}_q{query_id}"
+    if existing:
+        removed = [f"ALTER TABLE {table} DETACH PARTITION {partition}", f"DROP TABLE {partition}"]
+    else:
+        removed = [f"DELETE FROM {table}_padrao WHERE id_query = :query_id"]
+    return removed + [
+        f"ALTER TABLE {partition}_novo RENAME TO {partition}",
+        f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN ({query_id})",
+        f"ALTER TABLE {partition} DROP CONSTRAINT particao_id_query",
+    ]
+
+
+def test_partition_names():
+    assert partition_name("resultado_queries_principais", 7) == "resultado_queries_principais_q7"
+    assert partition_name("resultado_queries_principais", "12") == "resultado_queries_principais_q12"
+    assert default_partition("resultado_queries_auxiliares") == "resultado_queries_auxiliares_padrao"
+
+
+def test_query_partitions_maps_ids_to_names():
+    conn = FakeConnection([
+        "resultado_queries_principais_q1",
+        "resultado_queries_principais_q25",
+        "resultado_queries_principais_padrao",
+    ])
+    assert query_partitions(conn, "resultado_queries_principais") == {
+        1: "resultado_queries_principais_q1",
+        25: "resultado_queries_principais_q25",
+    }
+    assert conn.params == {"table": "resultado_queries_principais"}
+
+
+def test_query_partitions_ignores_other_names():
+    conn = FakeConnection([
+        "resultado_queries_principais_q3_novo",  # swap table not attached yet
+        "resultado_queries_principais_qx",
+        "xresultado_queries_principais_q4",
+        "resultado_queries_principais_q5",
+    ])
+    assert query_partitions(conn, "resultado_queries_principais") == {5: "resultado_queries_principais_q5"}
+
+
+def test_partition_name_round_trips():
+    table = "resultado_queries_auxiliares"
+    names = [partition_name(table, query_id) for query_id in (1, 10, 100)]
+    assert query_partitions(FakeConnection(names), table) == {1: names[0], 10: names[1], 100: names[2]}
+
+
+def test_replace_partitions_builds_everything_before_swapping():
+    conn = FakeConnection(names=[partition_name(PRINCIPAIS, 1)], rows=4)
+    rows_sql = "SELECT id_query, id_instalacao, tipo_alvo, score FROM stg_validos WHERE id_query = :query_id"
+
+    loaded = replace_partitions(conn, PRINCIPAIS, [1, 2], rows_sql, columns=("id_query", "id_instalacao", "tipo_alvo", "score"))
+
+    source = f"(id_query, id_instalacao, tipo_alvo, score) {rows_sql}"
+    assert_statements(conn, [
+        *build_statements(PRINCIPAIS, "queries_principais", 1, source),
+        *build_statements(PRINCIPAIS, "queries_principais", 2, source),
+        "SELECT c.relname FROM pg_inherits",
+        *swap_statements(PRINCIPAIS, 1, existing=True),
+        *swap_statements(PRINCIPAIS, 2, existing=False),
+        "INSERT INTO versao_resultados_principais (id_query, versao, atualizado_em)",
+    ])
+    assert conn.params == {"query_ids": [1, 2]}
+    assert loaded == 8
+
+
+def test_replace_partitions_without_version_table_or_bump():
+    rows_sql = "SELECT * FROM stg_validos WHERE id_query = :query_id"
+
+    conn = FakeConnection()
+    replace_partitions(conn, AUXILIARES, [5], rows_sql)
+    assert_statements(conn, [
+        *build_statements(AUXILIARES, "queries_auxiliares", 5, rows_sql),
+        "SELECT c.relname FROM pg_inherits",
+        *swap_statements(AUXILIARES, 5, existing=False),
+    ])
+
+    conn = FakeConnection()
+    replace_partitions(conn, PRINCIPAIS, [5], rows_sql, bump_versions=False)
+    assert not any("versao_resultados_principais" in sql for sql in conn.statements)
+
+
+def test_split_default_partition(monkeypatch):
+    # 3 and 4 sit in the default partition; query 9 was deleted but kept its partition
+    conn = FakeConnection(
+        names=[partition_name(PRINCIPAIS, 9), default_partition(PRINCIPAIS)],
+        default_ids=[3, 4],
+        query_ids=[3, 4],
+        rows=2,
+    )
+
+    class FakeEngine:
+        @contextmanager
+        def connect(self):
+            yield conn
+
+        begin = connect
+
+    monkeypatch.setattr(layout, "engine", FakeEngine())
+
+    report = split_default_partition(PRINCIPAIS)
+
+    source = f"SELECT * FROM {PRINCIPAIS}_padrao WHERE id_query = :query_id"
+
+    def move(query_id):
+        # One transaction per query, no version bump
+        return [
+            "SET LOCAL statement_timeout = 0",
+            *build_statements(PRINCIPAIS, "queries_principais", query_id, source),
+            "SELECT c.relname FROM pg_inherits",
+            *swap_statements(PRINCIPAIS, query_id, existing=False),
+        ]
+
+    assert_statements(conn, [
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table",
+        f"SELECT DISTINCT id_query FROM {PRINCIPAIS}_padrao",
+        *move(3),
+        *move(4),
+        "SELECT id_query FROM queries_principais",
+        "SELECT c.relname FROM pg_inherits",
+        f"ALTER TABLE {PRINCIPAIS} DETACH PARTITION {PRINCIPAIS}_q9",
+        f"DROP TABLE {PRINCIPAIS}_q9",
+    ])
+    assert report == {
+        "table": PRINCIPAIS,
+        "partitions_created": 2,
+        "rows_moved": 4,
+        "partitions_dropped": [f"{PRINCIPAIS}_q9"],
+    }
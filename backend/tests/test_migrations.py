@@ -0,0 +1,66 @@
+import migrations
+from migrations import NO_TRANSACTION_MARKER, load_migrations, split_statements
+
+
+def test_split_on_top_level_semicolons():
+    assert split_statements("SELECT 1; SELECT 2;\nSELECT 3") == ["SELECT 1", "SELECT 2", "SELECT 3"]
+
+
+def test_semicolons_in_strings_are_kept():
+    sql = "INSERT INTO t VALUES ('a;b', 'it''s; fine'); SELECT 1"
+    assert split_statements(sql) == ["INSERT INTO t VALUES ('a;b', 'it''s; fine')", "SELECT 1"]
+
+
+def test_dollar_quoted_bodies_are_kept_whole():
+    sql = """
+        CREATE FUNCTION f() RETURNS VOID AS $$
+        BEGIN
+            PERFORM 1; PERFORM 2;
+        END;
+        $$ LANGUAGE plpgsql;
+        DO $body$ BEGIN PERFORM 'x;$$'; END $body$;
+    """
+    statements = split_statements(sql)
+    assert len(statements) == 2
+    assert statements[0].startswith("CREATE FUNCTION") and statements[0].endswith("LANGUAGE plpgsql")
+    assert "PERFORM 1; PERFORM 2;" in statements[0]
+    assert statements[1] == "DO $body$ BEGIN PERFORM 'x;$$'; END $body$"
+
+
+def test_semicolons_in_comments_are_ignored():
+    sql = """
+        -- drop; recreate
+        SELECT 1; /* a; b */ SELECT 2;
+    """
+    statements = split_statements(sql)
+    assert len(statements) == 2
+    assert statements[0].endswith("SELECT 1")
+    assert statements[1] == "/* a; b */ SELECT 2"
+
+
+def test_comment_only_fragments_are_dropped():
+    sql = "SELECT 1;\n-- trailing note\n/* block; comment */\n"
+    assert split_statements(sql) == ["SELECT 1"]
+
+
+def test_no_transaction_marker(tmp_path, monkeypatch):
+    (tmp_path / "001_plain.sql").write_text("CREATE TABLE a (id INT);\n", encoding="utf-8")
+    (tmp_path / "002_concurrent.sql").write_text(
+        f"{NO_TRANSACTION_MARKER}\nCREATE INDEX CONCURRENTLY IF NOT EXISTS i ON a (id);\n", encoding="utf-8"
+    )
+    (tmp_path / "README.md").write_text("not a migration", encoding="utf-8")
+    monkeypatch.setattr(migrations, "MIGRATIONS_DIR", str(tmp_path))
+
+    loaded = load_migrations()
+
+    assert [(m.version, m.name, m.transactional) for m in loaded] == [
+        ("001", "plain", True),
+        ("002", "concurrent", False),
+    ]
+
+
+def test_shipped_migrations_split():
+    for migration in load_migrations():
+        statements = split_statements(migration.sql)
+        assert statements, migration.name
+        assert all(statement.strip() for statement in statements)
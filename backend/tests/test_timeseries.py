@@ -0,0 +1,85 @@
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+import pytest
+
+from timeseries import build_series, period_axis, rolling_stats, yoy_deltas
+
+Row = namedtuple("Row", "id_instalacao periodo consumo demanda amostras")
+
+
+def test_period_axis():
+    assert period_axis(date(2023, 11, 1), date(2024, 2, 1), "month") == [
+        date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)
+    ]
+    assert period_axis(date(2023, 10, 1), date(2024, 4, 1), "quarter") == [
+        date(2023, 10, 1), date(2024, 1, 1), date(2024, 4, 1)
+    ]
+    assert period_axis(date(2022, 1, 1), date(2024, 1, 1), "year") == [
+        date(2022, 1, 1), date(2023, 1, 1), date(2024, 1, 1)
+    ]
+    assert period_axis(date(2024, 3, 1), date(2024, 3, 1), "month") == [date(2024, 3, 1)]
+
+
+def test_rolling_stats():
+    values = np.array([[1.0, 2.0, 3.0, np.nan, 5.0, 6.0]])
+    mean, std = rolling_stats(values, 2)
+
+    np.testing.assert_allclose(mean, [[np.nan, 1.5, 2.5, np.nan, np.nan, 5.5]])
+    np.testing.assert_allclose(std, [[np.nan, 0.5, 0.5, np.nan, np.nan, 0.5]])
+
+
+def test_rolling_window_longer_than_series():
+    mean, std = rolling_stats(np.array([[1.0, 2.0]]), 3)
+    assert np.isnan(mean).all() and np.isnan(std).all()
+
+
+@pytest.mark.parametrize("freq, lag", [("month", 12), ("quarter", 4), ("year", 1)])
+def test_yoy_lag(freq, lag):
+    values = np.arange(1, lag + 3, dtype=float)[None, :]
+    delta, pct = yoy_deltas(values, freq)
+
+    assert np.isnan(delta[0, :lag]).all()
+    np.testing.assert_allclose(delta[0, lag:], [lag, lag])
+    np.testing.assert_allclose(pct[0, lag:], [lag / 1, lag / 2])
+
+
+def test_yoy_previous_zero_has_no_ratio():
+    delta, pct = yoy_deltas(np.array([[0.0, 5.0]]), "year")
+    assert delta[0, 1] == 5.0 and np.isnan(pct[0, 1])
+
+
+def test_build_series_aligns_installations():
+    rows = [
+        Row("B", date(2024, 1, 1), 10.0, 2.0, 1),
+        Row("A", date(2024, 3, 1), 30.0, None, 2),
+        Row("B", date(2024, 3, 1), None, 4.0, 1),
+    ]
+    payload = build_series(rows, ["A", "C", "B"], "month", rolling=2, yoy=True)
+
+    assert payload["freq"] == "month"
+    assert payload["periodos"] == ["2024-01-01", "2024-02-01", "2024-03-01"]
+    assert [item["id_instalacao"] for item in payload["series"]] == ["A", "B"]
+
+    a, b = payload["series"]
+    assert a["consumo"] == [None, None, 30.0]
+    assert a["demanda"] == [None, None, None]
+    assert a["amostras"] == [0, 0, 2]
+    assert b["consumo"] == [10.0, None, None]
+    assert b["demanda"] == [2.0, None, 4.0]
+    assert b["media_movel"] == [None, None, None]
+    assert b["delta_anual"] == [None, None, None]
+
+
+def test_build_series_rolling_and_rounding():
+    rows = [Row("A", date(2024, month, 1), value, None, 1) for month, value in ((1, 1.005), (2, 2.0), (3, 4.0))]
+    item = build_series(rows, ["A"], "month", rolling=2)["series"][0]
+
+    assert item["media_movel"] == [None, 1.5, 3.0]
+    assert item["desvio_movel"] == [None, 0.5, 1.0]
+    assert "delta_anual" not in item
+
+
+def test_build_series_empty():
+    assert build_series([], ["A"], "quarter") == {"freq": "quarter", "periodos": [], "series": []}
@@ -9,12 +9,48 @@ import Heatmap from './components/Map/Heatmap';
 import MainQuerySelector from './components/QuerySelector/MainQuerySelector';
 import AuxiliaryQuerySelector from './components/QuerySelector/AuxiliaryQuerySelector';
 import AreaSelector from './components/AreaSelector/AreaSelector';
-import { getMainQueryResults, getMunicipalityGeometry, getAuxiliaryQueryResults } from './services/api';
+import { getMainQueriesResults, getMunicipalityGeometry, getAuxiliaryQueryResults } from './services/api';
+
+// Query-level values (color, name, ...) are sent once in the response
+// metadata; copy them onto each feature for the map layers.
+const withQueryMetadata = (data, keys) => {
+  const queryProperties = Object.fromEntries(keys.map((key) => [key, data.metadata?.[key]]));
+  return {
+    ...data,
+    features: (data.features || []).map((feature) => ({
+      ...feature,
+      properties: { ...feature.properties, ...queryProperties },
+    })),
+  };
+};
+
+// Overlay features carry every matching query (query_ids/scores/tipos_alvo);
+// the marker takes its color and size from the highest-scoring one.
+const toMarkerFeature = (feature, queriesById) => {
+  const { query_ids: queryIds = [], scores = [], tipos_alvo: tiposAlvo = [] } = feature.properties;
+  let best = 0;
+  scores.forEach((score, index) => {
+    if ((score ?? -Infinity) > (scores[best] ?? -Infinity)) best = index;
+  });
+  const query = queriesById.get(queryIds[best]) || {};
+  return {
+    ...feature,
+    properties: {
+      ...feature.properties,
+      query_id: queryIds[best],
+      query_nome: query.query_nome,
+      query_cor: query.query_cor,
+      tipo_alvo: tiposAlvo[best],
+      score: scores[best],
+    },
+  };
+};
 
 function App() {
   // State for main queries
   const [selectedMainQueries, setSelectedMainQueries] = useState([]);
   const [queryResults, setQueryResults] = useState(new Map());
+  const [mainFeatures, setMainFeatures] = useState([]);
   const [loading, setLoading] = useState(false);
 
   // State for area selection (Phase 3)
@@ -30,6 +66,7 @@ function App() {
   useEffect(() => {
     if (selectedMainQueries.length === 0) {
       setQueryResults(new Map());
+      setMainFeatures([]);
       return;
     }
 
@@ -59,17 +96,16 @@ function App() {
     const newResults = new Map();
 
     try {
-      const promises = selectedMainQueries.map(async (queryId) => {
-        const data = await getMainQueryResults(queryId);
-        return [queryId, data];
-      });
-
-      const results = await Promise.all(promises);
-      results.forEach(([queryId, data]) => {
-        newResults.set(queryId, data);
+      // One request for all selected queries (installations de-duplicated)
+      const data = await getMainQueriesResults(selectedMainQueries);
+      const queries = data.metadata.queries || [];
+      const queriesById = new Map(queries.map((query) => [query.query_id, query]));
+      queries.forEach((query) => {
+        newResults.set(query.query_id, { metadata: query, total: query.total_results });
       });
 
       setQueryResults(newResults);
+      setMainFeatures(data.features.map((feature) => toMarkerFeature(feature, queriesById)));
     } catch (error) {
       console.error('Error loading query results:', error);
     } finally {
@@ -100,7 +136,7 @@ function App() {
           selectedArea.type,
           selectedArea.value
         );
-        return [queryId, data];
+        return [queryId, withQueryMetadata(data, ['query_id', 'query_nome', 'tipo_retorno'])];
       });
 
       const results = await Promise.all(promises);
@@ -138,10 +174,7 @@ function App() {
   };
 
   // Combine all features from all selected queries
-  const allFeatures = [];
-  queryResults.forEach((result) => {
-    allFeatures.push(...result.features);
-  });
+  const allFeatures = mainFeatures;
   console.log('🔵 Main Query Features:', allFeatures.length, allFeatures);
 
   // Combine auxiliary features - separate by type
@@ -219,7 +252,7 @@ function App() {
                           }}
                         />
                         <span style={{ flex: 1 }}>{result.metadata.query_nome}</span>
-                        <span style={{ fontWeight: '600' }}>{result.features.length}</span>
+                        <span style={{ fontWeight: '600' }}>{result.total}</span>
                       </div>
                     ))}
                   </div>
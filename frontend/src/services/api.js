@@ -38,23 +38,115 @@ export const getMainQueries = async () => {
   }
 };
 
-export const getMainQueryResults = async (queryId, bounds = null) => {
-  const params = bounds ? { bounds } : {};
+export const getMainQueryResults = async (queryId, bounds = null, zoom = null, fields = null) => {
+  const params = {};
+  if (bounds) params.bounds = bounds;
+  if (zoom !== null) params.zoom = zoom;  // low zoom returns server-side clusters
+  if (fields) params.fields = fields.join(',');  // e.g. ['id_instalacao', 'score']
   const response = await api.get(`/queries/main/${queryId}/results`, { params });
   console.log('📥 Main Query Results:', queryId, response.data);
   return response.data;
 };
 
+// Ranked inspection queue: next `limit` targets by score (pass the previous
+// page's metadata.next_after as `after`)
+export const getRankedMainQueryResults = async (queryId, limit = 50, after = null) => {
+  const params = { order_by: 'score', limit };
+  if (after) params.after = after;
+  const response = await api.get(`/queries/main/${queryId}/results`, { params });
+  return response.data;
+};
+
+// Several main queries in one request; installations matched by more than
+// one query come once, with aligned query_ids/scores/tipos_alvo arrays
+export const getMainQueriesResults = async (queryIds, bounds = null, fields = null) => {
+  const params = { ids: queryIds.join(',') };
+  if (bounds) params.bounds = bounds;
+  if (fields) params.fields = fields.join(',');
+  const response = await api.get('/queries/main/results', { params });
+  return response.data;
+};
+
+// Columnar main query results (typed arrays, see backend/src/columnar.py)
+const COLUMNAR_MEDIA_TYPE = 'application/vnd.sasi.columnar';
+const TIPO_ALVO_UNKNOWN = 255;
+
+const align4 = (offset) => offset + ((4 - (offset % 4)) % 4);
+
+export const decodeColumnarResults = (buffer) => {
+  const view = new DataView(buffer);
+  const n = view.getUint32(8, true);
+  const metaLength = view.getUint32(12, true);
+  const idsLength = view.getUint32(16, true);
+  const metadata = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 20, metaLength)));
+
+  let offset = align4(20 + metaLength);
+  const lon = new Float32Array(buffer, offset, n);
+  offset += 4 * n;
+  const lat = new Float32Array(buffer, offset, n);
+  offset += 4 * n;
+  const score = new Float32Array(buffer, offset, n);
+  offset += 4 * n;
+  const tipoAlvo = new Uint8Array(buffer, offset, n);
+  offset = align4(offset + n);
+  const idOffsets = new Uint32Array(buffer, offset, n + 1);
+  offset += 4 * (n + 1);
+  const idBytes = new Uint8Array(buffer, offset, idsLength);
+
+  const decoder = new TextDecoder();
+  const idAt = (index) => decoder.decode(idBytes.subarray(idOffsets[index], idOffsets[index + 1]));
+  const tipoAlvoAt = (index) =>
+    tipoAlvo[index] === TIPO_ALVO_UNKNOWN ? null : metadata.tipo_alvo_enum[tipoAlvo[index]];
+
+  return { length: n, lon, lat, score, tipoAlvo, idAt, tipoAlvoAt, metadata };
+};
+
+export const getMainQueryColumns = async (queryId, bounds = null) => {
+  const params = {};
+  if (bounds) params.bounds = bounds;
+  const response = await api.get(`/queries/main/${queryId}/results`, {
+    params,
+    headers: { Accept: COLUMNAR_MEDIA_TYPE },
+    responseType: 'arraybuffer',
+  });
+  return decodeColumnarResults(response.data);
+};
+
+// Server-side heatmap density raster (uint8, base64, north-up rows)
+export const getAuxiliaryQueryGrid = async (queryId, areaType, areaValue, zoom = null) => {
+  const params = {
+    area_type: areaType,
+    area_value: typeof areaValue === 'object' ? JSON.stringify(areaValue) : areaValue,
+    format: 'grid',
+  };
+  if (zoom !== null) params.zoom = zoom;
+  const response = await api.get(`/queries/auxiliary/${queryId}/results`, { params });
+  return response.data;
+};
+
+// Vector tile URL templates ({z}/{x}/{y} filled in by the map layer)
+export const getMainQueryTileUrl = (queryId) =>
+  `${API_BASE_URL}/queries/main/${queryId}/tiles/{z}/{x}/{y}.pbf`;
+
+export const getAuxiliaryQueryTileUrl = (queryId, areaType, areaValue) => {
+  const params = new URLSearchParams({
+    area_type: areaType,
+    area_value: typeof areaValue === 'object' ? JSON.stringify(areaValue) : areaValue,
+  });
+  return `${API_BASE_URL}/queries/auxiliary/${queryId}/tiles/{z}/{x}/{y}.pbf?${params}`;
+};
+
 export const getAuxiliaryQueries = async () => {
   const response = await api.get('/queries/auxiliary');
   return response.data;
 };
 
-export const getAuxiliaryQueryResults = async (queryId, areaType, areaValue) => {
+export const getAuxiliaryQueryResults = async (queryId, areaType, areaValue, fields = null) => {
   const params = {
     area_type: areaType,
     area_value: typeof areaValue === 'object' ? JSON.stringify(areaValue) : areaValue,
   };
+  if (fields) params.fields = fields.join(',');
   const response = await api.get(`/queries/auxiliary/${queryId}/results`, { params });
   return response.data;
 };
@@ -68,6 +160,21 @@ export const getInstallationDetails = async (installationId) => {
   return response.data;
 };
 
+// Details + consumption + frauds + service notes + status in one request
+export const getInstallationFull = async (installationId, consumptionLimit = 12, notesLimit = 20) => {
+  const response = await api.get(`/installations/${installationId}/full`, {
+    params: { consumption_limit: consumptionLimit, notes_limit: notesLimit },
+  });
+  return response.data;
+};
+
+export const getInstallationsFull = async (installationIds, consumptionLimit = 12, notesLimit = 20) => {
+  const response = await api.post('/installations/full', { ids: installationIds }, {
+    params: { consumption_limit: consumptionLimit, notes_limit: notesLimit },
+  });
+  return response.data;
+};
+
 export const getInstallationConsumption = async (installationId, limit = 12) => {
   const response = await api.get(`/installations/${installationId}/consumption`, {
     params: { limit },
@@ -96,6 +203,42 @@ export const updateInstallationStatus = async (installationId, status, usuario,
   return response.data;
 };
 
+const consumptionSeriesParams = ({ freq = 'month', start, end, rolling = 0, yoy = false } = {}) => {
+  const params = { freq, rolling, yoy };
+  if (start) params.start = start;
+  if (end) params.end = end;
+  return params;
+};
+
+export const getInstallationConsumptionSeries = async (installationId, options) => {
+  const response = await api.get(`/installations/${installationId}/consumption/series`, {
+    params: consumptionSeriesParams(options),
+  });
+  return response.data;
+};
+
+export const getInstallationsConsumptionSeries = async (installationIds, options) => {
+  const response = await api.post('/installations/consumption/series', { ids: installationIds }, {
+    params: consumptionSeriesParams(options),
+  });
+  return response.data;
+};
+
+export const updateInstallationsStatus = async (installationIds, status, usuario, observacoes = null) => {
+  const response = await api.put('/installations/status', {
+    ids: installationIds,
+    status,
+    usuario,
+    observacoes,
+  });
+  return response.data;
+};
+
+export const getInstallationsStatus = async (installationIds) => {
+  const response = await api.post('/installations/status/lookup', { ids: installationIds });
+  return response.data;
+};
+
 export const getInstallationStatus = async (installationId) => {
   const response = await api.get(`/installations/${installationId}/status`);
   return response.data;
@@ -110,8 +253,15 @@ export const getMunicipalities = async () => {
   return response.data;
 };
 
-export const getMunicipalityGeometry = async (municipalityName) => {
-  const response = await api.get(`/areas/municipalities/${municipalityName}/geometry`);
+export const getMunicipalityGeometry = async (municipalityName, zoom = null) => {
+  const params = zoom !== null ? { zoom } : {};
+  const response = await api.get(`/areas/municipalities/${municipalityName}/geometry`, { params });
+  return response.data;
+};
+
+export const getMunicipalityOutlines = async (zoom = null) => {
+  const params = zoom !== null ? { zoom } : {};
+  const response = await api.get('/areas/municipalities/geometry', { params });
   return response.data;
 };
 